@@ -0,0 +1,216 @@
+# analysis_cache.py
+#
+# Persistent cache for the /analyze_waveforms LLM calls. Results are stored in
+# SQLite keyed by a hash of (model, normalized input text), so every worker on
+# the host shares them and they survive restarts. Identical requests that
+# arrive while the first one is still waiting on the API share its call.
+# That coalescing is per process: two workers that miss at the same time
+# each make the call (the second result just overwrites the first row).
+#
+# The database is created on first use, not at import. If it can't be read
+# or written (locked, corrupt, read-only directory) analyses are computed
+# uncached rather than failing the request.
+#
+# ANALYSIS_CACHE_PATH = SQLite file (default cache/analysis.sqlite3 next to this
+#                       file), "none" disables storage
+# ANALYSIS_CACHE_SIZE = max stored analyses (default 1000)
+# ANALYSIS_CACHE_TTL  = seconds an analysis stays valid (default 7 days)
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import closing, contextmanager
+
+def normalize_text(text):
+    """
+    Canonical form of the waveform text: trailing whitespace, blank-line runs
+    and leading/trailing blank lines don't change the analysis.
+    """
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def analysis_key(text, model):
+    canonical = f"{model}\n{normalize_text(text)}"
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """
+    SQLite-backed store of analyses with a TTL and a size limit (least
+    recently used rows are dropped first), plus in-flight coalescing within
+    this process.
+    """
+
+    def __init__(self, path, maxsize=1000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._created = False
+
+    @contextmanager
+    def _connect(self):
+        # one short-lived connection per call keeps this safe across threads
+        # and forked workers; `with conn` only commits, closing() closes it
+        if not self._created:
+            self._create()
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    def _create(self):
+        with self._lock:
+            if self._created:
+                return
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS analyses ("
+                        " key TEXT PRIMARY KEY, model TEXT, result TEXT,"
+                        " created REAL, accessed REAL)"
+                    )
+            self._created = True
+
+    def get(self, key):
+        if not self.path:
+            return None
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT result, created FROM analyses WHERE key = ?",
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            result, created = row
+            if created + self.ttl < now:
+                conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE analyses SET accessed = ? WHERE key = ?", (now, key))
+        return result
+
+    def set(self, key, model, result):
+        if not self.path:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?)",
+                         (key, model, result, now, now))
+            conn.execute("DELETE FROM analyses WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM analyses WHERE key NOT IN "
+                "(SELECT key FROM analyses ORDER BY accessed DESC LIMIT ?)",
+                (self.maxsize,)
+            )
+
+    def _lookup(self, key):
+        # get(), but a broken database is a miss rather than an error
+        try:
+            return self.get(key)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Analysis cache: could not read {self.path}: {e}")
+            return None
+
+    def _store(self, key, model, result):
+        try:
+            self.set(key, model, result)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Analysis cache: could not write {self.path}: {e}")
+
+    def get_or_compute(self, text, model, compute):
+        """
+        Return the cached analysis of `text` by `model`, or call compute()
+        once and store its result. Concurrent callers with the same key wait
+        for the first caller's result (or its exception) instead of calling
+        compute() themselves. Only callers in this process are coalesced.
+        """
+        key = analysis_key(text, model)
+        result = self._lookup(key)
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+            return result
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            # a leader that finished between our lookup and registering
+            # has stored its result by now
+            result = self._lookup(key)
+            if result is None:
+                with self._lock:
+                    self.misses += 1
+                result = compute()
+                self._store(key, model, result)
+            else:
+                with self._lock:
+                    self.hits += 1
+            future.set_result(result)
+            return result
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def __len__(self):
+        if not self.path:
+            return 0
+        try:
+            with self._connect() as conn:
+                return conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        except (sqlite3.Error, OSError) as e:
+            print(f"Analysis cache: could not read {self.path}: {e}")
+            return 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "inflight": len(self._inflight),
+                # coalesced requests were answered without their own API call
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+        stats["size"] = len(self)
+        stats["maxsize"] = self.maxsize
+        return stats
+
+    def clear(self):
+        if self.path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM analyses")
+        with self._lock:
+            self.hits = self.misses = self.coalesced = self.errors = 0
+
+_path = os.getenv("ANALYSIS_CACHE_PATH",
+                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "analysis.sqlite3"))
+cache = AnalysisCache(
+    path=None if _path == "none" else _path,
+    maxsize=int(os.getenv("ANALYSIS_CACHE_SIZE", "1000")),
+    ttl=int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600))),
+)
@@ -0,0 +1,469 @@
+# benchmarks.py
+#
+# Benchmarks for the calculation and rendering hot paths.
+#
+#   python benchmarks.py                       # full run, writes bench_results.json
+#   python benchmarks.py --quick               # ranges up to 1 year, fewer repeats
+#   python benchmarks.py --only waveforms      # names containing "waveforms"
+#   python benchmarks.py --out new.json --compare old.json
+#
+# Every benchmark records latency (median / min / p95 over the repeats),
+# throughput (work items per second, e.g. days or charts) and peak Python
+# memory from a separate tracemalloc run. Inputs come from a fixed seed, so
+# two result files from different commits are directly comparable; --compare
+# prints the median ratios and exits non-zero on regressions.
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import groupby
+from types import SimpleNamespace
+
+import ephemeris
+import figures
+import natal_chart
+import transit_intervals
+import transit_waveforms
+from transit_waveforms import aspects
+
+SEED = 20240501
+
+RANGES = {
+    "1w": 7,
+    "1m": 30,
+    "1y": 365,
+    "10y": 3652,
+    "50y": 18262,
+}
+QUICK_RANGES = ("1w", "1m", "1y")
+# the day-by-day reference loop is only timed on short ranges
+REFERENCE_MAX_DAYS = 365
+
+START_DATE = datetime(2000, 1, 1)
+PLANETS = list(natal_chart.PLANET_CODES.keys())
+ASPECTS = list(aspects.keys())
+
+# -----------------------------------------------------------
+#   Synthetic inputs
+# -----------------------------------------------------------
+def synthetic_natal_positions(rng):
+    return {planet: rng.uniform(0, 360) for planet in PLANETS}
+
+def synthetic_birth_records(rng, count):
+    records = []
+    for i in range(count):
+        dob = datetime(1940, 1, 1) + timedelta(days=rng.randrange(0, 365 * 70))
+        records.append({
+            "dob": dob.strftime("%Y-%m-%d"),
+            "tob": f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+            "lat": round(rng.uniform(-60, 70), 4),
+            "lon": round(rng.uniform(-180, 180), 4),
+            "chartName": f"chart-{i}",
+        })
+    return records
+
+def positions_as_text(positions_deg):
+    return {planet: natal_chart.degrees_to_zodiac(deg) for planet, deg in positions_deg.items()}
+
+class StubCompletions:
+    """
+    Stands in for client.chat.completions; answers instantly with a reply
+    proportional to the prompt so the LLM routes can be timed offline.
+    """
+
+    def create(self, model, messages, **kwargs):
+        content = messages[-1]["content"]
+        reply = f"Analysis of {content.count('Day:')} days by {model}."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+class StubRuns:
+    def create(self, thread_id, assistant_id, stream=False, **kwargs):
+        def delta(text):
+            part = SimpleNamespace(type="text", text=SimpleNamespace(value=text))
+            return SimpleNamespace(event="thread.message.delta",
+                                   data=SimpleNamespace(delta=SimpleNamespace(content=[part])))
+        return iter([delta("The Moon "), delta("is waxing."),
+                     SimpleNamespace(event="thread.run.completed", data=None)])
+
+def stub_client():
+    threads = SimpleNamespace(
+        create=lambda **kwargs: SimpleNamespace(id="thread-bench"),
+        messages=SimpleNamespace(create=lambda **kwargs: None),
+        runs=StubRuns(),
+    )
+    return SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()),
+                           beta=SimpleNamespace(threads=threads))
+
+# -----------------------------------------------------------
+#   Measurement
+# -----------------------------------------------------------
+def measure(fn, repeat, items=1, setup=None):
+    """
+    One untimed warm-up call, then `repeat` timed calls of fn() (each
+    preceded by setup(), untimed), then one more call under tracemalloc for
+    the peak allocation.
+    """
+    if setup:
+        setup()
+    fn()
+
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        "repeat": repeat,
+        "items": items,
+        "median_s": median,
+        "min_s": timings[0],
+        "p95_s": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        "throughput_per_s": items / median if median > 0 else None,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def cold_ephemeris():
+    ephemeris.cache.clear()
+
+# -----------------------------------------------------------
+#   Suites
+# -----------------------------------------------------------
+def bench_natal(rng, repeat, quick):
+    results = {}
+    records = synthetic_birth_records(rng, 20 if quick else 100)
+    one = records[0]
+
+    results["natal_chart.single"] = measure(
+        lambda: natal_chart.calculate_natal_chart(one["dob"], one["tob"], one["lat"], one["lon"]),
+        repeat, setup=cold_ephemeris
+    )
+    results[f"natal_chart.batch_{len(records)}"] = measure(
+        lambda: natal_chart.calculate_natal_charts(records),
+        repeat, items=len(records), setup=cold_ephemeris
+    )
+
+    import main
+    texts = [natal_chart.degrees_to_zodiac(rng.uniform(0, 360)) for _ in range(1000)]
+    results["convert_to_degrees.1000"] = measure(
+        lambda: [main.convert_to_degrees(text) for text in texts],
+        repeat, items=len(texts)
+    )
+    return results
+
+def bench_waveforms(rng, repeat, ranges):
+    results = {}
+    natal_positions = synthetic_natal_positions(rng)
+
+    for name in ranges:
+        days = RANGES[name]
+        end_date = START_DATE + timedelta(days=days - 1)
+        dates = transit_waveforms.transit_dates(START_DATE, end_date)
+        # long ranges get fewer repeats so the full run stays in minutes
+        n = max(1, repeat if days <= 3652 else repeat // 3)
+
+        results[f"waveforms.{name}.ephemeris"] = measure(
+            lambda: transit_waveforms.transit_longitudes(dates, PLANETS),
+            n, items=days, setup=cold_ephemeris
+        )
+        longitudes = transit_waveforms.transit_longitudes(dates, PLANETS)
+        results[f"waveforms.{name}.aspect_scan"] = measure(
+            lambda: transit_waveforms.score_transits(longitudes, natal_positions, ASPECTS),
+            n, items=days
+        )
+        results[f"waveforms.{name}.vectorized"] = measure(
+            lambda: transit_waveforms.calculate_transit_waveforms_vectorized(
+                natal_positions, START_DATE, end_date, PLANETS, ASPECTS),
+            n, items=days
+        )
+        results[f"waveforms.{name}.adaptive"] = measure(
+            lambda: transit_waveforms.calculate_transit_waveforms_vectorized(
+                natal_positions, START_DATE, end_date, PLANETS, ASPECTS, "adaptive"),
+            n, items=days
+        )
+        if days <= REFERENCE_MAX_DAYS:
+            results[f"waveforms.{name}.reference_loop"] = measure(
+                lambda: transit_waveforms.calculate_transit_waveforms(
+                    natal_positions, START_DATE, end_date, PLANETS, ASPECTS),
+                n, items=days
+            )
+
+        transits = transit_waveforms.calculate_transit_waveforms_vectorized(
+            natal_positions, START_DATE, end_date, PLANETS, ASPECTS)
+        results[f"waveforms.{name}.figure_build"] = measure(
+            lambda: figures.waveform_figure(transits, START_DATE, end_date),
+            n, items=len(transits)
+        )
+        figure = figures.waveform_figure(transits, START_DATE, end_date)
+        results[f"waveforms.{name}.json"] = measure(
+            lambda: json.dumps(figure), n, items=len(transits)
+        )
+        results[f"waveforms.{name}.columns"] = measure(
+            lambda: json.dumps(transit_waveforms.build_waveform_columns(
+                transits, START_DATE, end_date)),
+            n, items=len(transits)
+        )
+        results[f"waveforms.{name}.intervals"] = measure(
+            lambda: transit_intervals.calculate_transit_intervals(
+                natal_positions, START_DATE, end_date, PLANETS, ASPECTS),
+            n, items=days
+        )
+        intervals = transit_intervals.calculate_transit_intervals(
+            natal_positions, START_DATE, end_date, PLANETS, ASPECTS)
+        results[f"waveforms.{name}.interval_figure"] = measure(
+            lambda: json.dumps(figures.interval_figure(intervals, START_DATE, end_date)),
+            n, items=len(intervals)
+        )
+    return results
+
+def bench_bulk(rng, repeat, quick):
+    """
+    One window against many charts: the shared-ephemeris bulk scan versus
+    one vectorized call per chart.
+    """
+    results = {}
+    count = 50 if quick else 500
+    charts = [synthetic_natal_positions(rng) for _ in range(count)]
+    end_date = START_DATE + timedelta(days=RANGES["1y"] - 1)
+
+    results[f"bulk.{count}_charts.1y.bulk"] = measure(
+        lambda: list(transit_waveforms.iter_transit_waveforms_bulk(
+            charts, START_DATE, end_date, PLANETS, ASPECTS)),
+        repeat, items=count, setup=cold_ephemeris
+    )
+    results[f"bulk.{count}_charts.1y.per_chart"] = measure(
+        lambda: [transit_waveforms.calculate_transit_waveforms_vectorized(
+            chart, START_DATE, end_date, PLANETS, ASPECTS) for chart in charts],
+        repeat, items=count, setup=cold_ephemeris
+    )
+    return results
+
+def bench_wheels(rng, repeat):
+    results = {}
+    natal = synthetic_natal_positions(rng)
+    transit = synthetic_natal_positions(rng)
+
+    for grouped in (False, True):
+        suffix = "grouped" if grouped else "per_line"
+        results[f"wheels.aspect.{suffix}"] = measure(
+            lambda: figures.aspect_wheel_json(natal, ASPECTS, grouped), repeat
+        )
+        results[f"wheels.synastry.{suffix}"] = measure(
+            lambda: figures.synastry_wheel_json(natal, transit, ASPECTS, grouped), repeat
+        )
+    results["wheels.aspect.html_page"] = measure(
+        lambda: figures.figure_html(figures.aspect_wheel_json(natal, ASPECTS)), repeat
+    )
+    return results
+
+def bench_routes(rng, repeat, ranges):
+    """
+    End-to-end Flask test-client runs. The response cache is switched off so
+    every request does the full work; LLM routes use the stub client.
+    """
+    import analysis_cache
+    import main
+    import response_cache
+
+    response_cache.backend = None
+    analysis_cache.cache = analysis_cache.AnalysisCache(None)
+    app = main.create_app({"TESTING": True, "OPENAI_CLIENT": stub_client()})
+    client = app.test_client()
+
+    record = synthetic_birth_records(rng, 1)[0]
+    records = synthetic_birth_records(rng, 50)
+    natal_positions = synthetic_natal_positions(rng)
+    natal_text = positions_as_text(natal_positions)
+    natal_numeric = natal_chart.NatalChart([natal_positions[p] for p in PLANETS]).to_json()
+
+    def post(path, body):
+        def call():
+            response = client.post(path, json=body)
+            # consume streamed bodies so the whole generator runs
+            data = response.get_data()
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} -> {response.status_code}: {data[:200]!r}")
+        return call
+
+    results = {}
+    results["route.calculate_natal_chart"] = measure(
+        post("/calculate_natal_chart", record), repeat, setup=cold_ephemeris)
+    results["route.calculate_natal_charts_50"] = measure(
+        post("/calculate_natal_charts", {"records": records}), repeat, items=50,
+        setup=cold_ephemeris)
+    results["route.generate_plot"] = measure(
+        post("/generate_plot", {"positions": natal_text, "aspects": ASPECTS}), repeat)
+    results["route.snapshot_aspect_chart_data"] = measure(
+        post("/snapshot_aspect_chart_data", {"date": "2025-02-23"}), repeat)
+    results["route.synastry_aspect_chart_data"] = measure(
+        post("/synastry_aspect_chart_data", {"date": "2025-02-23",
+                                             "natal_chart_text": natal_text,
+                                             "selected_aspects": ASPECTS}), repeat)
+    results["route.synastry_aspect_chart_data.numeric"] = measure(
+        post("/synastry_aspect_chart_data", {"date": "2025-02-23",
+                                             "natal_chart": natal_numeric,
+                                             "selected_aspects": ASPECTS}), repeat)
+
+    for name in ranges:
+        days = RANGES[name]
+        body = {
+            "natal_chart": natal_text,
+            "start_date": START_DATE.strftime("%Y-%m-%d"),
+            "end_date": (START_DATE + timedelta(days=days - 1)).strftime("%Y-%m-%d"),
+            "transiting_planets": PLANETS,
+            "aspects": ASPECTS,
+        }
+        n = max(1, repeat if days <= 3652 else repeat // 3)
+        results[f"route.generate_waveforms_data.{name}"] = measure(
+            post("/generate_waveforms_data", body), n, items=days)
+        results[f"route.generate_waveforms_data.columnar.{name}"] = measure(
+            post("/generate_waveforms_data", dict(body, format="columnar")), n, items=days)
+        results[f"route.generate_waveforms_data.intervals.{name}"] = measure(
+            post("/generate_waveforms_data", dict(body, format="intervals")), n, items=days)
+        results[f"route.generate_waveforms_stream.{name}"] = measure(
+            post("/generate_waveforms_stream", body), n, items=days)
+        results[f"route.transit_events.{name}"] = measure(
+            post("/transit_events", body), n, items=days)
+
+    text = waveform_text(natal_text, min(RANGES[ranges[-1]], 365))
+    results["route.analyze_waveforms"] = measure(
+        post("/analyze_waveforms", {"waveforms_text": text}), repeat)
+    results["route.analyze_waveforms_stream"] = measure(
+        post("/analyze_waveforms_stream", {"waveforms_text": text}), repeat)
+    results["route.chat_stream"] = measure(
+        post("/chat/stream", {"message": "How is the Moon today?"}), repeat)
+    return results
+
+def waveform_text(natal_text, days):
+    """
+    The text the waveform page sends to /analyze_waveforms, for `days` days.
+    """
+    import main
+    natal_positions = {planet: main.convert_to_degrees(text) for planet, text in natal_text.items()}
+    end_date = START_DATE + timedelta(days=days - 1)
+    transits = transit_waveforms.calculate_transit_waveforms_vectorized(
+        natal_positions, START_DATE, end_date, PLANETS, ASPECTS)
+
+    lines = []
+    for day, day_transits in groupby(transits, key=lambda t: t["date"]):
+        lines.append(f"• Day: {day.strftime('%Y-%m-%d')}")
+        for t in day_transits:
+            lines.append(f"· {t['transiting_planet']}-{t['aspect']}-{t['natal_planet']}-{t['intensity']:.3f}")
+        lines.append("")
+    return "\n".join(lines)
+
+# -----------------------------------------------------------
+#   Results
+# -----------------------------------------------------------
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold):
+    """
+    Print median ratios (new / old) for benchmarks present in both files.
+    Returns the names slower than `threshold`.
+    """
+    regressions = []
+    old_results = old["results"]
+    print(f"{'benchmark':<55} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for name, result in new["results"].items():
+        if name not in old_results:
+            continue
+        before = old_results[name]["median_s"]
+        after = result["median_s"]
+        ratio = after / before if before > 0 else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  << slower"
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{name:<55} {before * 1000:>10.3f} {after * 1000:>10.3f} {ratio:>7.2f}{flag}")
+    return regressions
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the calculation and rendering hot paths.")
+    parser.add_argument("--quick", action="store_true", help="ranges up to 1 year, fewer repeats")
+    parser.add_argument("--repeat", type=int, default=None, help="timed runs per benchmark")
+    parser.add_argument("--only", default=None, help="run benchmarks whose suite name contains this")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="median ratio above which --compare reports a regression")
+    args = parser.parse_args(argv)
+
+    repeat = args.repeat or (3 if args.quick else 7)
+    ranges = [name for name in RANGES if not args.quick or name in QUICK_RANGES]
+
+    suites = {
+        "natal": lambda: bench_natal(random.Random(SEED), repeat, args.quick),
+        "waveforms": lambda: bench_waveforms(random.Random(SEED + 1), repeat, ranges),
+        "bulk": lambda: bench_bulk(random.Random(SEED + 4), repeat, args.quick),
+        "wheels": lambda: bench_wheels(random.Random(SEED + 2), repeat),
+        "routes": lambda: bench_routes(random.Random(SEED + 3), repeat, ranges),
+    }
+
+    results = {}
+    for name, suite in suites.items():
+        if args.only and args.only not in name:
+            continue
+        print(f"[{name}]", file=sys.stderr)
+        for bench, result in suite().items():
+            results[bench] = result
+            print(f"  {bench:<55} {result['median_s'] * 1000:>10.3f} ms"
+                  f"  {result['peak_kib']:>10.1f} KiB", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": SEED,
+            "repeat": repeat,
+            "ranges": ranges,
+            "ephemeris_table": ephemeris.get_table() is not None,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        regressions = compare(old, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.2f}x", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,101 @@
+# chat_stream.py
+#
+# Streaming assistant replies for /chat/stream. Instead of polling
+# runs.retrieve once a second, the run is created with stream=True and text
+# deltas are forwarded to the browser as server-sent events as they arrive.
+#
+# Under Gunicorn's gevent worker the upstream socket reads yield to other
+# greenlets, so one worker can hold many chats open at once; the semaphore
+# bounds how many may talk to the API concurrently.
+
+import json
+import os
+import threading
+import time
+import metrics
+
+MAX_CONCURRENT_CHATS = int(os.getenv("CHAT_MAX_CONCURRENCY", "32"))
+# how long a new chat waits for a free slot before being turned away
+SLOT_TIMEOUT = float(os.getenv("CHAT_SLOT_TIMEOUT", "5"))
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT_CHATS)
+
+class ChatBusy(Exception):
+    pass
+
+def sse(message):
+    return f"data: {json.dumps(message)}\n\n"
+
+class ChatSlot:
+    """
+    One held slot. release() may be called from several places (the end of
+    the stream, the response being closed); only the first call counts.
+    """
+
+    def __init__(self):
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        _slots.release()
+
+def acquire_slot(timeout=SLOT_TIMEOUT):
+    if not _slots.acquire(timeout=timeout):
+        raise ChatBusy("Too many concurrent chats, please retry shortly.")
+    return ChatSlot()
+
+def stream_reply(client, assistant_id, message, thread_id=None):
+    """
+    Yield SSE frames for one assistant turn:
+      {"thread_id": ...} first, then {"delta": "..."} per text chunk,
+      and finally {"done": true, "reply": full_text} or {"error": ...}.
+
+    `client` is anything shaped like openai.OpenAI (tests pass a stub or a
+    client pointed at a local fake server via base_url).
+    """
+    try:
+        if not thread_id:
+            thread_id = client.beta.threads.create().id
+        yield sse({"thread_id": thread_id})
+
+        client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=message
+        )
+
+        # timed from run creation to the last event (the whole streamed reply)
+        started = time.perf_counter()
+        events = client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            stream=True
+        )
+
+        reply = []
+        for event in events:
+            if event.event == "thread.message.delta":
+                for part in event.data.delta.content or []:
+                    if part.type == "text" and part.text and part.text.value:
+                        reply.append(part.text.value)
+                        yield sse({"delta": part.text.value})
+            elif event.event in ("thread.run.failed", "thread.run.cancelled",
+                                 "thread.run.expired"):
+                metrics.llm_calls_total.inc(kind="assistant_stream", outcome="error")
+                yield sse({"error": f"Run failed with status: {event.data.status}"})
+                return
+            elif event.event == "error":
+                metrics.llm_calls_total.inc(kind="assistant_stream", outcome="error")
+                yield sse({"error": str(event.data)})
+                return
+
+        metrics.stage_duration.observe(time.perf_counter() - started, stage="llm")
+        metrics.llm_calls_total.inc(kind="assistant_stream", outcome="ok")
+        yield sse({"done": True, "reply": "".join(reply)})
+    except Exception as e:
+        metrics.llm_calls_total.inc(kind="assistant_stream", outcome="error")
+        yield sse({"error": str(e)})
@@ -0,0 +1,118 @@
+# chunked_analysis.py
+#
+# Map-reduce analysis for long transit ranges. The waveform text is split
+# into month (or N-day) chunks, the chunks are analyzed concurrently on a
+# bounded thread pool, and a final pass summarizes the partial analyses.
+# Results are yielded as each chunk finishes so the route can stream them.
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import openaiApi
+
+# upper bound on concurrent upstream calls across all requests in a worker
+MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "4"))
+
+DAY_LINE = re.compile(r"^\W*Day:\s*(\d{4}-\d{2}-\d{2})")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                               thread_name_prefix="analysis")
+    return _executor
+
+def split_waveform_text(text, period="month"):
+    """
+    Split waveform text into chunks of whole days.
+
+    Days start at a "Day: YYYY-MM-DD" line (with or without a bullet); any
+    text before the first day is a header repeated at the top of every chunk.
+    `period` is "month" or a number of days per chunk.
+
+    Returns a list of (label, chunk_text), in date order.
+    """
+    header = []
+    days = []
+    for line in text.splitlines():
+        match = DAY_LINE.match(line)
+        if match:
+            days.append((datetime.strptime(match.group(1), "%Y-%m-%d"), [line]))
+        elif days:
+            days[-1][1].append(line)
+        else:
+            header.append(line)
+
+    if not days:
+        return [("all", text)] if text.strip() else []
+
+    if period == "month":
+        group_of = lambda day: day.strftime("%Y-%m")
+    else:
+        chunk_days = max(int(period), 1)
+        first = days[0][0]
+        group_of = lambda day: (day - first).days // chunk_days
+
+    groups = []
+    for day, lines in days:
+        key = group_of(day)
+        if not groups or groups[-1][0] != key:
+            groups.append((key, []))
+        groups[-1][1].append((day, lines))
+
+    header_text = "\n".join(header).strip()
+    chunks = []
+    for _, group in groups:
+        start, end = group[0][0], group[-1][0]
+        label = start.strftime("%Y-%m-%d")
+        if end != start:
+            label += " to " + end.strftime("%Y-%m-%d")
+        body = "\n".join("\n".join(lines) for _, lines in group).strip()
+        chunks.append((label, f"{header_text}\n\n{body}" if header_text else body))
+    return chunks
+
+def analyze_in_chunks(text, period="month", client=None, model=None):
+    """
+    Yield messages as the analysis progresses:
+      {"chunks": [labels]} first,
+      {"chunk": i, "label": ..., "analysis": ...} (or "error") per chunk,
+        in completion order,
+      {"summary": ...} from the final pass over the successful chunks, in
+        date order (a single chunk is its own summary).
+    """
+    chunks = split_waveform_text(text, period)
+    yield {"chunks": [label for label, _ in chunks]}
+    if not chunks:
+        raise ValueError("No transit data to analyze")
+
+    executor = get_executor()
+    futures = {
+        executor.submit(openaiApi.analyze_data_with_chat_completion,
+                        chunk_text, client=client, model=model): (i, label)
+        for i, (label, chunk_text) in enumerate(chunks)
+    }
+
+    analyses = {}
+    for future in as_completed(futures):
+        i, label = futures[future]
+        try:
+            analyses[i] = future.result()
+            yield {"chunk": i, "label": label, "analysis": analyses[i]}
+        except Exception as e:
+            yield {"chunk": i, "label": label, "error": str(e)}
+
+    if not analyses:
+        raise ValueError("Every chunk failed to analyze")
+    if len(chunks) == 1:
+        yield {"summary": analyses[0]}
+        return
+
+    partials = [(chunks[i][0], analyses[i]) for i in sorted(analyses)]
+    yield {"summary": openaiApi.summarize_analyses(partials, client=client, model=model)}
@@ -0,0 +1,280 @@
+# ephemeris.py
+
+import atexit
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import swisseph as swe
+import ephemeris_table
+import metrics
+
+# pyswisseph's own default for calc_ut
+DEFAULT_FLAGS = swe.FLG_SWIEPH | swe.FLG_SPEED
+
+class EphemerisCache:
+    """
+    Process-wide LRU of swe.calc_ut results keyed by (julian day, body, flags),
+    plus the observer location for topocentric flags.
+
+    Positions don't depend on who asks, so "today at noon" only has to be
+    computed once per process. Optionally persisted to a JSON file so a
+    restarted worker starts warm.
+    """
+
+    def __init__(self, maxsize=50000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self.load(path)
+
+    def calc_ut(self, jd, body, flags=DEFAULT_FLAGS, topo=None, store=True):
+        """
+        Drop-in for swe.calc_ut: returns (position tuple, return flags).
+
+        `topo` only goes into the key; callers asking for FLG_TOPOCTR must
+        already have applied it (see CalculationContext). store=False still
+        answers from the cache but doesn't add misses to it.
+        """
+        key = (jd, body, flags, topo)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = swe.calc_ut(jd, body, flags)
+        if not store:
+            return result
+        with self._lock:
+            self._entries[key] = result
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def load(self, path=None):
+        """
+        Merge entries from a file written by save(). A missing or unreadable
+        file just leaves the cache cold.
+        """
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        with self._lock:
+            for row in rows[-self.maxsize:]:
+                jd, body, flags, pos, retflags = row[:5]
+                topo = tuple(row[5]) if len(row) > 5 and row[5] else None
+                self._entries[(jd, body, flags, topo)] = (tuple(pos), retflags)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return len(rows)
+
+    def save(self, path=None):
+        """
+        Write the current entries (oldest first) so load() keeps LRU order.
+        """
+        path = path or self.path
+        if not path:
+            return 0
+        with self._lock:
+            rows = [[jd, body, flags, list(pos), retflags, list(topo) if topo else None]
+                    for (jd, body, flags, topo), (pos, retflags) in self._entries.items()]
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, path)
+        return len(rows)
+
+cache = EphemerisCache(
+    maxsize=int(os.getenv("EPHEMERIS_CACHE_SIZE", "50000")),
+    path=os.getenv("EPHEMERIS_CACHE_PATH"),
+)
+# Bulk lookups (positions/longitudes) of more instants than this read the
+# cache but don't fill it: one multi-year range would otherwise evict every
+# hot date (a 15-year, ten-planet waveform is ~55k positions)
+BULK_CACHE_LIMIT = int(os.getenv("EPHEMERIS_BULK_CACHE_LIMIT", str(cache.maxsize // 10)))
+if cache.path:
+    atexit.register(cache.save)
+
+def calc_ut(jd, body, flags=DEFAULT_FLAGS):
+    """
+    Cached swe.calc_ut shared by every route in this process.
+    """
+    return cache.calc_ut(jd, body, flags)
+
+# swe.set_topo is global state shared by every thread in the process
+_topo_lock = threading.Lock()
+_applied_topo = None
+
+class CalculationContext:
+    """
+    Observer location and flags for one calculation.
+
+    Geocentric contexts never touch swe's global observer, so they run
+    without locking. Topocentric contexts hold a process lock while they
+    compute, and only call swe.set_topo when the observer actually changes.
+    """
+
+    def __init__(self, lat=None, lon=None, alt=0.0, topocentric=False, flags=DEFAULT_FLAGS):
+        self.lat = lat
+        self.lon = lon
+        self.alt = alt
+        self.topocentric = topocentric and lat is not None and lon is not None
+        self.flags = flags | swe.FLG_TOPOCTR if self.topocentric else flags
+
+    @property
+    def topo(self):
+        return (self.lon, self.lat, self.alt) if self.topocentric else None
+
+    def calc_ut(self, jd, body, cached=True):
+        """
+        cached=False computes without going through the LRU, for one-off
+        instants (birth times) that would only evict shared dates.
+        """
+        if not self.topocentric:
+            if not cached:
+                return swe.calc_ut(jd, body, self.flags)
+            return calc_ut(jd, body, self.flags)
+
+        global _applied_topo
+        topo = self.topo
+        with _topo_lock:
+            if _applied_topo != topo:
+                swe.set_topo(*topo)
+                _applied_topo = topo
+            if not cached:
+                return swe.calc_ut(jd, body, self.flags)
+            return cache.calc_ut(jd, body, self.flags, topo)
+
+    def longitude(self, jd, body):
+        if not self.topocentric:
+            return longitude(jd, body, self.flags)
+        pos, _ = self.calc_ut(jd, body)
+        return pos[0]
+
+GEOCENTRIC = CalculationContext()
+
+def _reset_after_fork():
+    # A forked child shares swe's open ephemeris files (and their read
+    # offsets) with its parent; close them so it opens its own. Cached
+    # positions and the table mapping are read-only and stay shared.
+    global _topo_lock, _applied_topo
+    swe.close()
+    _topo_lock = threading.Lock()
+    _applied_topo = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+_table = None
+_table_checked = False
+_table_lock = threading.Lock()
+
+def get_table():
+    """
+    The memory-mapped daily table, or None if it hasn't been built.
+    Path comes from EPHEMERIS_TABLE_PATH (default data/ephemeris_daily.bin).
+    """
+    global _table, _table_checked
+    if not _table_checked:
+        with _table_lock:
+            if not _table_checked:
+                path = os.getenv("EPHEMERIS_TABLE_PATH", ephemeris_table.DEFAULT_TABLE_PATH)
+                if os.path.exists(path):
+                    _table = ephemeris_table.EphemerisTable(path)
+                _table_checked = True
+    return _table
+
+def longitude(jd, body, flags=DEFAULT_FLAGS):
+    """
+    Ecliptic longitude from the daily table when it covers jd,
+    otherwise from the cached swe.calc_ut.
+    """
+    table = get_table()
+    if table is not None and flags == DEFAULT_FLAGS:
+        found = table.position(jd, body)
+        if found is not None:
+            return found[0]
+    pos, _ = calc_ut(jd, body, flags)
+    return pos[0]
+
+def position(jd, body):
+    """
+    (longitude, speed in degrees/day) for root finders that probe arbitrary
+    times. Misses skip the LRU so one-off instants don't evict hot dates.
+    """
+    table = get_table()
+    if table is not None:
+        found = table.position(jd, body)
+        if found is not None:
+            return found
+    pos, _ = swe.calc_ut(jd, body, DEFAULT_FLAGS)
+    return pos[0], pos[3]
+
+def positions(jds, bodies, cached=True):
+    """
+    (longitudes, speeds in degrees/day), each (len(jds) x len(bodies)),
+    read straight from the table when possible and computed one by one
+    otherwise. cached=False keeps the computed instants out of the LRU
+    (sub-daily samples that would only evict the daily ones); calls of more
+    than BULK_CACHE_LIMIT instants only read from it.
+
+    Timed as the "ephemeris" stage (metrics.stage).
+    """
+    with metrics.stage("ephemeris"):
+        table = get_table()
+        if table is not None:
+            found = table.positions(jds, bodies)
+            if found is not None:
+                return found
+
+        if not cached:
+            calc = lambda jd, body: swe.calc_ut(jd, body, DEFAULT_FLAGS)
+        else:
+            store = len(jds) * len(bodies) <= BULK_CACHE_LIMIT
+            calc = lambda jd, body: cache.calc_ut(jd, body, DEFAULT_FLAGS, store=store)
+        lons = np.empty((len(jds), len(bodies)), dtype=np.float64)
+        speeds = np.empty((len(jds), len(bodies)), dtype=np.float64)
+        for i, jd in enumerate(jds):
+            for j, body in enumerate(bodies):
+                pos, _ = calc(jd, body)
+                lons[i, j] = pos[0]
+                speeds[i, j] = pos[3]
+        return lons, speeds
+
+def longitudes(jds, bodies, cached=True):
+    """
+    (len(jds) x len(bodies)) array of geocentric longitudes (see positions).
+    """
+    return positions(jds, bodies, cached)[0]
@@ -0,0 +1,153 @@
+# ephemeris_table.py
+#
+# Precomputed daily ephemeris, memory-mapped so every Gunicorn worker reads
+# the same page-cached file.
+#
+# Build once (about 12 MB for 1900-2100):
+#     python ephemeris_table.py --start 1900 --end 2100 --out data/ephemeris_daily.bin
+
+import argparse
+import os
+import struct
+import numpy as np
+import swisseph as swe
+
+MAGIC = b"AZEPHEM1"
+# magic, first julian day (noon UT), number of days, number of bodies
+HEADER = struct.Struct("<8sdII")
+
+# Same bodies (and order) as transit_waveforms.planets
+TABLE_BODIES = [swe.JUPITER, swe.MARS, swe.MERCURY, swe.MOON, swe.NEPTUNE,
+                swe.PLUTO, swe.SATURN, swe.SUN, swe.URANUS, swe.VENUS]
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "data", "ephemeris_daily.bin")
+
+def _data_offset(n_bodies):
+    # header + int32 body codes, padded so the float64 block is 8-byte aligned
+    size = HEADER.size + 4 * n_bodies
+    return (size + 7) // 8 * 8
+
+def build_table(path, start_year=1900, end_year=2100, bodies=TABLE_BODIES):
+    """
+    Write longitudes and daily speeds at noon UT for every day from
+    Jan 1 of start_year to Dec 31 of end_year.
+    """
+    jd0 = swe.julday(start_year, 1, 1, 12.0)
+    n_days = int(swe.julday(end_year + 1, 1, 1, 12.0) - jd0)
+    flags = swe.FLG_SWIEPH | swe.FLG_SPEED
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    offset = _data_offset(len(bodies))
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, jd0, n_days, len(bodies)))
+        f.write(struct.pack(f"<{len(bodies)}i", *bodies))
+        f.write(b"\0" * (offset - f.tell()))
+
+    data = np.memmap(path, dtype=np.float64, mode="r+", offset=offset,
+                     shape=(n_days, len(bodies), 2))
+    for i in range(n_days):
+        jd = jd0 + i
+        for j, body in enumerate(bodies):
+            pos, _ = swe.calc_ut(jd, body, flags)
+            data[i, j, 0] = pos[0]
+            data[i, j, 1] = pos[3]
+    data.flush()
+    del data
+    return n_days
+
+def hermite(p0, v0, p1, v1, s):
+    """
+    Cubic Hermite interpolation between two samples one step apart:
+    longitudes p0, p1 and speeds v0, v1 (degrees per step) at fraction s
+    of the step. Returns (longitude, speed per step); the longitude is not
+    wrapped back into [0, 360).
+    """
+    # unwrap across 0/360 so the curve runs the short way round
+    p1 = p0 + np.mod(p1 - p0 + 180, 360) - 180
+
+    s2 = s * s
+    s3 = s2 * s
+    lon = ((2*s3 - 3*s2 + 1) * p0 + (s3 - 2*s2 + s) * v0
+           + (-2*s3 + 3*s2) * p1 + (s3 - s2) * v1)
+    speed = ((6*s2 - 6*s) * p0 + (3*s2 - 4*s + 1) * v0
+             + (-6*s2 + 6*s) * p1 + (3*s2 - 2*s) * v1)
+    return lon, speed
+
+class EphemerisTable:
+    """
+    Read-only view over a file written by build_table().
+
+    Lookups between samples use cubic Hermite interpolation on longitude and
+    speed, which keeps even the Moon within a few arcseconds. Anything
+    outside the table returns None so callers can fall back to swe.calc_ut.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, jd0, n_days, n_bodies = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"Not an ephemeris table: '{path}'")
+            codes = struct.unpack(f"<{n_bodies}i", f.read(4 * n_bodies))
+
+        self.path = path
+        self.jd0 = jd0
+        self.n_days = n_days
+        self.columns = {code: i for i, code in enumerate(codes)}
+        self.data = np.memmap(path, dtype=np.float64, mode="r",
+                              offset=_data_offset(n_bodies),
+                              shape=(n_days, n_bodies, 2))
+
+    def covers(self, jd):
+        return self.jd0 <= jd < self.jd0 + self.n_days - 1
+
+    def position(self, jd, body):
+        """
+        (longitude, speed) for one body, or None if not in the table.
+        """
+        if body not in self.columns or not self.covers(jd):
+            return None
+        lon, speed = self.positions(np.array([jd]), [body])
+        return float(lon[0, 0]), float(speed[0, 0])
+
+    def positions(self, jds, bodies):
+        """
+        (longitudes, speeds) shaped (len(jds) x len(bodies)), or None if any
+        body or julian day falls outside the table.
+        """
+        jds = np.asarray(jds, dtype=np.float64)
+        if any(body not in self.columns for body in bodies):
+            return None
+        offset = jds - self.jd0
+        if offset.size and (offset.min() < 0 or offset.max() >= self.n_days - 1):
+            return None
+
+        idx = np.floor(offset).astype(np.intp)
+        s = (offset - idx)[:, None]
+        cols = [self.columns[body] for body in bodies]
+
+        p0 = self.data[idx][:, cols, 0]
+        v0 = self.data[idx][:, cols, 1]
+        p1 = self.data[idx + 1][:, cols, 0]
+        v1 = self.data[idx + 1][:, cols, 1]
+
+        lon, speed = hermite(p0, v0, p1, v1, s)
+
+        # exact samples come back untouched
+        exact = (s == 0)
+        lon = np.where(exact, p0, np.mod(lon, 360))
+        speed = np.where(exact, v0, speed)
+        return lon, speed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the daily ephemeris table.")
+    parser.add_argument("--start", type=int, default=1900, help="first year")
+    parser.add_argument("--end", type=int, default=2100, help="last year")
+    parser.add_argument("--out", default=DEFAULT_TABLE_PATH, help="output file")
+    args = parser.parse_args()
+
+    days = build_table(args.out, args.start, args.end)
+    print(f"Wrote {days} days x {len(TABLE_BODIES)} bodies to {args.out}")
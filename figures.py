@@ -0,0 +1,449 @@
+# figures.py
+#
+# Plain-dict Plotly figures. Builds the same {"data": [...], "layout": {...}}
+# that go.Figure(...).to_plotly_json() produced, without graph_objects'
+# per-property validation on every add_trace.
+
+import os
+import json
+from datetime import timedelta
+from functools import lru_cache
+import metrics
+import natal_chart
+from transit_waveforms import aspects, orb
+
+zodiac_signs = [
+    "Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
+    "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"
+]
+
+planet_symbols = {
+    "Jupiter": "♃",
+    "Mars": "♂",
+    "Mercury": "☿",
+    "Moon": "☾",
+    "Neptune": "♆",
+    "Pluto": "♇",
+    "Saturn": "♄",
+    "Sun": "☉",
+    "Uranus": "♅",
+    "Venus": "♀"
+}
+
+aspect_colors = {
+    "Conjunction": "white",
+    "Opposition": "red",
+    "Trine": "green",
+    "Square": "blue",
+    "Sextile": "purple"
+}
+
+@lru_cache(maxsize=None)
+def template(name):
+    """
+    Plotly.js can't resolve template names, so layouts carry the full
+    template object. Expanded once per name and shared (treat as read-only).
+    """
+    import plotly.graph_objects as go
+    return go.Layout(template=name).to_plotly_json()["template"]
+
+# -----------------------------------------------------------
+#   Transit waveforms
+# -----------------------------------------------------------
+def waveform_layout(template_name="plotly_dark"):
+    return {
+        "title": {"text": "Interactive Transit Waveforms"},
+        "xaxis": {"title": {"text": "Date"}},
+        "yaxis": {"title": {"text": "Intensity"}},
+        "hovermode": "x",
+        "template": template(template_name),
+    }
+
+def waveform_figure(transits, start_date, end_date, template_name="plotly_dark"):
+    """
+    Plotly figure dict (data + layout) with one line per transit label,
+    for the frontend's Plotly.newPlot(...).
+    """
+    with metrics.stage("figure_build"):
+        day_count = (end_date - start_date).days + 1
+        x = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(day_count)]
+
+        # Map "label" -> intensities
+        intensity_map = {}
+        for t in transits:
+            label = f"{t['transiting_planet']} {t['aspect']} {t['natal_planet']}"
+            if label not in intensity_map:
+                intensity_map[label] = [0]*day_count
+            intensity_map[label][(t['date'] - start_date).days] = t['intensity']
+
+        data = [
+            {"type": "scatter", "mode": "lines", "name": label, "x": x, "y": intensities}
+            for label, intensities in intensity_map.items()
+        ]
+        return {"data": data, "layout": waveform_layout(template_name)}
+
+def interval_figure(intervals, start_date, end_date, template_name="plotly_dark"):
+    """
+    The waveform figure drawn from transit_intervals.TransitInterval runs.
+
+    Each trace only carries the in-orb samples, with a zero point on the
+    day before and after every run (and at both ends of the range), so the
+    lines look the same as waveform_figure's while the size scales with the
+    number of in-orb days rather than days x series.
+    """
+    with metrics.stage("figure_build"):
+        one_day = timedelta(days=1)
+        series = {}
+        for interval in intervals:
+            label = interval.label
+            if label not in series:
+                series[label] = ([], [])
+            xs, ys = series[label]
+            before = interval.start - one_day
+            if interval.start > start_date and (not xs or xs[-1] != before):
+                xs.append(before)
+                ys.append(0)
+            xs.extend(interval.start + i * one_day for i in range(interval.days))
+            ys.extend(round(value, 3) for value in interval.intensities.tolist())
+            if interval.end < end_date:
+                xs.append(interval.end + one_day)
+                ys.append(0)
+
+        data = []
+        for label, (xs, ys) in series.items():
+            if xs[0] > start_date:
+                xs.insert(0, start_date)
+                ys.insert(0, 0)
+            if xs[-1] < end_date:
+                xs.append(end_date)
+                ys.append(0)
+            data.append({
+                "type": "scatter", "mode": "lines", "name": label,
+                "x": [day.strftime("%Y-%m-%d") for day in xs], "y": ys
+            })
+        return {"data": data, "layout": waveform_layout(template_name)}
+
+# -----------------------------------------------------------
+#   Aspect wheels
+# -----------------------------------------------------------
+def zodiac_boundary_traces():
+    return [
+        {
+            "type": "scatterpolar",
+            "r": [0, 1.2],
+            "theta": [i * 30, i * 30],
+            "mode": "lines",
+            "line": {"color": "#333", "width": 0.6, "dash": "dot"},
+            "showlegend": False,
+            "hoverinfo": "none",
+        }
+        for i in range(len(zodiac_signs))
+    ]
+
+def zodiac_label_traces():
+    degrees_per_sign = 360 / len(zodiac_signs)
+    return [
+        {
+            "type": "scatterpolar",
+            "r": [1.15],
+            "theta": [i * degrees_per_sign + degrees_per_sign / 2],
+            "mode": "text",
+            "text": [sign],
+            "textfont": {"size": 12, "color": "#333"},
+            "showlegend": False,
+            "hoverinfo": "none",
+        }
+        for i, sign in enumerate(zodiac_signs)
+    ]
+
+def aspect_wheel_layout():
+    return {
+        "template": template("plotly_dark"),
+        "polar": {
+            "angularaxis": {
+                "showgrid": True,
+                "linecolor": "#333",
+                "gridcolor": "gray",
+                "linewidth": 0.5,
+                "showline": True,
+                "tickmode": "array",
+                "tickvals": [],
+                "ticktext": [],
+            },
+            "radialaxis": {"visible": False},
+        },
+        "margin": {"t": 40, "b": 40, "l": 40, "r": 40},
+        "legend": {
+            "x": 0,
+            "y": 0,
+            "bordercolor": "#666",
+            "borderwidth": 1,
+            "font": {"color": "#ffdead"},
+            # Key: ensures each line toggles individually, not grouped
+            "groupclick": "toggleitem",
+        },
+    }
+
+def synastry_wheel_layout():
+    return {
+        "template": template("plotly_dark"),
+        "showlegend": True,
+        "legend": {
+            "x": 0,
+            "y": 0,
+            "bordercolor": "#666",
+            "borderwidth": 1,
+            "font": {"color": "#ffdead"},
+            "groupclick": "toggleitem",
+        },
+        "margin": {"t": 40, "b": 40, "l": 40, "r": 90},
+        "polar": {
+            "radialaxis": {"visible": False},
+            "angularaxis": {"showgrid": True, "gridcolor": "#444"},
+        },
+    }
+
+def planet_marker_trace(positions_deg, label_prefix="", size=16, color="black",
+                        outline="#ffdead", text_size=10):
+    hover_texts = []
+    for planet, deg in positions_deg.items():
+        zodiac_pos = natal_chart.degrees_to_zodiac(deg)
+        hover_texts.append(f"{label_prefix}{planet}<br>{zodiac_pos}")
+
+    return {
+        "type": "scatterpolar",
+        "r": [1.0] * len(positions_deg),
+        "theta": list(positions_deg.values()),
+        "mode": "markers+text",
+        "text": [planet_symbols.get(p, p) for p in positions_deg],
+        "textposition": "middle center",
+        "marker": {"size": size, "color": color, "line": {"color": outline, "width": 1}},
+        "textfont": {"size": text_size, "color": "#ffdead"},
+        "showlegend": False,
+        "hoverinfo": "text",
+        "hovertext": hover_texts,
+    }
+
+def natal_aspect_lines(positions_deg, selected_aspects):
+    """
+    (planet1, aspect, planet2, angle1, angle2) for every aspect between
+    two planets of the same chart.
+    """
+    lines = []
+    for planet1, angle1 in positions_deg.items():
+        for planet2, angle2 in positions_deg.items():
+            if planet1 < planet2:
+                difference = abs(angle1 - angle2)
+                if difference > 180:
+                    difference = 360 - difference
+                for asp_name in selected_aspects:
+                    if abs(difference - aspects[asp_name]) <= orb[asp_name]:
+                        lines.append((planet1, asp_name, planet2, angle1, angle2))
+    return lines
+
+def synastry_aspect_lines(natal_positions, date_positions, selected_aspects):
+    """
+    (natal planet, aspect, date planet, natal angle, date angle) for every
+    natal<->date aspect.
+    """
+    lines = []
+    for nat_planet, nat_deg in natal_positions.items():
+        for date_planet, date_deg in date_positions.items():
+            diff = abs(nat_deg - date_deg)
+            if diff > 180:
+                diff = 360 - diff
+            for asp_name in selected_aspects:
+                if abs(diff - aspects[asp_name]) <= orb[asp_name]:
+                    lines.append((nat_planet, asp_name, date_planet, nat_deg, date_deg))
+    return lines
+
+def grouped_aspect_traces(lines, label_format, showlegend=None):
+    """
+    One trace per aspect type instead of one per line: segments are joined
+    with None breaks, each point carries its line's label in customdata for
+    hover, and legendgroup keeps legend toggling per aspect.
+    """
+    groups = {}
+    for planet1, asp_name, planet2, angle1, angle2 in lines:
+        label = label_format.format(planet1, asp_name, planet2)
+        group = groups.setdefault(asp_name, {"r": [], "theta": [], "customdata": []})
+        if group["r"]:
+            group["r"].append(None)
+            group["theta"].append(None)
+            group["customdata"].append(None)
+        group["r"] += [1, 1]
+        group["theta"] += [angle1, angle2]
+        group["customdata"] += [label, label]
+
+    traces = []
+    for asp_name, group in groups.items():
+        trace = {
+            "type": "scatterpolar",
+            "r": group["r"],
+            "theta": group["theta"],
+            "customdata": group["customdata"],
+            "mode": "lines",
+            "line": {"color": aspect_colors.get(asp_name, "cyan"), "width": 1},
+            "name": asp_name,
+            "legendgroup": asp_name,
+            "hovertemplate": "%{customdata}<extra></extra>",
+        }
+        if showlegend is not None:
+            trace["showlegend"] = showlegend
+        traces.append(trace)
+    return traces
+
+def aspect_wheel_traces(positions_deg, selected_aspects, group_aspects=False):
+    """
+    Per-request part of the aspect wheel: one line per aspect (or one
+    trace per aspect type with group_aspects), then the planet glyphs on top.
+    """
+    lines = natal_aspect_lines(positions_deg, selected_aspects)
+    if group_aspects:
+        data = grouped_aspect_traces(lines, "{0}-{1}-{2}")
+        data.append(planet_marker_trace(positions_deg))
+        return data
+
+    data = []
+    for planet1, asp_name, planet2, angle1, angle2 in lines:
+        data.append({
+            "type": "scatterpolar",
+            "r": [1, 1],
+            "theta": [angle1, angle2],
+            "mode": "lines",
+            "line": {"color": aspect_colors.get(asp_name, "cyan"), "width": 1},
+            "name": f"{planet1}-{asp_name}-{planet2}",
+            "hoverinfo": "skip",
+        })
+    data.append(planet_marker_trace(positions_deg))
+    return data
+
+def synastry_wheel_traces(natal_positions, date_positions, selected_aspects,
+                          group_aspects=False):
+    """
+    Per-request part of the natal<->date wheel: planet markers (kept out
+    of the legend so they're always visible), then each aspect line as its
+    own legend item (or one legend item per aspect type with group_aspects).
+    """
+    data = [
+        planet_marker_trace(natal_positions, "Natal ", size=18, text_size=12),
+        planet_marker_trace(date_positions, "Date ", size=14, color="blue",
+                            outline="#ddd", text_size=12),
+    ]
+    lines = synastry_aspect_lines(natal_positions, date_positions, selected_aspects)
+    if group_aspects:
+        return data + grouped_aspect_traces(lines, "{0} {1} {2}", showlegend=True)
+
+    for nat_planet, asp_name, date_planet, nat_deg, date_deg in lines:
+        data.append({
+            "type": "scatterpolar",
+            "r": [1, 1],
+            "theta": [nat_deg, date_deg],
+            "mode": "lines",
+            "line": {"color": aspect_colors.get(asp_name, "cyan"), "width": 1},
+            "name": f"{nat_planet} {asp_name} {date_planet}",
+            "showlegend": True,
+            "hoverinfo": "none",
+        })
+    return data
+
+def aspect_wheel_figure(positions_deg, selected_aspects, group_aspects=False):
+    """
+    Natal / single-date aspect wheel: zodiac boundaries and labels, one
+    line per aspect, then the planet glyphs on top.
+    """
+    data = zodiac_boundary_traces() + zodiac_label_traces()
+    data += aspect_wheel_traces(positions_deg, selected_aspects, group_aspects)
+    return {"data": data, "layout": aspect_wheel_layout()}
+
+def synastry_wheel_figure(natal_positions, date_positions, selected_aspects,
+                          group_aspects=False):
+    """
+    Natal<->date wheel: zodiac boundaries, planet markers, aspect lines.
+    """
+    data = zodiac_boundary_traces()
+    data += synastry_wheel_traces(natal_positions, date_positions, selected_aspects,
+                                  group_aspects)
+    return {"data": data, "layout": synastry_wheel_layout()}
+
+# -----------------------------------------------------------
+#   Pre-serialized wheel base layers
+# -----------------------------------------------------------
+@lru_cache(maxsize=None)
+def wheel_base(kind):
+    """
+    The parts of a wheel that never change, serialized once per process:
+    (background traces as a JSON list body without brackets, layout JSON).
+    """
+    if kind == "aspect":
+        traces = zodiac_boundary_traces() + zodiac_label_traces()
+        layout = aspect_wheel_layout()
+    elif kind == "synastry":
+        traces = zodiac_boundary_traces()
+        layout = synastry_wheel_layout()
+    else:
+        raise ValueError(f"Unknown wheel: '{kind}'")
+    return json.dumps(traces)[1:-1], json.dumps(layout)
+
+def _splice_wheel(kind, traces):
+    background, layout = wheel_base(kind)
+    with metrics.stage("json"):
+        dynamic = json.dumps(traces)[1:-1]
+    data = f"{background},{dynamic}" if dynamic else background
+    return f'{{"data":[{data}],"layout":{layout}}}'
+
+def aspect_wheel_json(positions_deg, selected_aspects, group_aspects=False):
+    """
+    aspect_wheel_figure as a JSON string; only the planets and aspect
+    lines are serialized per call.
+    """
+    with metrics.stage("figure_build"):
+        traces = aspect_wheel_traces(positions_deg, selected_aspects, group_aspects)
+    return _splice_wheel("aspect", traces)
+
+def synastry_wheel_json(natal_positions, date_positions, selected_aspects,
+                        group_aspects=False):
+    """
+    synastry_wheel_figure as a JSON string; only the planets and aspect
+    lines are serialized per call.
+    """
+    with metrics.stage("figure_build"):
+        traces = synastry_wheel_traces(natal_positions, date_positions,
+                                       selected_aspects, group_aspects)
+    return _splice_wheel("synastry", traces)
+
+# Page for the natal <iframe>, same shape as fig.write_html but with
+# plotly.js loaded by URL instead of inlined (~3.5 MB) into every page
+PLOT_PAGE = """<html>
+<head><meta charset="utf-8" /></head>
+<body>
+    <div>
+        <script type="text/javascript" src="{plotly_js_url}" charset="utf-8"></script>
+        <div id="aspect-plot" class="plotly-graph-div" style="height:100%; width:100%;"></div>
+        <script type="text/javascript">
+            var figure = {figure};
+            Plotly.newPlot("aspect-plot", figure.data, figure.layout, {{"responsive": true}});
+        </script>
+    </div>
+</body>
+</html>"""
+
+@lru_cache(maxsize=None)
+def plotly_js_url():
+    """
+    PLOTLY_JS_URL (e.g. a copy under /static) or the CDN build matching the
+    installed plotly, like write_html(include_plotlyjs="cdn").
+    """
+    url = os.getenv("PLOTLY_JS_URL")
+    if url:
+        return url
+    from plotly.offline import get_plotlyjs_version
+    return f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+
+def figure_html(figure_json):
+    """
+    Full HTML page around an already-serialized figure.
+    """
+    # keep "</script>" inside strings from ending the script block
+    return PLOT_PAGE.format(plotly_js_url=plotly_js_url(),
+                            figure=figure_json.replace("</", "<\\/"))
@@ -0,0 +1,30 @@
+# gunicorn.conf.py
+#
+#   gunicorn main:app                  (sync workers)
+#   gunicorn -k gevent main:app        (for /chat/stream)
+#
+# The app is imported once in the master and warmed up there, so workers
+# fork with the ephemeris, time zone data and figure templates already
+# loaded and share them copy-on-write. The OpenAI client is created in each
+# worker instead, once gevent (if used) has patched ssl and sockets.
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+preload_app = True
+
+# keep the time zone polygons in (shared) memory rather than per-worker files
+os.environ.setdefault("TIMEZONE_IN_MEMORY", "1")
+
+def on_starting(server):
+    # preload_app has already imported main by the time this runs
+    import main
+    main.warmup()
+
+def post_worker_init(worker):
+    # runs after the worker class's own setup (gevent's monkey-patching);
+    # post_fork would still be too early
+    import main
+    main.warmup_worker()
@@ -1,36 +1,42 @@
 import os
-import platform
 import re
-from datetime import datetime
-from flask import Flask, jsonify, render_template, request
-import plotly.graph_objects as go
+import json
+from datetime import datetime, timezone
+from flask import Blueprint, Flask, Response, current_app, jsonify, render_template, request, stream_with_context
 import natal_chart
 import transit_waveforms
+import transit_intervals
+import transit_events
+import transit_pool
+import figures
+import plot_store
+import response_cache
+import analysis_cache
+import chunked_analysis
+import ephemeris
+import metrics
+import chat_stream as chat_stream_module
+from figures import zodiac_signs, planet_symbols, aspect_colors
 import time
 from flask_cors import CORS
 import openaiApi
 from openaiApi import analyze_data_with_chat_completion
 from dotenv import load_dotenv
-from openai import OpenAI  # Import for chat endpoint
 
 load_dotenv()
-app = Flask(__name__)
-CORS(app)
-
-# Initialize OpenAI client globally (like openaiApi.py)
-client = OpenAI()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("Missing OPENAI_API_KEY environment variable.")
+# Routes live on a blueprint so create_app() can build fresh apps (tests,
+# benchmarks); the OpenAI client is created on first use (openaiApi.get_client)
+bp = Blueprint("main", __name__)
+
 ASSISTANT_ID = os.getenv("ASSISTANT_ID")  # Fetch from .env
 
-@app.route('/config')
+@bp.route('/config')
 def get_config():
     return jsonify({
         "assistant_id": ASSISTANT_ID  # No api_key here for security
     })
 
-@app.route('/chat', methods=['POST'])
+@bp.route('/chat', methods=['POST'])
 def chat():
     """
     Handles chat requests from chat-widget.js, using the OpenAI client.
@@ -39,34 +45,35 @@ def chat():
     message = data.get('message')
     thread_id = data.get('thread_id')
 
+    chat_client = get_chat_client()
     try:
         # Create a thread if none provided
         if not thread_id:
-            thread = client.beta.threads.create()
+            thread = chat_client.beta.threads.create()
             thread_id = thread.id
 
         # Send user message
-        client.beta.threads.messages.create(
+        chat_client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=message
         )
 
         # Run the assistant
-        run = client.beta.threads.runs.create(
+        run = chat_client.beta.threads.runs.create(
             thread_id=thread_id,
             assistant_id=ASSISTANT_ID
         )
 
         # Poll for completion
         while True:
-            run_status = client.beta.threads.runs.retrieve(
+            run_status = chat_client.beta.threads.runs.retrieve(
                 thread_id=thread_id,
                 run_id=run.id,
                 
             )
             if run_status.status == "completed":
-                messages = client.beta.threads.messages.list(
+                messages = chat_client.beta.threads.messages.list(
                     thread_id=thread_id,
                     
                 )
@@ -81,6 +88,53 @@ def chat():
     print(f"Run created: {run.id}")
     print(f"Messages retrieved: {messages.data}")
 
+def get_chat_client():
+    """
+    OpenAI client used by the chat routes; set app.config["OPENAI_CLIENT"]
+    to swap in a stub or a client pointed at a local fake server.
+    """
+    return current_app.config.get("OPENAI_CLIENT") or openaiApi.get_client()
+
+@bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /chat: replies arrive as server-sent events while
+    the assistant run is still producing them (see chat_stream.stream_reply).
+    """
+    data = request.json or {}
+    message = data.get('message')
+    if not message:
+        return jsonify({"error": "Missing 'message'"}), 400
+
+    try:
+        chat_client = get_chat_client()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    try:
+        slot = chat_stream_module.acquire_slot()
+    except chat_stream_module.ChatBusy as e:
+        return jsonify({"error": str(e)}), 503
+
+    def generate():
+        try:
+            yield from chat_stream_module.stream_reply(
+                chat_client, ASSISTANT_ID, message, data.get('thread_id')
+            )
+        finally:
+            slot.release()
+
+    try:
+        response = Response(stream_with_context(generate()), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except Exception:
+        slot.release()
+        raise
+    # the generator's finally never runs if the response is closed before
+    # it starts (early disconnect); closing always releases the slot
+    response.call_on_close(slot.release)
+    return response
+
 # -----------------------------------------------------------
 #   Planets, Signs, Aspects
 # -----------------------------------------------------------
@@ -88,24 +142,6 @@ planets = [
     "Jupiter", "Mars", "Mercury", "Moon", "Neptune",
     "Pluto", "Saturn", "Sun", "Uranus", "Venus"
 ]
-zodiac_signs = [
-    "Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
-    "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"
-]
-
-planet_symbols = {
-    "Jupiter": "♃",
-    "Mars": "♂",
-    "Mercury": "☿",
-    "Moon": "☾",
-    "Neptune": "♆",
-    "Pluto": "♇",
-    "Saturn": "♄",
-    "Sun": "☉",
-    "Uranus": "♅",
-    "Venus": "♀"
-}
-
 aspects = {
     "Conjunction": 0,
     "Opposition": 180,
@@ -120,28 +156,28 @@ orb = {
     "Square": 8,
     "Sextile": 6
 }
-aspect_colors = {
-    "Conjunction": "white",
-    "Opposition": "red",
-    "Trine": "green",
-    "Square": "blue",
-    "Sextile": "purple"
-}
 
 # -----------------------------------------------------------
 #   Home / Index
 # -----------------------------------------------------------
-@app.route("/")
+@bp.route("/")
 def index():
     """
     Renders the main page (templates/index.html).
+
+    The page asks for adaptive waveforms only when the daily ephemeris
+    table is there: without it every sub-daily sample is a separate
+    swe.calc_ut and a one-year request goes from ~20 ms to ~700 ms.
     """
-    return render_template("index.html", planets=planets, aspects=aspects.keys())
+    resolution = "adaptive" if ephemeris.get_table() is not None else "daily"
+    return render_template("index.html", planets=planets, aspects=aspects.keys(),
+                           resolution=resolution)
 
 # -----------------------------------------------------------
 #   Natal Chart
 # -----------------------------------------------------------
-@app.route("/calculate_natal_chart", methods=["POST"])
+@bp.route("/calculate_natal_chart", methods=["POST"])
+@response_cache.cached_response
 def calculate_chart():
     data = request.json
     if not data:
@@ -159,31 +195,60 @@ def calculate_chart():
     try:
         lat = float(lat)
         lon = float(lon)
-        chart = natal_chart.calculate_natal_chart(dob, tob, lat, lon)
-        return jsonify({"success": True, "chart": chart, "chartName": chart_name})
+        chart = natal_chart.calculate_natal_chart_numeric(dob, tob, lat, lon)
+        return jsonify({"success": True, "chart": chart.to_text(), "numeric": chart.to_json(),
+                        "chartName": chart_name})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Upper bound on records per /calculate_natal_charts call
+MAX_BATCH_RECORDS = 10000
+
+@bp.route("/calculate_natal_charts", methods=["POST"])
+def calculate_charts():
+    """
+    Batch natal charts: { "records": [ {dob, tob, lat, lon, ...}, ... ] }.
+    Each result carries its own chart or error, in input order.
+    """
+    data = request.json
+    if not data or not isinstance(data.get("records"), list):
+        return jsonify({"error": "Missing 'records' list"}), 400
+
+    records = data["records"]
+    if len(records) > MAX_BATCH_RECORDS:
+        return jsonify({"error": f"At most {MAX_BATCH_RECORDS} records per request"}), 400
+
+    try:
+        results = natal_chart.calculate_natal_charts(
+            [r if isinstance(r, dict) else {} for r in records]
+        )
+        for record, result in zip(records, results):
+            if isinstance(record, dict) and "chartName" in record:
+                result["chartName"] = record["chartName"]
+        return jsonify({"success": True, "results": results})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # -----------------------------------------------------------
-#   Aspect Plot (Natal, writes HTML for <iframe>)
+#   Aspect Plot (Natal, HTML page for <iframe>)
 # -----------------------------------------------------------
-@app.route("/generate_plot", methods=["POST"])
+@bp.route("/generate_plot", methods=["POST"])
 def generate_plot():
     """
-    Creates a static HTML file with the aspect wheel for natal positions.
+    Renders the aspect wheel page for natal positions and returns its URL.
     The front-end places it in an <iframe>, keeping your old design.
     """
     try:
         data = request.json
         positions = data.get("positions")
         selected_aspects = data.get("aspects", [])
+        group_aspects = bool(data.get("group_aspects"))
 
-        # Convert position strings to decimal degrees
-        for planet, pos_str in positions.items():
-            positions[planet] = convert_to_degrees(pos_str)
+        # Text, degrees or a numeric chart -> decimal degrees
+        positions = parse_natal_positions(positions)
 
-        # Generate the aspect wheel chart as an HTML file
-        aspect_plot_url = generate_aspect_plot(positions, selected_aspects)
+        # Render the aspect wheel page into the shared plot store
+        aspect_plot_url = generate_aspect_plot(positions, selected_aspects, group_aspects)
 
         return jsonify({"plot_url": aspect_plot_url})
     except Exception as e:
@@ -193,11 +258,25 @@ def generate_plot():
 # -----------------------------------------------------------
 #   Waveforms (No Iframe) -> Return Plotly Figure JSON
 # -----------------------------------------------------------
-@app.route("/generate_waveforms_data", methods=["POST"])
+@bp.route("/generate_waveforms_data", methods=["POST"])
+@response_cache.cached_response
 def generate_waveforms_data():
     """
     Returns JSON for Plotly (data + layout) plus the raw transits list.
     The front-end will embed it in a <div> via Plotly.newPlot(...).
+
+    With "format": "columnar" it returns {"columns": ..., "layout": ...}
+    instead (see transit_waveforms.build_waveform_columns).
+
+    With "format": "intervals" it returns {"columns": ..., "layout": ...}
+    with one entry per in-orb run instead of one per day (see
+    transit_intervals.build_interval_columns). "include" may ask for any of
+    "figure" (drawn from the runs), "intervals" (as JSON objects) and
+    "text" (the runs written out for /analyze_waveforms) on top.
+
+    "resolution": "adaptive" samples fast bodies (the Moon hourly) more
+    often than slow ones and still returns one value per day; the default
+    "daily" samples every body once a day.
     """
     try:
         data = request.json
@@ -210,47 +289,279 @@ def generate_waveforms_data():
         selected_transiting_planets = data.get("transiting_planets", [])
         selected_aspects = data.get("aspects", [])
         template = data.get("template", "plotly_dark")
-
-        # Convert natal chart positions from strings to degrees
-        natal_positions = {}
-        for planet, pos_str in natal_chart_positions.items():
-            natal_positions[planet] = convert_to_degrees(pos_str)
-
-        # Calculate waveforms
-        transits = transit_waveforms.calculate_transit_waveforms(
+        payload_format = data.get("format", "figure")
+        resolution = data.get("resolution", "daily")
+        if resolution not in transit_waveforms.RESOLUTIONS:
+            return jsonify({"error": f"Unknown resolution: '{resolution}'"}), 400
+
+        # Natal chart positions (text, degrees or numeric chart) to degrees
+        natal_positions = parse_natal_positions(natal_chart_positions)
+
+        if payload_format == "intervals":
+            intervals = transit_intervals.calculate_transit_intervals(
+                natal_positions, start_date, end_date,
+                selected_transiting_planets, selected_aspects, resolution=resolution
+            )
+            metrics.transits_total.inc(sum(i.days for i in intervals),
+                                       route="/generate_waveforms_data")
+            include = data.get("include", [])
+            response = {
+                "columns": transit_intervals.build_interval_columns(
+                    intervals, start_date, end_date
+                ),
+                "layout": figures.waveform_layout(template)
+            }
+            if "figure" in include:
+                response["figure"] = figures.interval_figure(intervals, start_date, end_date,
+                                                             template)
+            if "intervals" in include:
+                response["intervals"] = [transit_intervals.serialize_interval(i)
+                                         for i in intervals]
+            if "text" in include:
+                response["text"] = transit_intervals.intervals_text(intervals, start_date, end_date)
+            return jsonify(response)
+
+        # Calculate waveforms (long ranges are spread over the process pool)
+        transits = transit_pool.calculate_transit_waveforms_parallel(
             natal_positions, start_date, end_date,
-            selected_transiting_planets, selected_aspects
+            selected_transiting_planets, selected_aspects, resolution=resolution
         )
+        metrics.transits_total.inc(len(transits), route="/generate_waveforms_data")
+
+        if payload_format == "columnar":
+            return jsonify({
+                "columns": transit_waveforms.build_waveform_columns(
+                    transits, start_date, end_date
+                ),
+                "layout": figures.waveform_layout(template)
+            })
 
         # Build a figure dict for direct Plotly usage
-        fig_dict = transit_waveforms.build_waveform_figure_dict(
+        fig_dict = figures.waveform_figure(
             transits, start_date, end_date, template
         )
 
         return jsonify({
             "figure": fig_dict,  # { "data": [...], "layout": {...} }
-            "transits": [
+            "transits": [serialize_transit(t) for t in transits]
+        })
+    except Exception as e:
+        print(f"Error in /generate_waveforms_data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# -----------------------------------------------------------
+#   Waveforms, streamed (NDJSON or server-sent events)
+# -----------------------------------------------------------
+@bp.route("/generate_waveforms_stream", methods=["POST"])
+def generate_waveforms_stream():
+    """
+    Same inputs as /generate_waveforms_data plus optional
+    "period" ("month" or "day") and "format" ("ndjson" or "sse").
+
+    Sends one {"period": ..., "transits": [...]} message per period as soon
+    as it is computed, then {"done": true, "count": N}. No figure is built;
+    the client accumulates transits as they arrive.
+    """
+    data = request.json
+    if not data:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    try:
+        natal_chart_positions = data.get("natal_chart")
+        start_date = datetime.strptime(data.get("start_date"), "%Y-%m-%d")
+        end_date = datetime.strptime(data.get("end_date"), "%Y-%m-%d")
+        selected_transiting_planets = data.get("transiting_planets", [])
+        selected_aspects = data.get("aspects", [])
+        period = data.get("period", "month")
+        stream_format = data.get("format", "ndjson")
+        resolution = data.get("resolution", "daily")
+        if stream_format not in ("ndjson", "sse"):
+            return jsonify({"error": f"Unknown format: '{stream_format}'"}), 400
+        if period not in ("day", "month"):
+            return jsonify({"error": f"Unknown period: '{period}'"}), 400
+        if resolution not in transit_waveforms.RESOLUTIONS:
+            return jsonify({"error": f"Unknown resolution: '{resolution}'"}), 400
+
+        natal_positions = parse_natal_positions(natal_chart_positions)
+
+        periods = transit_waveforms.iter_transit_waveforms(
+            natal_positions, start_date, end_date,
+            selected_transiting_planets, selected_aspects, period, resolution
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    period_fmt = "%Y-%m" if period == "month" else "%Y-%m-%d"
+
+    def encode(message):
+        if stream_format == "sse":
+            return f"data: {json.dumps(message)}\n\n"
+        return json.dumps(message) + "\n"
+
+    def generate():
+        count = 0
+        try:
+            for period_start, transits in periods:
+                count += len(transits)
+                yield encode({
+                    "period": period_start.strftime(period_fmt),
+                    "transits": [serialize_transit(t) for t in transits]
+                })
+            yield encode({"done": True, "count": count})
+        except Exception as e:
+            print(f"Error in /generate_waveforms_stream: {e}")
+            yield encode({"error": str(e)})
+        finally:
+            metrics.transits_total.inc(count, route="/generate_waveforms_stream")
+
+    mimetype = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -----------------------------------------------------------
+#   Waveforms for many natal charts, streamed per chart
+# -----------------------------------------------------------
+@bp.route("/generate_waveforms_bulk", methods=["POST"])
+def generate_waveforms_bulk():
+    """
+    One date window against many charts:
+      { "natal_charts": [ {"chartName": ..., "natal_chart": {...}}, ... ],
+        "start_date", "end_date", "transiting_planets", "aspects",
+        "format": "ndjson" (default) or "sse" }
+
+    Transiting positions are computed once for the window and all charts are
+    scored together (transit_waveforms.iter_transit_waveforms_bulk). Sends
+    one {"index", "chartName", "transits"} (or "error") message per chart,
+    in input order, then {"done": true, "charts": N, "count": M}.
+    """
+    data = request.json
+    if not data or not isinstance(data.get("natal_charts"), list):
+        return jsonify({"error": "Missing 'natal_charts' list"}), 400
+
+    records = data["natal_charts"]
+    if len(records) > MAX_BATCH_RECORDS:
+        return jsonify({"error": f"At most {MAX_BATCH_RECORDS} charts per request"}), 400
+
+    try:
+        start_date = datetime.strptime(data.get("start_date"), "%Y-%m-%d")
+        end_date = datetime.strptime(data.get("end_date"), "%Y-%m-%d")
+        selected_transiting_planets = data.get("transiting_planets", [])
+        selected_aspects = data.get("aspects", [])
+        stream_format = data.get("format", "ndjson")
+        if stream_format not in ("ndjson", "sse"):
+            return jsonify({"error": f"Unknown format: '{stream_format}'"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Convert every chart up front; a bad chart only fails its own message
+    charts, errors = [], {}
+    for i, record in enumerate(records):
+        try:
+            if not isinstance(record, dict) or not isinstance(record.get("natal_chart"), dict):
+                raise ValueError("Missing 'natal_chart'")
+            charts.append(parse_natal_positions(record["natal_chart"]))
+        except Exception as e:
+            errors[i] = str(e)
+            charts.append(None)
+    valid = [i for i, chart in enumerate(charts) if chart is not None]
+
+    def encode(message):
+        if stream_format == "sse":
+            return f"data: {json.dumps(message)}\n\n"
+        return json.dumps(message) + "\n"
+
+    def chart_name(i):
+        return records[i].get("chartName") if isinstance(records[i], dict) else None
+
+    def generate():
+        count = 0
+        next_index = 0
+        try:
+            results = transit_waveforms.iter_transit_waveforms_bulk(
+                [charts[i] for i in valid], start_date, end_date,
+                selected_transiting_planets, selected_aspects
+            )
+            for position, transits in results:
+                index = valid[position]
+                # errors for charts that were skipped come out in order too
+                while next_index < index:
+                    yield encode({"index": next_index, "chartName": chart_name(next_index),
+                                  "error": errors[next_index]})
+                    next_index += 1
+                count += len(transits)
+                yield encode({"index": index, "chartName": chart_name(index),
+                              "transits": [serialize_transit(t) for t in transits]})
+                next_index = index + 1
+            for index in range(next_index, len(records)):
+                yield encode({"index": index, "chartName": chart_name(index),
+                              "error": errors[index]})
+            yield encode({"done": True, "charts": len(records), "count": count})
+        except Exception as e:
+            print(f"Error in /generate_waveforms_bulk: {e}")
+            yield encode({"error": str(e)})
+        finally:
+            metrics.transits_total.inc(count, route="/generate_waveforms_bulk")
+
+    mimetype = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -----------------------------------------------------------
+#   Transit Events (entry / exact / exit timestamps)
+# -----------------------------------------------------------
+@bp.route("/transit_events", methods=["POST"])
+def transit_events_data():
+    """
+    Same inputs as /generate_waveforms_data, but returns one record per
+    transit with its orb entry, exact perfection(s) and orb exit times
+    instead of a dense daily series.
+    """
+    try:
+        data = request.json
+        if not data:
+            return jsonify({"error": "Invalid JSON"}), 400
+
+        natal_chart_positions = data.get("natal_chart")
+        start_date = datetime.strptime(data.get("start_date"), "%Y-%m-%d")
+        end_date = datetime.strptime(data.get("end_date"), "%Y-%m-%d")
+        selected_transiting_planets = data.get("transiting_planets", [])
+        selected_aspects = data.get("aspects", [])
+
+        natal_positions = parse_natal_positions(natal_chart_positions)
+
+        events = transit_events.find_transit_events(
+            natal_positions, start_date, end_date,
+            selected_transiting_planets, selected_aspects
+        )
+        metrics.transits_total.inc(len(events), route="/transit_events")
+
+        fmt = "%Y-%m-%d %H:%M:%S"
+        return jsonify({
+            "events": [
                 {
-                    "date": t["date"].strftime("%Y-%m-%d"),
-                    "transiting_planet": t["transiting_planet"],
-                    "natal_planet": t["natal_planet"],
-                    "aspect": t["aspect"],
-                    "intensity": round(t["intensity"], 3)
+                    "transiting_planet": e["transiting_planet"],
+                    "natal_planet": e["natal_planet"],
+                    "aspect": e["aspect"],
+                    "entry": e["entry"].strftime(fmt) if e["entry"] else None,
+                    "exact": [d.strftime(fmt) for d in e["exact"]],
+                    "exit": e["exit"].strftime(fmt) if e["exit"] else None
                 }
-                for t in transits
+                for e in events
             ]
         })
     except Exception as e:
-        print(f"Error in /generate_waveforms_data: {e}")
+        print(f"Error in /transit_events: {e}")
         return jsonify({"error": str(e)}), 500
 
 # -----------------------------------------------------------
 #   Single-Date Aspect Snapshot (No Iframe) -> Return JSON
 # -----------------------------------------------------------
-@app.route("/snapshot_aspect_chart_data", methods=["POST"])
+@bp.route("/snapshot_aspect_chart_data", methods=["POST"])
+@response_cache.cached_response
 def snapshot_aspect_chart_data():
     """
-    Generates an aspect wheel for a single date/time (at noon).
+    Generates an aspect wheel for a single date/time (noon unless "time"
+    is given as "HH:MM").
     On a waveforms click, we show the same "old design" in a modal,
     but returned as JSON for direct Plotly usage.
     """
@@ -259,10 +570,7 @@ def snapshot_aspect_chart_data():
         if not data or "date" not in data:
             return jsonify({"error": "Missing 'date'"}), 400
 
-        date_str = data["date"]
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        # Arbitrary time: noon
-        dt = dt.replace(hour=12, minute=0)
+        dt = parse_snapshot_datetime(data)
 
         # Compute positions in degrees
         positions_deg = {}
@@ -271,9 +579,10 @@ def snapshot_aspect_chart_data():
 
         # Build the aspect wheel figure in JSON, but with your original radial design
         # -> We'll use the same style from generate_aspect_plot, just returning JSON instead of HTML.
-        fig_data = build_aspect_wheel_figure_dict(positions_deg, list(aspects.keys()))
+        fig_json = figures.aspect_wheel_json(positions_deg, list(aspects.keys()),
+                                             bool(data.get("group_aspects")))
 
-        return jsonify({"figure": fig_data})
+        return json_response(f'{{"figure":{fig_json}}}')
     except Exception as e:
         print(f"Error in /snapshot_aspect_chart_data: {e}")
         return jsonify({"error": str(e)}), 500
@@ -281,21 +590,145 @@ def snapshot_aspect_chart_data():
 # -----------------------------------------------------------
 #   GPT Analysis Route
 # -----------------------------------------------------------
-@app.route('/analyze_waveforms', methods=['POST'])
+@bp.route('/analyze_waveforms', methods=['POST'])
 def analyze_waveforms():
     try:
         data = request.json.get('waveforms_text', '')
         if not data:
             return jsonify({'error': 'No waveforms text provided'}), 400
 
-        analysis = analyze_data_with_chat_completion(data)
+        analysis = analyze_data_with_chat_completion(data, client=current_app.config.get("OPENAI_CLIENT"))
         return jsonify({'analysis': analysis})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/analyze_waveforms_stream', methods=['POST'])
+def analyze_waveforms_stream():
+    """
+    Chunked analysis of long ranges. Same "waveforms_text" as
+    /analyze_waveforms plus optional "period" ("month", default, or a number
+    of days per chunk) and "format" ("ndjson" or "sse").
+
+    Sends {"chunks": [...]} first, one {"chunk", "label", "analysis"} message
+    per chunk as it finishes, then {"summary": ...} and {"done": true}.
+    """
+    data = request.json
+    if not data:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    text = data.get('waveforms_text', '')
+    if not text:
+        return jsonify({'error': 'No waveforms text provided'}), 400
+    period = data.get("period", "month")
+    stream_format = data.get("format", "ndjson")
+    if stream_format not in ("ndjson", "sse"):
+        return jsonify({"error": f"Unknown format: '{stream_format}'"}), 400
+    if period != "month":
+        try:
+            period = int(period)
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Unknown period: '{period}'"}), 400
+
+    def encode(message):
+        if stream_format == "sse":
+            return f"data: {json.dumps(message)}\n\n"
+        return json.dumps(message) + "\n"
+
+    messages = chunked_analysis.analyze_in_chunks(
+        text, period, client=current_app.config.get("OPENAI_CLIENT")
+    )
+
+    def generate():
+        try:
+            for message in messages:
+                yield encode(message)
+            yield encode({"done": True})
+        except Exception as e:
+            print(f"Error in /analyze_waveforms_stream: {e}")
+            yield encode({"error": str(e)})
+
+    mimetype = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss counters of the in-process caches (per worker) and the shared
+    analysis cache.
+    """
+    return jsonify({
+        "ephemeris": ephemeris.cache.stats(),
+        "responses": dict(response_cache.stats),
+        "analysis": analysis_cache.cache.stats()
+    })
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus text exposition of this worker's request/stage timings,
+    transit counts and cache counters.
+    """
+    return Response(metrics.registry.render(),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+metrics.registry.add_collector(lambda: metrics.cache_lines({
+    "ephemeris": ephemeris.cache.stats(),
+    "responses": dict(response_cache.stats),
+    "analysis": analysis_cache.cache.stats(),
+    "plots": {"size": len(plot_store.store)},
+}))
+
 # -----------------------------------------------------------
 #   Helper Functions
 # -----------------------------------------------------------
+def json_response(body):
+    """
+    Response for a body that is already JSON (e.g. spliced figure fragments).
+    """
+    return Response(body, mimetype="application/json")
+
+def serialize_transit(t):
+    """
+    JSON-ready copy of one transit record (date as text, intensity rounded).
+    """
+    return {
+        "date": t["date"].strftime("%Y-%m-%d"),
+        "transiting_planet": t["transiting_planet"],
+        "natal_planet": t["natal_planet"],
+        "aspect": t["aspect"],
+        "intensity": round(t["intensity"], 3)
+    }
+
+def parse_snapshot_datetime(data):
+    """
+    UTC datetime for the snapshot routes: "date" at "time" ("HH:MM",
+    default noon), read as local time at "lat"/"lon" when both are given.
+    """
+    dt = datetime.strptime(f"{data['date']} {data.get('time') or '12:00'}", "%Y-%m-%d %H:%M")
+    if data.get("lat") is not None and data.get("lon") is not None:
+        dt = natal_chart.local_to_utc(dt, float(data["lat"]), float(data["lon"]))
+    return dt
+
+def parse_natal_positions(chart):
+    """
+    {planet: degrees} from any natal chart shape a client sends:
+    a numeric chart ({"longitudes": [...], ...}, see natal_chart.NatalChart),
+    {planet: degrees}, or {planet: "20° 30' 10\" Aries"} text.
+    """
+    if not isinstance(chart, dict):
+        raise ValueError("Natal chart must be an object")
+    if "longitudes" in chart:
+        return natal_chart.NatalChart.from_json(chart).positions()
+
+    positions = {}
+    for planet, position in chart.items():
+        if isinstance(position, (int, float)) and not isinstance(position, bool):
+            positions[planet] = float(position) % 360
+        else:
+            positions[planet] = convert_to_degrees(position)
+    return positions
+
 def convert_to_degrees(position):
     """
     Convert "20° 30' 10\" Aries" -> decimal degrees.
@@ -324,242 +757,35 @@ def convert_to_degrees(position):
     else:
         raise ValueError(f"Invalid position format: '{position}'")
 
-def generate_aspect_plot(positions_deg, selected_aspects):
-    """
-    This is your old code that writes a static HTML file for 'aspect_plot.html' 
-    used by the natal chart <iframe>. 
-    (We keep it unchanged so the natal chart has the same design as always.)
-    """
-    fig = go.Figure()
-
-    # EXACT style logic as your old code:
-    num_signs = len(zodiac_signs)
-    degrees_per_sign = 360 / num_signs
-    sign_angles = [(i * degrees_per_sign + degrees_per_sign / 2) for i in range(num_signs)]
-
-    # zodiac boundaries
-    for i in range(num_signs):
-        boundary_angle = i * 30
-        fig.add_trace(go.Scatterpolar(
-            r=[0, 1.2],
-            theta=[boundary_angle, boundary_angle],
-            mode="lines",
-            line=dict(color="#333", width=0.6, dash="dot"),
-            showlegend=False,
-            hoverinfo="none"
-        ))
-
-    # zodiac labels
-    for angle, sign in zip(sign_angles, zodiac_signs):
-        fig.add_trace(go.Scatterpolar(
-            r=[1.15],
-            theta=[angle],
-            mode="text",
-            text=[sign],
-            textfont=dict(size=12, color="#333"),
-            showlegend=False,
-            hoverinfo="none"
-        ))
-
-    # aspect lines
-    for planet1, angle1 in positions_deg.items():
-        for planet2, angle2 in positions_deg.items():
-            if planet1 < planet2:
-                difference = abs(angle1 - angle2)
-                if difference > 180:
-                    difference = 360 - difference
-                for asp_name in selected_aspects:
-                    aspect_angle = aspects[asp_name]
-                    if abs(difference - aspect_angle) <= orb[asp_name]:
-                        color = aspect_colors.get(asp_name, "cyan")
-                        fig.add_trace(go.Scatterpolar(
-                            r=[1, 1],
-                            theta=[angle1, angle2],
-                            mode="lines",
-                            line=dict(color=color, width=1),
-                            name=f"{planet1}-{asp_name}-{planet2}",
-                            hoverinfo="skip"
-                        ))
-
-    # planet glyphs
-    planet_r = []
-    planet_theta = []
-    planet_text = []
-    hover_texts = []  # <-- NEW: For detailed hover info
-    for planet, deg in positions_deg.items():
-        planet_r.append(1.0)
-        planet_theta.append(deg)
-        planet_text.append(planet_symbols.get(planet, planet))
-        # NEW: Calculate zodiac position using existing natal_chart function
-        zodiac_pos = natal_chart.degrees_to_zodiac(deg)
-        hover_texts.append(f"{planet}<br>{zodiac_pos}")  # <-- Multi-line hover
-
-    fig.add_trace(go.Scatterpolar(
-        r=planet_r,
-        theta=planet_theta,
-        mode="markers+text",
-        text=planet_text, 
-        textposition="middle center",
-        marker=dict(size=16, color="black", line=dict(color='#ffdead', width=1)),
-        textfont=dict(size=10, color="#ffdead"),
-        showlegend=False,
-        hoverinfo="text",          # <-- Show custom text
-        hovertext=hover_texts      # <-- Attach detailed info
-    ))
-
-    fig.update_layout(
-        template="plotly_dark",
-        polar=dict(
-            angularaxis=dict(
-                showgrid=True,
-                linecolor="#333",
-                gridcolor="gray",
-                linewidth=0.5,
-                showline=True,
-                tickmode="array",
-                tickvals=[],
-                ticktext=[]
-            ),
-            radialaxis=dict(visible=False)
-        ),
-        margin=dict(t=40, b=40, l=40, r=40),
-        legend=dict(
-            x=0,
-            y=0,
-            bordercolor="#666",
-            borderwidth=1,
-            font=dict(color="#ffdead"),
-            # Key: ensures each line toggles individually, not grouped
-            groupclick="toggleitem"
-        ),
-    )
-
-    if not os.path.exists("static"):
-        os.makedirs("static")
-    html_path = "static/aspect_plot.html"
-    fig.write_html(html_path)
-    return f"/{html_path}"
-
-
-
-
-def build_aspect_wheel_figure_dict(positions_deg, selected_aspects):
-    """
-    Recreates the same radial design as 'generate_aspect_plot', 
-    but returns JSON for direct Plotly usage (no <iframe>).
-    """
-    fig = go.Figure()
-
-    num_signs = len(zodiac_signs)
-    degrees_per_sign = 360 / num_signs
-    sign_angles = [(i * degrees_per_sign + degrees_per_sign / 2) for i in range(num_signs)]
-
-    # boundaries
-    for i in range(num_signs):
-        boundary_angle = i * 30
-        fig.add_trace(go.Scatterpolar(
-            r=[0, 1.2],
-            theta=[boundary_angle, boundary_angle],
-            mode="lines",
-            line=dict(color="#333", width=0.6, dash="dot"),
-            showlegend=False,
-            hoverinfo="none"
-        ))
-
-    # zodiac labels
-    for angle, sign in zip(sign_angles, zodiac_signs):
-        fig.add_trace(go.Scatterpolar(
-            r=[1.15],
-            theta=[angle],
-            mode="text",
-            text=[sign],
-            textfont=dict(size=12, color="#333"),
-            showlegend=False,
-            hoverinfo="none"
-        ))
-
-    # aspect lines
-    for planet1, angle1 in positions_deg.items():
-        for planet2, angle2 in positions_deg.items():
-            if planet1 < planet2:
-                difference = abs(angle1 - angle2)
-                if difference > 180:
-                    difference = 360 - difference
-                for asp_name in selected_aspects:
-                    aspect_angle = aspects[asp_name]
-                    if abs(difference - aspect_angle) <= orb[asp_name]:
-                        color = aspect_colors.get(asp_name, "cyan")
-                        fig.add_trace(go.Scatterpolar(
-                            r=[1, 1],
-                            theta=[angle1, angle2],
-                            mode="lines",
-                            line=dict(color=color, width=1),
-                            name=f"{planet1}-{asp_name}-{planet2}",
-                            hoverinfo="skip"
-                        ))
-
-    # planet glyphs
-    planet_r = []
-    planet_theta = []
-    planet_text = []
-    hover_texts = []
-    for planet, deg in positions_deg.items():
-        planet_r.append(1.0)
-        planet_theta.append(deg)
-        planet_text.append(planet_symbols.get(planet, planet))
-        zodiac_pos = natal_chart.degrees_to_zodiac(deg)
-        hover_texts.append(f"{planet}<br>{zodiac_pos}")
-
-    fig.add_trace(go.Scatterpolar(
-        r=planet_r,
-        theta=planet_theta,
-        mode="markers+text",
-        text=planet_text,
-        textposition="middle center",
-        marker=dict(size=16, color="black", line=dict(color='#ffdead', width=1)),
-        textfont=dict(size=10, color="#ffdead"),
-        showlegend=False,
-        hoverinfo="text",
-        hovertext=hover_texts
-    ))
-
-    fig.update_layout(
-        template="plotly_dark",
-        polar=dict(
-            angularaxis=dict(
-                showgrid=True,
-                linecolor="#333",
-                gridcolor="gray",
-                linewidth=0.5,
-                showline=True,
-                tickmode="array",
-                tickvals=[],
-                ticktext=[]
-            ),
-            radialaxis=dict(visible=False)
-        ),
-        margin=dict(t=40, b=40, l=40, r=40),
-        legend=dict(
-            x=0,
-            y=0,
-            bordercolor="#666",
-            borderwidth=1,
-            font=dict(color="#ffdead"),
-            # Key: ensures each line toggles individually, not grouped
-            groupclick="toggleitem"
-        ),
-        
-    )
-
-    return {
-        "data": [trace.to_plotly_json() for trace in fig.data],
-        "layout": fig.layout.to_plotly_json()
-    }
-
-
-
+def generate_aspect_plot(positions_deg, selected_aspects, group_aspects=False):
+    """
+    Renders the natal wheel page for the <iframe> into the plot store
+    (shared by every worker on the host) and returns its URL. Pages are
+    keyed by their content, so the same chart is rendered once and
+    concurrent users never see each other's.
+    """
+    key = plot_store.plot_key(positions_deg, selected_aspects, group_aspects)
+    if key not in plot_store.store:
+        html = figures.figure_html(
+            figures.aspect_wheel_json(positions_deg, selected_aspects, group_aspects)
+        )
+        plot_store.store.put(key, html)
+    return f"/plots/{key}.html"
 
-@app.route("/synastry_aspect_chart_data", methods=["POST"])
+@bp.route("/plots/<key>.html")
+def serve_plot(key):
+    """
+    Serves a page rendered by generate_aspect_plot.
+    """
+    html = plot_store.store.get(key)
+    if html is None:
+        return "Plot expired, please generate it again.", 404
+    # content-addressed: a key always maps to the same page
+    return Response(html, mimetype="text/html",
+                    headers={"Cache-Control": f"private, max-age={plot_store.store.ttl}"})
+
+@bp.route("/synastry_aspect_chart_data", methods=["POST"])
+@response_cache.cached_response
 def synastry_aspect_chart_data():
     """
     A route that takes:
@@ -567,27 +793,28 @@ def synastry_aspect_chart_data():
         "natal_chart_text": {"Sun":"20° 12' ... Aries", "Moon":"12° 03' ... Taurus", ...},
         "selected_aspects": ["Conjunction","Opposition","Trine","Square","Sextile"]
       }
-    Then re-converts the natal text to degrees, 
+    ("natal_chart" may be sent instead: a numeric chart or {planet: degrees};
+    an optional "time": "HH:MM" replaces noon).
+    Then converts the natal chart to degrees, 
     calculates the date positions in degrees,
-    and draws only natal↔date lines.
+    and draws only natal↔date lines
+    (merged into one trace per aspect type if "group_aspects" is true).
     """
     try:
         data = request.json
         if not data:
             return jsonify({"error": "No data"}), 400
 
-        date_str = data["date"]
-        natal_chart_text = data["natal_chart_text"] 
+        natal_chart_data = data.get("natal_chart", data.get("natal_chart_text"))
+        if natal_chart_data is None:
+            return jsonify({"error": "Missing 'natal_chart'"}), 400
         selected_aspects = data["selected_aspects"]
 
-        # 1) Convert the natal text to degrees
-        natal_positions_deg = {}
-        for planet, pos_str in natal_chart_text.items():
-            natal_positions_deg[planet] = convert_to_degrees(pos_str)  # reuse your function
+        # 1) Natal text, degrees or numeric chart -> degrees
+        natal_positions_deg = parse_natal_positions(natal_chart_data)
 
-        # 2) Convert date_str -> datetime
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        dt = dt.replace(hour=12, minute=0)
+        # 2) Convert date (+ time) -> datetime, local if lat/lon given
+        dt = parse_snapshot_datetime(data)
 
         # 3) Calculate the date positions
         date_positions_deg = {}
@@ -595,127 +822,60 @@ def synastry_aspect_chart_data():
             date_positions_deg[p] = natal_chart.get_transit_position(dt, p)
 
         # 4) Build synergy chart
-        fig_data = build_synastry_wheel(natal_positions_deg, date_positions_deg, selected_aspects)
-        return jsonify({"figure": fig_data})
+        fig_json = figures.synastry_wheel_json(natal_positions_deg, date_positions_deg,
+                                               selected_aspects, bool(data.get("group_aspects")))
+        return json_response(f'{{"figure":{fig_json}}}')
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# -----------------------------------------------------------
+#   App Factory & Warmup
+# -----------------------------------------------------------
+def create_app(config=None):
+    """
+    Build the Flask app. `config` is merged into app.config, e.g.
+    {"OPENAI_CLIENT": stub} to run the LLM routes against a stub.
+    """
+    app = Flask(__name__)
+    CORS(app)
+    if config:
+        app.config.update(config)
+    metrics.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+def warmup():
+    """
+    Load the shared, read-only state every worker needs. Called once in the
+    Gunicorn master (see gunicorn.conf.py) so forked workers inherit it
+    copy-on-write instead of each paying for it on its first request.
+    """
+    # 1) Ephemeris: daily table mapping and the Swiss Ephemeris data files
+    ephemeris.get_table()
+    ephemeris.calc_ut(natal_chart.julian_day(datetime.now(timezone.utc)), 0)
+
+    # 2) Time zone polygons (plus the lookup code paths)
+    natal_chart.get_local_timezone(0.0, 0.0)
 
+    # 3) Plotly: template expansion and the static wheel layers
+    figures.template("plotly_dark")
+    figures.wheel_base("aspect")
+    figures.wheel_base("synastry")
+    figures.plotly_js_url()
 
-def build_synastry_wheel(natal_positions, date_positions, selected_aspects):
-    """
-    Show lines in the legend (one line = one legend item),
-    but hide the planet markers from the legend so they're always visible.
-    """
-    fig = go.Figure()
-
-    # 1) Draw zodiac boundaries (off the legend)
-    num_signs = 12
-    for i in range(num_signs):
-        angle = i * 30
-        fig.add_trace(go.Scatterpolar(
-            r=[0, 1.2],
-            theta=[angle, angle],
-            mode="lines",
-            line=dict(color="#333", width=0.6, dash="dot"),
-            showlegend=False,    # do not include in legend
-            hoverinfo="none"
-        ))
-
-    # 3) Plot natal planets (with enhanced hover, no legend entry -> always visible)
-    natal_r = []
-    natal_theta = []
-    natal_text = []
-    natal_hovertext = []  # <-- NEW: Natal planet hover details
-    for p, deg in natal_positions.items():
-        natal_r.append(1.0)
-        natal_theta.append(deg)
-        natal_text.append(planet_symbols.get(p, p))
-        zodiac_pos = natal_chart.degrees_to_zodiac(deg)
-        natal_hovertext.append(f"Natal {p}<br>{zodiac_pos}")  # <-- Using existing calculation
-
-    fig.add_trace(go.Scatterpolar(
-        r=natal_r,
-        theta=natal_theta,
-        mode="markers+text",
-        text=natal_text,
-        textposition="middle center",
-        marker=dict(size=18, color="black", line=dict(color="#ffdead", width=1)),
-        textfont=dict(size=12, color="#ffdead"),
-        showlegend=False,      # hide from legend
-        hoverinfo="text", # <-- Critical: Show custom text
-        hovertext=natal_hovertext  # <-- Attach detailed natal info
-    ))
-
-    # 4) Plot date planets (with enhanced hover and no legend entry -> always visible)
-    date_r = []
-    date_theta = []
-    date_text = []
-    date_hovertext = []  # <-- NEW: Date planet hover details
-    for p, deg in date_positions.items():
-        date_r.append(1)
-        date_theta.append(deg)
-        date_text.append(planet_symbols.get(p, p))
-        zodiac_pos = natal_chart.degrees_to_zodiac(deg)
-        date_hovertext.append(f"Date {p}<br>{zodiac_pos}")  # <-- Reuse conversion
-    fig.add_trace(go.Scatterpolar(
-        r=date_r,
-        theta=date_theta,
-        mode="markers+text",
-        text=date_text,
-        textposition="middle center",
-        marker=dict(size=14, color="blue", line=dict(color="#ddd", width=1)),
-        textfont=dict(size=12, color="#ffdead"),
-        showlegend=False,      # hide from legend
-        hoverinfo="text",
-        hovertext=date_hovertext  # <-- Date-specific info
-    ))
-
-    # 2) Add aspect lines for natal↔date
-    #    Each line is its own legend item, toggled individually.
-    for nat_planet, nat_deg in natal_positions.items():
-        for date_planet, date_deg in date_positions.items():
-            diff = abs(nat_deg - date_deg)
-            if diff > 180:
-                diff = 360 - diff
-            for asp_name in selected_aspects:
-                aspect_angle = aspects[asp_name]
-                if abs(diff - aspect_angle) <= orb[asp_name]:
-                    color = aspect_colors.get(asp_name, "cyan")
-                    fig.add_trace(go.Scatterpolar(
-                        r=[1, 1],               # radius for lines
-                        theta=[nat_deg, date_deg],
-                        mode="lines",
-                        line=dict(color=color, width=1),
-                        name=f"{nat_planet} {asp_name} {date_planet}",
-                        showlegend=True,         # lines appear in legend
-                        hoverinfo="none"
-                    ))
-
-    # 5) Configure legend for "line-by-line" toggling
-    fig.update_layout(
-        template="plotly_dark",
-        showlegend=True,    # We do want lines to appear in the legend
-        legend=dict(
-            x=0,
-            y=0,
-            bordercolor="#666",
-            borderwidth=1,
-            font=dict(color="#ffdead"),
-            # Key: ensures each line toggles individually, not grouped
-            groupclick="toggleitem"
-        ),
-        margin=dict(t=40, b=40, l=40, r=90),
-        polar=dict(
-            radialaxis=dict(visible=False),
-            angularaxis=dict(showgrid=True, gridcolor="#444")
-        )
-    )
+    # The OpenAI client is left to warmup_worker(): importing openai pulls in
+    # ssl and httpx, which must not happen before gevent patches them
 
-    return {
-        "data": [trace.to_plotly_json() for trace in fig.data],
-        "layout": fig.layout.to_plotly_json()
-    }
+def warmup_worker():
+    """
+    Per-worker warmup, called after the worker has started (and, with the
+    gevent worker class, monkey-patched the standard library). Creates the
+    OpenAI client so the first chat request doesn't pay for it.
+    """
+    if os.getenv("OPENAI_API_KEY"):
+        openaiApi.get_client()
+
+app = create_app()
 
 if __name__ == "__main__":
     if not os.path.exists("static"):
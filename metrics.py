@@ -0,0 +1,260 @@
+# metrics.py
+#
+# In-process counters and histograms rendered in the Prometheus text
+# exposition format by /metrics. Values are per process: with several
+# Gunicorn workers each one reports its own, so scrape them per worker or
+# sum them in the query.
+#
+# Recording is a perf_counter() pair and a dict update under a lock, cheap
+# enough to leave on for every request. The cProfile breakdown is opt-in
+# (see profiling_requested).
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+
+# seconds; stages are often sub-millisecond, requests can take tens of seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts (not cumulative), then sum and count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket"
+                                 f"{_format_labels(self.labels, key, ('le', repr(float(bound))))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class Registry:
+    """
+    Metrics plus collectors: functions called at scrape time that return
+    exposition lines for values owned elsewhere (e.g. cache stats).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response (streamed bodies: until the first byte is ready).",
+    labels=("route", "method", "status")
+))
+stage_duration = registry.register(Histogram(
+    "stage_duration_seconds",
+    "Time spent in one stage of a request.",
+    labels=("stage",)
+))
+transits_total = registry.register(Counter(
+    "transits_total",
+    "Transit records computed, by route.",
+    labels=("route",)
+))
+llm_calls_total = registry.register(Counter(
+    "llm_calls_total",
+    "Upstream LLM calls, by kind and outcome.",
+    labels=("kind", "outcome")
+))
+
+def stage(name):
+    """
+    Context manager timing one stage: ephemeris, aspect_scan, figure_build,
+    json, llm.
+
+    "ephemeris" is recorded inside ephemeris.positions/longitudes and once
+    per chart in natal_chart.chart_at, so it covers every bulk lookup.
+    Single calc_ut/position calls (root finders, snapshots) aren't timed
+    one by one: the timer costs more than a cached lookup.
+    """
+    return stage_duration.time(stage=name)
+
+def cache_lines(caches):
+    """
+    Exposition lines for {cache name: stats dict} (hits, misses, size, ...),
+    read at scrape time from the caches' own counters.
+    """
+    lines = []
+    for field, metric, kind in (("hits", "cache_hits_total", "counter"),
+                                ("misses", "cache_misses_total", "counter"),
+                                ("coalesced", "cache_coalesced_total", "counter"),
+                                ("not_modified", "cache_not_modified_total", "counter"),
+                                ("size", "cache_entries", "gauge")):
+        samples = [(name, stats[field]) for name, stats in caches.items() if field in stats]
+        if samples:
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{cache="{name}"}} {value}' for name, value in samples)
+    return lines
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider with jsonify()'s serialization timed as "json".
+    """
+
+    def dumps(self, obj, **kwargs):
+        with stage("json"):
+            return super().dumps(obj, **kwargs)
+
+# -----------------------------------------------------------
+#   Opt-in per-request profiler
+# -----------------------------------------------------------
+# PROFILING=1 allows "?profile=1" or an "X-Profile: 1" header to return a
+# cProfile breakdown of the request instead of its normal body
+PROFILING_ENABLED = os.getenv("PROFILING", "0") == "1"
+PROFILE_LIMIT = int(os.getenv("PROFILE_LIMIT", "40"))
+PROFILE_SORT_KEYS = ("cumulative", "tottime", "calls")
+
+def profiling_requested(request, enabled=PROFILING_ENABLED):
+    if not enabled:
+        return False
+    return request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def profile_report(profiler, sort_by="cumulative", limit=PROFILE_LIMIT):
+    """
+    Stop `profiler` and return its pstats table as text.
+    """
+    profiler.disable()
+    if sort_by not in PROFILE_SORT_KEYS:
+        sort_by = "cumulative"
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+    return out.getvalue()
+
+# -----------------------------------------------------------
+#   Flask hooks
+# -----------------------------------------------------------
+def init_app(app):
+    """
+    Time every request into request_duration and serve the profile
+    breakdown when one was asked for (and app.config["PROFILING"] allows it).
+    """
+    app.json = TimedJSONProvider(app)
+    app.config.setdefault("PROFILING", PROFILING_ENABLED)
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        if profiling_requested(request, app.config["PROFILING"]):
+            g.profiler = start_profile()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            request_duration.observe(time.perf_counter() - start, route=route,
+                                     method=request.method, status=str(response.status_code))
+
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        if response.is_streamed:
+            # run the generator under the profiler too; the body is discarded
+            response.get_data()
+        report = profile_report(profiler, request.args.get("profile_sort", "cumulative"))
+        return Response(report, mimetype="text/plain",
+                        headers={"X-Profile-Status": str(response.status_code)})
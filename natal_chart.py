@@ -1,7 +1,12 @@
 # natal_chart.py
 
+import os
+import threading
+from functools import lru_cache
 import swisseph as swe
-from datetime import datetime
+import ephemeris
+import metrics
+from datetime import datetime, timedelta
 import pytz
 from timezonefinder import TimezoneFinder
 
@@ -21,78 +26,252 @@ def degrees_to_zodiac(deg):
     pos_in_sign = deg % 30
     return f"{degrees_to_dms(pos_in_sign)} {sign}"
 
-def get_local_timezone(lat, lon):
+# Swiss Ephemeris body codes, built once instead of on every lookup
+PLANET_CODES = {
+    "Sun": swe.SUN, "Moon": swe.MOON, "Mercury": swe.MERCURY, "Venus": swe.VENUS,
+    "Mars": swe.MARS, "Jupiter": swe.JUPITER, "Saturn": swe.SATURN,
+    "Uranus": swe.URANUS, "Neptune": swe.NEPTUNE, "Pluto": swe.PLUTO
+}
+
+class NatalChart:
     """
-    Attempt to find the local time zone based on lat/lon using TimezoneFinder.
-    If you don't want to do this, skip this step.
+    Numeric chart: ecliptic longitudes (degrees) and speeds (degrees/day),
+    one per planet in PLANET_CODES order. This is what gets stored, cached
+    and sent to the routes; degrees_to_zodiac strings are only for display.
     """
-    tf = TimezoneFinder()
-    tz_str = tf.timezone_at(lat=lat, lng=lon)
+
+    __slots__ = ("longitudes", "speeds")
+    planets = tuple(PLANET_CODES)
+
+    def __init__(self, longitudes, speeds=None):
+        if len(longitudes) != len(self.planets):
+            raise ValueError(f"Expected {len(self.planets)} longitudes, got {len(longitudes)}")
+        if speeds is None:
+            speeds = [0.0] * len(self.planets)
+        elif len(speeds) != len(self.planets):
+            raise ValueError(f"Expected {len(self.planets)} speeds, got {len(speeds)}")
+        self.longitudes = tuple(float(lon) % 360 for lon in longitudes)
+        self.speeds = tuple(float(speed) for speed in speeds)
+
+    @property
+    def retrograde(self):
+        return tuple(speed < 0 for speed in self.speeds)
+
+    def positions(self):
+        """
+        {planet: longitude}, the shape the transit and figure code works on.
+        """
+        return dict(zip(self.planets, self.longitudes))
+
+    def to_text(self):
+        return {planet: degrees_to_zodiac(lon) for planet, lon in zip(self.planets, self.longitudes)}
+
+    def to_json(self):
+        return {
+            "planets": list(self.planets),
+            "longitudes": list(self.longitudes),
+            "speeds": list(self.speeds),
+            "retrograde": list(self.retrograde),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Inverse of to_json. "planets", if present, gives the order of the
+        other lists; "speeds" is optional.
+        """
+        longitudes = data["longitudes"]
+        speeds = data.get("speeds")
+        order = data.get("planets")
+        if order is not None and list(order) != list(cls.planets):
+            if sorted(order) != sorted(cls.planets):
+                raise ValueError(f"Expected planets {list(cls.planets)}")
+            index = {planet: i for i, planet in enumerate(order)}
+            longitudes = [longitudes[index[planet]] for planet in cls.planets]
+            if speeds is not None:
+                speeds = [speeds[index[planet]] for planet in cls.planets]
+        return cls(longitudes, speeds)
+
+    def __eq__(self, other):
+        return (isinstance(other, NatalChart) and self.longitudes == other.longitudes
+                and self.speeds == other.speeds)
+
+    def __repr__(self):
+        return f"NatalChart({dict(zip(self.planets, self.longitudes))!r})"
+
+def julian_day(date):
+    """
+    Julian day (UT) for a datetime, using hours + minutes like the rest of the app.
+    """
+    return swe.julday(date.year, date.month, date.day, date.hour + date.minute/60.0)
+
+def datetime_from_julian_day(jd):
+    """
+    Naive UTC datetime for a Julian day, rounded to the second.
+    """
+    year, month, day, hours = swe.revjul(jd)
+    return datetime(year, month, day) + timedelta(seconds=round(hours * 3600))
+
+# One TimezoneFinder per process; set TIMEZONE_IN_MEMORY=1 to preload the
+# polygon data instead of reading it from disk on each lookup
+_timezone_finder = None
+_timezone_lock = threading.Lock()
+
+def get_timezone_finder():
+    global _timezone_finder
+    if _timezone_finder is None:
+        with _timezone_lock:
+            if _timezone_finder is None:
+                in_memory = os.getenv("TIMEZONE_IN_MEMORY", "0") == "1"
+                _timezone_finder = TimezoneFinder(in_memory=in_memory)
+    return _timezone_finder
+
+def _reset_timezone_finder_after_fork():
+    # the file-backed finder reads through one open file whose offset would be
+    # shared with the parent; the in-memory one is safe to inherit
+    global _timezone_finder, _timezone_lock
+    _timezone_lock = threading.Lock()
+    if os.getenv("TIMEZONE_IN_MEMORY", "0") != "1":
+        _timezone_finder = None
+
+os.register_at_fork(after_in_child=_reset_timezone_finder_after_fork)
+
+@lru_cache(maxsize=8192)
+def _timezone_at(lat, lon):
+    tz_str = get_timezone_finder().timezone_at(lat=lat, lng=lon)
     if not tz_str:
         # fallback if time zone isn't found
         return "UTC"
     return tz_str
 
-def calculate_natal_chart(dob, tob, lat, lon):
+def get_local_timezone(lat, lon):
+    """
+    Find the local time zone based on lat/lon using the shared TimezoneFinder.
+    Lookups are cached on coordinates rounded to 3 decimals (~100 m).
+    """
+    return _timezone_at(round(lat, 3), round(lon, 3))
+
+def local_to_utc(local_dt, lat, lon):
+    """
+    Treat a naive datetime as local time at lat/lon and return it as a
+    naive UTC datetime.
+    """
+    local_tz = pytz.timezone(get_local_timezone(lat, lon))
+    utc_dt = local_tz.localize(local_dt).astimezone(pytz.utc)
+    return utc_dt.replace(tzinfo=None)
+
+def calculate_natal_chart(dob, tob, lat, lon, topocentric=False):
+    """
+    Planet positions as text, e.g. {"Sun": "20° 30' 10.0000\" Aries", ...}.
+    See calculate_natal_chart_numeric for the steps.
+    """
+    return calculate_natal_chart_numeric(dob, tob, lat, lon, topocentric).to_text()
+
+def calculate_natal_chart_numeric(dob, tob, lat, lon, topocentric=False):
     """
     1) Convert local date/time to UTC using lat/lon-based time zone
     2) Convert that UTC time to Julian day
-    3) Use swe.set_topo(lon, lat, alt=0) for topocentric
-    4) Return planet positions in ecliptic longitudes as text
+    3) Build a calculation context for the observer (topocentric on request;
+       swe.set_topo alone never changed calc_ut results, so the default
+       stays geocentric)
+    4) Return planet longitudes and speeds as a NatalChart
     """
     # 0) parse input date/time as a naive datetime
     dt_str = f"{dob} {tob}"  # e.g. "2024-05-10 13:30"
     local_dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
 
-    # 1) Figure out time zone from lat/lon
-    tz_str = get_local_timezone(lat, lon)
-    local_tz = pytz.timezone(tz_str)
-    # 2) localize
-    local_dt = local_tz.localize(local_dt)
-    # 3) convert to UTC
-    utc_dt = local_dt.astimezone(pytz.utc)
+    # 1) - 3) find the time zone from lat/lon, localize, convert to UTC
+    utc_dt = local_to_utc(local_dt, lat, lon)
 
     # 4) compute Julian day from the UTC datetime
     julday = swe.julday(utc_dt.year, utc_dt.month, utc_dt.day,
                         utc_dt.hour + utc_dt.minute/60.0)
 
-    # 5) topocentric
-    swe.set_topo(lon, lat, 0)
+    # 5) observer context (no shared swe state touched unless topocentric)
+    context = ephemeris.CalculationContext(lat, lon, topocentric=topocentric)
 
     # 6) compute planet positions
-    bodies = {
-        'Sun': swe.SUN, 'Moon': swe.MOON, 'Mercury': swe.MERCURY, 'Venus': swe.VENUS,
-        'Mars': swe.MARS, 'Jupiter': swe.JUPITER, 'Saturn': swe.SATURN,
-        'Uranus': swe.URANUS, 'Neptune': swe.NEPTUNE, 'Pluto': swe.PLUTO
-    }
+    return chart_at(context, julday)
+
+def chart_at(context, julday, cached=True):
+    """
+    NatalChart for one instant (Julian day, UT) and calculation context.
+    cached=False keeps the instant out of the shared ephemeris LRU.
+    """
+    longitudes, speeds = [], []
+    with metrics.stage("ephemeris"):
+        for code in PLANET_CODES.values():
+            pos, _ = context.calc_ut(julday, code, cached)
+            longitudes.append(pos[0])
+            speeds.append(pos[3])
+    return NatalChart(longitudes, speeds)
+
+def calculate_natal_charts(records, topocentric=False):
+    """
+    Batch version of calculate_natal_chart.
+
+    `records` is a list of dicts with dob, tob, lat, lon. Records are grouped
+    by time zone (one pytz lookup per zone) and by observer location (one
+    calculation context per place), then computed together.
+
+    Returns one dict per record, in input order: {"chart": {...}, "numeric":
+    NatalChart.to_json()} on success or {"error": "..."} if that record
+    couldn't be computed.
+    """
+    results = [None] * len(records)
+
+    # 1) parse and resolve time zones, grouping records by zone
+    by_timezone = {}
+    for i, record in enumerate(records):
+        try:
+            local_dt = datetime.strptime(f"{record['dob']} {record['tob']}", "%Y-%m-%d %H:%M")
+            lat = float(record["lat"])
+            lon = float(record["lon"])
+            tz_str = get_local_timezone(lat, lon)
+        except (KeyError, TypeError, ValueError) as e:
+            results[i] = {"error": f"Invalid record: {e}"}
+            continue
+        by_timezone.setdefault(tz_str, []).append((i, local_dt, lat, lon))
+
+    # 2) localize each group, then regroup by observer location
+    by_observer = {}
+    for tz_str, group in by_timezone.items():
+        local_tz = pytz.timezone(tz_str)
+        for i, local_dt, lat, lon in group:
+            try:
+                utc_dt = local_tz.localize(local_dt).astimezone(pytz.utc)
+            except Exception as e:
+                results[i] = {"error": str(e)}
+                continue
+            by_observer.setdefault((lat, lon), []).append((i, utc_dt))
 
-    positions = {}
-    for name, code in bodies.items():
-        pos, _ = swe.calc_ut(julday, code)
-        positions[name] = degrees_to_zodiac(pos[0])
+    # 3) one calculation context per observer, positions for every record;
+    #    birth instants are one-off, so they bypass the ephemeris LRU rather
+    #    than evicting the dates every transit request shares
+    for (lat, lon), group in by_observer.items():
+        context = ephemeris.CalculationContext(lat, lon, topocentric=topocentric)
+        for i, utc_dt in group:
+            try:
+                chart = chart_at(context, julian_day(utc_dt), cached=False)
+                results[i] = {"chart": chart.to_text(), "numeric": chart.to_json()}
+            except Exception as e:
+                results[i] = {"error": str(e)}
 
-    return positions
+    return results
 
 def get_transit_position(date, planet_name, lat=None, lon=None):
     """
     Return planet ecliptic longitude in degrees for a given date.
-    Optionally can do topocentric if lat/lon are provided.
+    Topocentric if lat/lon are provided, geocentric otherwise.
     If you also need local time -> UTC, do it outside or within this function.
     """
-    planet_mapping = {
-        "Sun": swe.SUN, "Moon": swe.MOON, "Mercury": swe.MERCURY, "Venus": swe.VENUS,
-        "Mars": swe.MARS, "Jupiter": swe.JUPITER, "Saturn": swe.SATURN,
-        "Uranus": swe.URANUS, "Neptune": swe.NEPTUNE, "Pluto": swe.PLUTO
-    }
-    if planet_name not in planet_mapping:
+    if planet_name not in PLANET_CODES:
         raise ValueError("Unknown planet: " + planet_name)
 
-    # If we want topocentric, set it
-    if lat is not None and lon is not None:
-        swe.set_topo(lon, lat, 0)
+    # If we want topocentric, use a context for that observer
+    context = ephemeris.CalculationContext(lat, lon, topocentric=True)
 
     # If `date` is local, you might want to do a time zone conversion here
     # For simplicity, assume date is UTC
-    jd = swe.julday(date.year, date.month, date.day, date.hour + date.minute/60.0)
-    pos, _ = swe.calc_ut(jd, planet_mapping[planet_name])
-    return pos[0]
+    jd = julian_day(date)
+    return context.longitude(jd, PLANET_CODES[planet_name])
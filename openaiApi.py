@@ -1,33 +1,81 @@
 import os
 from re import T
+import threading
 from dotenv import load_dotenv
-from openai import OpenAI
 import time
+import analysis_cache
+import metrics
 
 load_dotenv()
-client = OpenAI()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("Missing OPENAI_API_KEY environment variable.")
 
-def analyze_data_with_chat_completion(data):
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "o1-mini")
+
+# Created on first use: importing this module needs no API key and doesn't
+# pay for importing the openai package
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not os.getenv("OPENAI_API_KEY"):
+                    raise ValueError("Missing OPENAI_API_KEY environment variable.")
+                from openai import OpenAI
+                _client = OpenAI()
+    return _client
+
+ANALYSIS_PROMPT = """
+You're an excellent and experienced intellectual expert in a role of an adept astrologist that provides discursive, extensive and enlightening deep analysis with qualitative and quantitative writing style; analyze all of the following data progressively ensuring no transit is omitted for any day, including multiple transits on the same day and provide an insightful and deep analysis of every and each of the transits for every and each day, furthermore provide 'Warnings', 'Advices' and 'Guidances' regarding 'Daily Actions' for all of the timespan depending on every and each of the transits and corresponding intensities, additionally provide detailed 'Daily Insights' and 'Conclusions' taking into account data as a whole in fluent and follow up style, furthermore explaining provided with insightful and holistic style of full data analysis.
+"""
+
+SUMMARY_PROMPT = """
+You're an excellent and experienced intellectual expert in a role of an adept astrologist. The following are your own analyses of consecutive periods of one transit timespan, in chronological order; write the overall 'Daily Insights' and 'Conclusions' for the whole timespan in fluent and follow up style, connecting the periods, highlighting the most intense transits and the main 'Warnings', 'Advices' and 'Guidances' without repeating every day.
+"""
+
+def analyze_data_with_chat_completion(data, client=None, model=None, use_cache=True):
     """
     Sends all transit data to OpenAI's Chat Completion API in a single request.
     Returns the model's response text.
+
+    Identical (normalized) prompts for the same model are answered from
+    analysis_cache, and concurrent identical requests share one call.
+    `client` defaults to the module client; tests can pass a stub.
     """
-    system_message = """
-You're an excellent and experienced intellectual expert in a role of an adept astrologist that provides discursive, extensive and enlightening deep analysis with qualitative and quantitative writing style; analyze all of the following data progressively ensuring no transit is omitted for any day, including multiple transits on the same day and provide an insightful and deep analysis of every and each of the transits for every and each day, furthermore provide 'Warnings', 'Advices' and 'Guidances' regarding 'Daily Actions' for all of the timespan depending on every and each of the transits and corresponding intensities, additionally provide detailed 'Daily Insights' and 'Conclusions' taking into account data as a whole in fluent and follow up style, furthermore explaining provided with insightful and holistic style of full data analysis.
-"""
+    return _cached_completion(ANALYSIS_PROMPT + data, client, model, use_cache)
+
+def summarize_analyses(partials, client=None, model=None, use_cache=True):
+    """
+    Final pass of the chunked analysis: `partials` is a list of
+    (period label, analysis text) in date order.
+    """
+    sections = "\n\n".join(f"### {label}\n{analysis}" for label, analysis in partials)
+    return _cached_completion(SUMMARY_PROMPT + sections, client, model, use_cache)
+
+def _cached_completion(content, client, model, use_cache):
+    client = client or get_client()
+    model = model or ANALYSIS_MODEL
+    if not use_cache:
+        return _complete(client, model, content)
+    return analysis_cache.cache.get_or_compute(
+        content, model, lambda: _complete(client, model, content)
+    )
+
+def _complete(client, model, content):
     try:
-        response = client.chat.completions.create(
-            model="o1-mini",
-            messages=[
-                {"role": "user", "content": system_message + data}
-            ],
-            store=True,
-        )
+        with metrics.stage("llm"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": content}
+                ],
+                store=True,
+            )
+        metrics.llm_calls_total.inc(kind="completion", outcome="ok")
         return response.choices[0].message.content
     except Exception as e:
+        metrics.llm_calls_total.inc(kind="completion", outcome="error")
         raise Exception(f"Chat Completion error: {str(e)}")
 
 if __name__ == "__main__":
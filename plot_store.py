@@ -0,0 +1,167 @@
+# plot_store.py
+#
+# Content-addressed store for the natal wheel <iframe> pages. Identical
+# charts share one entry and different users never overwrite each other.
+#
+# Pages are kept in memory and, unless PLOT_STORE_DIR is "none", also
+# written to a directory shared by every worker on the host: the iframe's
+# follow-up GET /plots/<key>.html usually lands on a different Gunicorn
+# worker than the POST that rendered it.
+#
+# PLOT_STORE_DIR  = shared directory (default cache/plots next to this file)
+# PLOT_STORE_SIZE = max pages kept (memory and directory each)
+# PLOT_STORE_TTL  = seconds a page stays servable
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class PlotStore:
+    """
+    LRU of rendered HTML pages keyed by a hash of what they show, backed by
+    one <key>.html file per page in `directory` (if given). Entries also
+    expire `ttl` seconds after they were stored.
+
+    The directory is only listed when this worker's running count of its
+    pages goes over `maxsize`; other workers' writes are picked up then.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, directory=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._count = None  # pages in directory, counted on first use
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.html")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, html = entry
+                if expires_at >= time.time():
+                    self._entries.move_to_end(key)
+                    return html
+                del self._entries[key]
+        return self._read(key)
+
+    def put(self, key, html):
+        with self._lock:
+            self._remember(key, time.time() + self.ttl, html)
+        self._write(key, html)
+
+    def _remember(self, key, expires_at, html):
+        # caller holds self._lock
+        self._entries[key] = (expires_at, html)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _read(self, key):
+        # a page rendered by another worker (or before a restart)
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            expires_at = os.path.getmtime(path) + self.ttl
+            if expires_at < time.time():
+                os.remove(path)
+                with self._lock:
+                    if self._count:
+                        self._count -= 1
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                html = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._remember(key, expires_at, html)
+        return html
+
+    def _write(self, key, html):
+        if not self.directory:
+            return
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory, exist_ok=True)
+            if self._count is None:
+                self._count = self._count_pages()
+            is_new = not os.path.exists(self._path(key))
+            # write then rename, so readers never see a partial page
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp_path, self._path(key))
+            with self._lock:
+                if is_new:
+                    self._count += 1
+                if self._count > self.maxsize:
+                    self._prune()
+        except OSError as e:
+            print(f"Plot store: could not write {key}: {e}")
+
+    def _count_pages(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".html"))
+
+    def _prune(self):
+        # caller holds self._lock; drop expired pages, then the oldest
+        # beyond maxsize
+        now = time.time()
+        pages = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".html"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime + self.ttl < now:
+                    os.remove(path)
+                else:
+                    pages.append((mtime, path))
+            except OSError:
+                pass  # removed by another worker
+        pages.sort()
+        for _, path in pages[:max(0, len(pages) - self.maxsize)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._count = min(len(pages), self.maxsize)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        # cheap enough for every /metrics scrape: the directory is listed
+        # at most once
+        if not self.directory:
+            with self._lock:
+                return len(self._entries)
+        with self._lock:
+            if self._count is None:
+                try:
+                    self._count = self._count_pages()
+                except OSError:
+                    return 0
+            return self._count
+
+def plot_key(*parts):
+    """
+    Stable content hash of JSON-serializable inputs (positions, aspects, ...).
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+_directory = os.getenv("PLOT_STORE_DIR",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "plots"))
+store = PlotStore(
+    maxsize=int(os.getenv("PLOT_STORE_SIZE", "256")),
+    ttl=int(os.getenv("PLOT_STORE_TTL", "3600")),
+    directory=None if _directory == "none" else _directory,
+)
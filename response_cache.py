@@ -0,0 +1,196 @@
+# response_cache.py
+#
+# HTTP-level cache for endpoints whose response depends only on the JSON
+# request body. Entries are keyed by a canonical hash of (path, body), carry
+# an ETag of the response bytes, and answer If-None-Match with 304.
+#
+# RESPONSE_CACHE_BACKEND = memory (default) | disk | none
+# RESPONSE_CACHE_SIZE    = max entries (default 512)
+# RESPONSE_CACHE_BYTES   = max total body bytes of the memory backend (default 64 MB)
+# RESPONSE_CACHE_DIR     = directory for the disk backend (default cache/responses
+#                          next to this file)
+# RESPONSE_CACHE_MAX_AGE = Cache-Control max-age in seconds (default 3600)
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, g, request
+
+class MemoryBackend:
+    """
+    In-process LRU of (etag, body, mimetype), bounded both by entry count
+    and by the total size of the bodies (a few multi-year waveform payloads
+    can be larger than hundreds of wheel snapshots).
+    """
+
+    def __init__(self, maxsize=512, max_bytes=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old[1])
+            self._entries[key] = entry
+            self.nbytes += size
+            while len(self._entries) > self.maxsize or self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted[1])
+
+class DiskBackend:
+    """
+    One JSON file per entry under `directory`, shared by every worker on the
+    host. The oldest files are pruned once there are more than `maxsize`.
+    A response that can't be written (disk full, read-only) just isn't
+    cached.
+    """
+
+    def __init__(self, directory, maxsize=512):
+        self.directory = directory
+        self.maxsize = maxsize
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._count = len(os.listdir(directory))
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return stored["etag"], stored["body"].encode("utf-8"), stored["mimetype"]
+
+    def set(self, key, entry):
+        etag, body, mimetype = entry
+        path = self._path(key)
+        is_new = not os.path.exists(path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"etag": etag, "body": body.decode("utf-8"), "mimetype": mimetype}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Response cache: could not write {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if is_new:
+                self._count += 1
+            if self._count > self.maxsize:
+                self._prune()
+
+    def _prune(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        paths = [os.path.join(self.directory, name) for name in names
+                 if name.endswith(".json")]
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in paths[:max(len(paths) - self.maxsize, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._count = min(len(paths), self.maxsize)
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "responses")
+
+def make_backend(name=None):
+    name = name or os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+    maxsize = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+    if name == "memory":
+        return MemoryBackend(maxsize, int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024))))
+    if name == "disk":
+        return DiskBackend(os.getenv("RESPONSE_CACHE_DIR", DEFAULT_DIR), maxsize)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown response cache backend: '{name}'")
+
+backend = make_backend()
+MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "3600"))
+stats = {"hits": 0, "misses": 0, "not_modified": 0}
+_stats_lock = threading.Lock()
+
+def _count(name):
+    # requests run on several threads per worker; += on a dict item isn't atomic
+    with _stats_lock:
+        stats[name] += 1
+
+def request_key():
+    """
+    Canonical hash of the route and its JSON body, or None if the body
+    isn't JSON (those requests just bypass the cache).
+    """
+    body = request.get_json(silent=True)
+    if body is None:
+        return None
+    canonical = json.dumps([request.path, body], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _respond(etag, body, mimetype, status):
+    if etag in request.if_none_match:
+        _count("not_modified")
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"private, max-age={MAX_AGE}"
+    response.headers["X-Cache"] = status
+    return response
+
+def cached_response(view):
+    """
+    Decorator for deterministic JSON endpoints. Successful responses are
+    stored; errors and streamed responses pass through untouched.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request_key() if backend is not None else None
+        # a profiled request (metrics.init_app) should profile the real work
+        if key is None or g.get("profiler") is not None:
+            return view(*args, **kwargs)
+
+        entry = backend.get(key)
+        if entry is not None:
+            _count("hits")
+            return _respond(*entry, "HIT")
+
+        _count("misses")
+        response = view(*args, **kwargs)
+        if isinstance(response, tuple) or not isinstance(response, Response):
+            return response
+        if response.status_code != 200 or response.is_streamed:
+            return response
+
+        body = response.get_data()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        entry = (etag, body, response.mimetype)
+        backend.set(key, entry)
+        return _respond(*entry, "MISS")
+    return wrapper
@@ -0,0 +1,83 @@
+# tests/conftest.py
+#
+# Shared fixtures. The LLM routes run against StubOpenAI, so no API key or
+# network is needed.
+
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class StubOpenAI:
+    """
+    Just enough of openai.OpenAI for the chat and analysis routes. Every
+    call is recorded in `calls`; `run_error` makes runs.create raise.
+    Completions answer with reply(content), by default "analysis of <n>
+    chars"; `prompts` keeps the content of each completion request.
+    """
+
+    def __init__(self, deltas=("Hello", ", world"), run_error=None, reply=None):
+        self.deltas = list(deltas)
+        self.run_error = run_error
+        self.reply = reply or (lambda content: f"analysis of {len(content)} chars")
+        self.calls = []
+        self.prompts = []
+        self._lock = threading.Lock()
+        self.beta = SimpleNamespace(threads=SimpleNamespace(
+            create=self._create_thread,
+            messages=SimpleNamespace(create=self._create_message),
+            runs=SimpleNamespace(create=self._create_run),
+        ))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+
+    def _create_thread(self):
+        self.calls.append("threads.create")
+        return SimpleNamespace(id="thread_stub")
+
+    def _create_message(self, thread_id, role, content):
+        self.calls.append("messages.create")
+
+    def _create_run(self, thread_id, assistant_id, stream=False):
+        self.calls.append("runs.create")
+        if self.run_error is not None:
+            raise self.run_error
+        return iter([
+            SimpleNamespace(event="thread.message.delta", data=SimpleNamespace(
+                delta=SimpleNamespace(content=[SimpleNamespace(
+                    type="text", text=SimpleNamespace(value=value))])))
+            for value in self.deltas
+        ])
+
+    def _complete(self, model, messages, **kwargs):
+        content = messages[-1]["content"]
+        with self._lock:  # the chunked analysis calls from several threads
+            self.calls.append("completions.create")
+            self.prompts.append(content)
+        return SimpleNamespace(choices=[SimpleNamespace(
+            message=SimpleNamespace(content=self.reply(content)))])
+
+@pytest.fixture
+def stub_client():
+    return StubOpenAI()
+
+@pytest.fixture
+def fresh_analysis_cache(monkeypatch, tmp_path):
+    """
+    Point analysis_cache.cache at an empty database under tmp_path.
+    """
+    import analysis_cache
+    cache = analysis_cache.AnalysisCache(str(tmp_path / "analysis.sqlite3"))
+    monkeypatch.setattr(analysis_cache, "cache", cache)
+    return cache
+
+@pytest.fixture
+def make_app():
+    import main
+
+    def make(client):
+        return main.create_app({"OPENAI_CLIENT": client, "TESTING": True})
+    return make
@@ -0,0 +1,212 @@
+# tests/test_analysis_cache.py
+#
+# AnalysisCache: stored analyses are reused (also across instances sharing a
+# file), identical requests in flight at the same time share one call, and a
+# broken database only costs the caching.
+
+import threading
+import time
+
+import pytest
+
+import analysis_cache
+import openaiApi
+from analysis_cache import AnalysisCache
+from conftest import StubOpenAI
+
+TEXT = "• Day: 2024-01-01\n· Mars-Square-Sun (0.980)\n"
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+def test_created_lazily(tmp_path):
+    path = tmp_path / "sub" / "analysis.sqlite3"
+    cache = AnalysisCache(str(path))
+    assert not path.exists()
+
+    cache.get_or_compute(TEXT, "m", lambda: "result")
+    assert path.exists()
+
+def test_hit_after_first_call(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "result"
+
+    assert cache.get_or_compute(TEXT, "m", compute) == "result"
+    assert cache.get_or_compute(TEXT, "m", compute) == "result"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert len(cache) == 1
+
+def test_key_ignores_whitespace_but_not_model(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"))
+    cache.get_or_compute(TEXT, "m", lambda: "first")
+
+    reformatted = "\r\n\n" + TEXT.replace("\n", "   \r\n") + "\n\n"
+    assert cache.get_or_compute(reformatted, "m", lambda: "second") == "first"
+    assert cache.get_or_compute(TEXT, "other-model", lambda: "third") == "third"
+
+def test_shared_between_instances(tmp_path):
+    path = str(tmp_path / "a.sqlite3")
+    AnalysisCache(path).get_or_compute(TEXT, "m", lambda: "stored")
+
+    # e.g. another worker, or this one after a restart
+    other = AnalysisCache(path)
+    assert other.get_or_compute(TEXT, "m", lambda: pytest.fail("recomputed")) == "stored"
+
+def test_expired_entries_are_recomputed(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"), ttl=-1)
+    cache.get_or_compute(TEXT, "m", lambda: "old")
+    assert cache.get_or_compute(TEXT, "m", lambda: "new") == "new"
+
+def test_size_limit_drops_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"), maxsize=2)
+    for i in range(3):
+        cache.get_or_compute(f"text {i}", "m", lambda i=i: f"result {i}")
+        time.sleep(0.01)  # distinct access times
+    assert len(cache) == 2
+    assert cache.get(analysis_cache.analysis_key("text 0", "m")) is None
+
+def test_concurrent_requests_share_one_call(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"))
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "shared"
+
+    results = []
+    def request():
+        results.append(cache.get_or_compute(TEXT, "m", compute))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    wait_for(lambda: cache.stats()["inflight"] == 1)
+    followers = [threading.Thread(target=request) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    wait_for(lambda: cache.stats()["coalesced"] == 3)
+
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert results == ["shared"] * 4
+    assert len(calls) == 1
+    assert cache.stats()["inflight"] == 0
+
+def test_concurrent_requests_share_the_error(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"))
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    errors = []
+    def request():
+        try:
+            cache.get_or_compute(TEXT, "m", compute)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    wait_for(lambda: cache.stats()["inflight"] == 1)
+    follower = threading.Thread(target=request)
+    follower.start()
+    wait_for(lambda: cache.stats()["coalesced"] == 1)
+
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ["upstream down"] * 2
+    assert cache.stats()["errors"] == 1
+    # failures aren't stored: the next request tries again
+    assert cache.get_or_compute(TEXT, "m", lambda: "recovered") == "recovered"
+
+def test_analysis_uses_cache(fresh_analysis_cache):
+    client = StubOpenAI()
+    first = openaiApi.analyze_data_with_chat_completion(TEXT, client=client, model="m")
+    second = openaiApi.analyze_data_with_chat_completion(TEXT, client=client, model="m")
+
+    assert first == second
+    assert client.calls == ["completions.create"]
+    assert client.prompts[0] == openaiApi.ANALYSIS_PROMPT + TEXT
+
+def test_analysis_without_cache(fresh_analysis_cache):
+    client = StubOpenAI()
+    for _ in range(2):
+        openaiApi.analyze_data_with_chat_completion(TEXT, client=client, model="m",
+                                                    use_cache=False)
+    assert client.calls == ["completions.create"] * 2
+    assert len(fresh_analysis_cache) == 0
+
+def test_analyze_route_is_cached(make_app, fresh_analysis_cache):
+    client = StubOpenAI()
+    test_client = make_app(client).test_client()
+    responses = [test_client.post("/analyze_waveforms", json={"waveforms_text": TEXT})
+                 for _ in range(2)]
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].get_json() == responses[1].get_json()
+    assert client.calls == ["completions.create"]
+
+def test_connections_are_closed(tmp_path, monkeypatch):
+    opened = []
+    real_connect = analysis_cache.sqlite3.connect
+
+    def connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+    monkeypatch.setattr(analysis_cache.sqlite3, "connect", connect)
+
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"))
+    cache.get_or_compute(TEXT, "m", lambda: "result")
+    cache.get_or_compute(TEXT, "m", lambda: "result")
+    len(cache)
+
+    assert opened
+    for conn in opened:
+        with pytest.raises(analysis_cache.sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")  # closed
+
+def test_broken_database_falls_back_to_compute(tmp_path):
+    path = tmp_path / "a.sqlite3"
+    path.write_bytes(b"this is not a database" * 100)
+    cache = AnalysisCache(str(path))
+
+    assert cache.get_or_compute(TEXT, "m", lambda: "uncached") == "uncached"
+    assert cache.get_or_compute(TEXT, "m", lambda: "again") == "again"
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["size"] == 0
+
+def test_leader_rechecks_after_registering(tmp_path, monkeypatch):
+    cache = AnalysisCache(str(tmp_path / "a.sqlite3"))
+    cache.set(analysis_cache.analysis_key(TEXT, "m"), "m", "stored meanwhile")
+    real_get = cache.get
+    lookups = []
+
+    def get(key):
+        # the first lookup ran just before another leader stored its result
+        lookups.append(key)
+        return None if len(lookups) == 1 else real_get(key)
+    monkeypatch.setattr(cache, "get", get)
+
+    assert cache.get_or_compute(TEXT, "m", lambda: pytest.fail("called the LLM")) \
+        == "stored meanwhile"
+    assert len(lookups) == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 0
@@ -0,0 +1,61 @@
+# tests/test_bulk_waveforms.py
+#
+# Many charts against one shared ephemeris pass give each chart exactly what
+# it gets on its own, whatever the chart sizes and block size.
+
+import json
+import random
+from datetime import datetime
+
+import pytest
+
+import transit_waveforms
+
+PLANETS = ["Sun", "Moon", "Mercury", "Venus", "Mars", "Saturn"]
+ASPECTS = ["Conjunction", "Opposition", "Trine", "Square", "Sextile"]
+START, END = datetime(2024, 1, 1), datetime(2024, 3, 31)
+
+@pytest.fixture
+def charts():
+    rng = random.Random(13)
+    # different sizes, so shorter charts are padded and masked
+    return [{planet: rng.uniform(0, 360) for planet in PLANETS[:size]}
+            for size in (6, 1, 4, 6, 3)]
+
+@pytest.mark.parametrize("block_cells", [None, 5000])
+def test_bulk_matches_per_chart(charts, block_cells):
+    bulk = list(transit_waveforms.iter_transit_waveforms_bulk(
+        charts, START, END, PLANETS, ASPECTS, block_cells=block_cells))
+
+    assert [index for index, _ in bulk] == list(range(len(charts)))
+    for chart, (_, transits) in zip(charts, bulk):
+        assert transits == transit_waveforms.calculate_transit_waveforms_vectorized(
+            chart, START, END, PLANETS, ASPECTS)
+
+def test_bulk_without_selections(charts):
+    assert list(transit_waveforms.iter_transit_waveforms_bulk(
+        charts[:2], START, END, [], ASPECTS)) == [(0, []), (1, [])]
+    assert list(transit_waveforms.iter_transit_waveforms_bulk(
+        [], START, END, PLANETS, ASPECTS)) == []
+
+def test_bulk_route_matches_per_chart_route(make_app, stub_client, charts):
+    client = make_app(stub_client).test_client()
+    window = {"start_date": "2024-01-01", "end_date": "2024-03-31",
+              "transiting_planets": PLANETS, "aspects": ASPECTS}
+    records = [{"chartName": f"chart {i}", "natal_chart": chart}
+               for i, chart in enumerate(charts)]
+    records.insert(2, {"chartName": "broken", "natal_chart": {"Sun": "nowhere"}})
+
+    response = client.post("/generate_waveforms_bulk", json=dict(window, natal_charts=records))
+    messages = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [m.get("index") for m in messages[:-1]] == list(range(len(records)))
+    assert "error" in messages[2] and messages[2]["chartName"] == "broken"
+    assert messages[-1]["done"] and messages[-1]["charts"] == len(records)
+    for message, record in zip(messages[:-1], records):
+        if record["chartName"] == "broken":
+            continue
+        single = client.post("/generate_waveforms_data",
+                             json=dict(window, natal_chart=record["natal_chart"]))
+        assert message["chartName"] == record["chartName"]
+        assert message["transits"] == single.get_json()["transits"]
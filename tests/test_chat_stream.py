@@ -0,0 +1,91 @@
+# tests/test_chat_stream.py
+#
+# /chat/stream must give its concurrency slot back however the stream ends:
+# normally, with an upstream error, or with the client going away.
+
+import json
+import threading
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+import chat_stream
+from conftest import StubOpenAI
+
+@pytest.fixture(autouse=True)
+def one_slot(monkeypatch):
+    # a single slot, so a leaked one shows up as the next chat being busy
+    monkeypatch.setattr(chat_stream, "_slots", threading.BoundedSemaphore(1))
+
+def slot_is_free():
+    try:
+        chat_stream.acquire_slot(timeout=0).release()
+    except chat_stream.ChatBusy:
+        return False
+    return True
+
+def frames(body):
+    return [json.loads(line[len("data: "):])
+            for line in body.decode("utf-8").split("\n\n") if line]
+
+def open_stream(app, message="hi"):
+    # calls the WSGI app directly: unlike the test client, this returns the
+    # body iterable without starting it, like a server whose client is gone
+    environ = EnvironBuilder(path="/chat/stream", method="POST",
+                             json={"message": message}).get_environ()
+    status = []
+    body = app.wsgi_app(environ, lambda s, headers, exc_info=None: status.append(s))
+    return status[0], body
+
+def test_stream_releases_slot_when_done(make_app, stub_client):
+    response = make_app(stub_client).test_client().post("/chat/stream", json={"message": "hi"})
+
+    messages = frames(response.get_data())
+    assert messages[0] == {"thread_id": "thread_stub"}
+    assert [m["delta"] for m in messages[1:-1]] == ["Hello", ", world"]
+    assert messages[-1] == {"done": True, "reply": "Hello, world"}
+    assert slot_is_free()
+
+def test_stream_releases_slot_on_upstream_error(make_app):
+    client = StubOpenAI(run_error=RuntimeError("upstream down"))
+    response = make_app(client).test_client().post("/chat/stream", json={"message": "hi"})
+
+    assert frames(response.get_data())[-1] == {"error": "upstream down"}
+    assert slot_is_free()
+
+def test_stream_releases_slot_when_closed_before_start(make_app, stub_client):
+    status, body = open_stream(make_app(stub_client))
+    assert status.startswith("200")
+    assert not slot_is_free()
+
+    body.close()
+
+    assert stub_client.calls == []
+    assert slot_is_free()
+
+def test_stream_releases_slot_when_closed_mid_stream(make_app, stub_client):
+    _, body = open_stream(make_app(stub_client))
+    first = next(iter(body))
+    assert json.loads(first[len(b"data: "):]) == {"thread_id": "thread_stub"}
+
+    body.close()
+
+    assert "runs.create" not in stub_client.calls
+    assert slot_is_free()
+
+def test_stream_busy_when_no_slot(make_app, stub_client):
+    held = chat_stream.acquire_slot(timeout=0)
+    try:
+        response = make_app(stub_client).test_client().post(
+            "/chat/stream", json={"message": "hi"}
+        )
+    finally:
+        held.release()
+    assert response.status_code == 503
+    assert stub_client.calls == []
+
+def test_slot_release_is_idempotent():
+    slot = chat_stream.acquire_slot(timeout=0)
+    slot.release()
+    slot.release()  # a second release must not over-release the semaphore
+    assert slot_is_free()
@@ -0,0 +1,127 @@
+# tests/test_chunked_analysis.py
+#
+# Splitting waveform text into whole-day chunks, and the map-reduce
+# analysis: chunks may finish in any order, the summary sees them in date
+# order.
+
+import json
+import threading
+
+import pytest
+
+import openaiApi
+from chunked_analysis import analyze_in_chunks, split_waveform_text
+from conftest import StubOpenAI
+
+HEADER = "The following transit periods are provided in the format: ..."
+
+def waveform_text(days):
+    lines = [HEADER, ""]
+    for day in days:
+        lines += [f"• Day: {day}", f"· Mars-Square-Sun on {day}", ""]
+    return "\n".join(lines)
+
+DAYS = ["2024-01-30", "2024-01-31", "2024-02-01", "2024-02-15", "2024-03-02"]
+
+def test_split_by_month():
+    chunks = split_waveform_text(waveform_text(DAYS))
+
+    assert [label for label, _ in chunks] == [
+        "2024-01-30 to 2024-01-31", "2024-02-01 to 2024-02-15", "2024-03-02"
+    ]
+    for (_, text), days in zip(chunks, (DAYS[:2], DAYS[2:4], DAYS[4:])):
+        # the header is repeated, and every day keeps its own lines
+        assert text.startswith(HEADER + "\n\n• Day: " + days[0])
+        assert [line for line in text.splitlines() if "Mars" in line] == [
+            f"· Mars-Square-Sun on {day}" for day in days
+        ]
+
+def test_split_by_days():
+    chunks = split_waveform_text(waveform_text(DAYS), period=2)
+    assert [label for label, _ in chunks] == [
+        "2024-01-30 to 2024-01-31", "2024-02-01", "2024-02-15", "2024-03-02"
+    ]
+
+def test_split_accepts_plain_day_lines():
+    text = "Day: 2024-01-01\n1. Mars ...\n\nDay: 2024-02-01\n1. Venus ...\n"
+    chunks = split_waveform_text(text)
+    assert chunks == [("2024-01-01", "Day: 2024-01-01\n1. Mars ..."),
+                      ("2024-02-01", "Day: 2024-02-01\n1. Venus ...")]
+
+def test_split_without_days():
+    assert split_waveform_text("free text") == [("all", "free text")]
+    assert split_waveform_text("  \n") == []
+
+def test_summary_sees_chunks_in_date_order(fresh_analysis_cache):
+    january_may_finish = threading.Event()
+
+    def reply(content):
+        if content.startswith(openaiApi.SUMMARY_PROMPT):
+            return "summary"
+        day = content.split("• Day: ")[1][:10]
+        if day.startswith("2024-01"):
+            january_may_finish.wait(5)
+        return f"analysis from {day}"
+
+    client = StubOpenAI(reply=reply)
+    progress = analyze_in_chunks(waveform_text(DAYS), client=client, model="m")
+
+    assert next(progress) == {"chunks": ["2024-01-30 to 2024-01-31",
+                                         "2024-02-01 to 2024-02-15", "2024-03-02"]}
+    # February and March come back while January is still waiting
+    first = [next(progress), next(progress)]
+    assert sorted(m["chunk"] for m in first) == [1, 2]
+    january_may_finish.set()
+    rest = list(progress)
+    assert rest[0]["chunk"] == 0
+    assert rest[-1] == {"summary": "summary"}
+
+    summary_prompt = client.prompts[-1]
+    assert summary_prompt.startswith(openaiApi.SUMMARY_PROMPT)
+    sections = [line for line in summary_prompt.splitlines() if line.startswith("### ")]
+    assert sections == ["### 2024-01-30 to 2024-01-31", "### 2024-02-01 to 2024-02-15",
+                        "### 2024-03-02"]
+    assert summary_prompt.index("analysis from 2024-01-30") < \
+        summary_prompt.index("analysis from 2024-02-01") < \
+        summary_prompt.index("analysis from 2024-03-02")
+
+def test_single_chunk_is_its_own_summary(fresh_analysis_cache):
+    client = StubOpenAI(reply=lambda content: "only")
+    messages = list(analyze_in_chunks(waveform_text(DAYS[:2]), client=client, model="m"))
+
+    assert messages[-1] == {"summary": "only"}
+    assert client.calls == ["completions.create"]
+
+def test_failed_chunk_is_left_out_of_the_summary(fresh_analysis_cache):
+    def reply(content):
+        if "• Day: 2024-02-01" in content:
+            raise RuntimeError("rate limited")
+        return "summary" if content.startswith(openaiApi.SUMMARY_PROMPT) else "fine"
+
+    client = StubOpenAI(reply=reply)
+    messages = list(analyze_in_chunks(waveform_text(DAYS), client=client, model="m"))
+
+    errors = [m for m in messages if "error" in m]
+    assert [(m["chunk"], m["label"]) for m in errors] == [(1, "2024-02-01 to 2024-02-15")]
+    assert "rate limited" in errors[0]["error"]
+    sections = [line for line in client.prompts[-1].splitlines() if line.startswith("### ")]
+    assert sections == ["### 2024-01-30 to 2024-01-31", "### 2024-03-02"]
+
+def test_every_chunk_failing_raises(fresh_analysis_cache):
+    def reply(content):
+        raise RuntimeError("down")
+
+    with pytest.raises(ValueError, match="Every chunk failed"):
+        list(analyze_in_chunks(waveform_text(DAYS), client=StubOpenAI(reply=reply), model="m"))
+
+def test_stream_route(make_app, fresh_analysis_cache):
+    client = StubOpenAI(reply=lambda content: "summary" if content.startswith(
+        openaiApi.SUMMARY_PROMPT) else "part")
+    response = make_app(client).test_client().post(
+        "/analyze_waveforms_stream", json={"waveforms_text": waveform_text(DAYS)}
+    )
+
+    messages = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert messages[0]["chunks"][0] == "2024-01-30 to 2024-01-31"
+    assert messages[-2] == {"summary": "summary"}
+    assert messages[-1] == {"done": True}
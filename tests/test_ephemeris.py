@@ -0,0 +1,39 @@
+# tests/test_ephemeris.py
+#
+# The shared calc_ut LRU: short ranges fill it, long bulk ranges only read
+# from it so they can't evict the hot dates.
+
+import pytest
+
+import ephemeris
+
+@pytest.fixture
+def small_cache(monkeypatch):
+    cache = ephemeris.EphemerisCache(maxsize=100)
+    monkeypatch.setattr(ephemeris, "cache", cache)
+    monkeypatch.setattr(ephemeris, "BULK_CACHE_LIMIT", 10)
+    monkeypatch.setattr(ephemeris, "get_table", lambda: None)
+    return cache
+
+def test_short_ranges_are_cached(small_cache):
+    jds = [2460310.5 + i for i in range(5)]
+    ephemeris.longitudes(jds, [0, 1])
+    assert len(small_cache._entries) == 10
+
+    ephemeris.longitudes(jds, [0, 1])
+    assert small_cache.stats()["hits"] == 10
+
+def test_bulk_ranges_read_but_do_not_fill(small_cache):
+    hot = [2460310.5]
+    ephemeris.longitudes(hot, [0])
+
+    jds = [2460310.5 + i for i in range(50)]
+    lons = ephemeris.longitudes(jds, [0, 1])
+
+    assert list(small_cache._entries) == [(hot[0], 0, ephemeris.DEFAULT_FLAGS, None)]
+    assert small_cache.stats()["hits"] == 1
+    assert lons[0, 0] == ephemeris.calc_ut(hot[0], 0)[0][0]
+
+def test_uncached_positions_skip_the_cache(small_cache):
+    ephemeris.positions([2460310.5], [0], cached=False)
+    assert len(small_cache._entries) == 0
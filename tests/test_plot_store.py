@@ -0,0 +1,44 @@
+# tests/test_plot_store.py
+#
+# PlotStore: pages are shared through the directory, which is pruned to
+# maxsize without being listed on every write.
+
+import os
+
+import plot_store
+from plot_store import PlotStore
+
+def test_page_written_by_another_worker(tmp_path):
+    PlotStore(directory=str(tmp_path)).put("abc", "<html>chart</html>")
+    assert PlotStore(directory=str(tmp_path)).get("abc") == "<html>chart</html>"
+
+def test_directory_listed_only_over_maxsize(tmp_path, monkeypatch):
+    store = PlotStore(maxsize=3, directory=str(tmp_path))
+    listings = []
+    real_listdir = os.listdir
+
+    def listdir(path):
+        listings.append(path)
+        return real_listdir(path)
+    monkeypatch.setattr(plot_store.os, "listdir", listdir)
+
+    for i in range(3):
+        store.put(f"page{i}", "<html></html>")
+        os.utime(store._path(f"page{i}"), None)
+    store.put("page0", "<html>again</html>")  # overwriting isn't a new page
+    assert len(listings) == 1  # the first count
+    assert len(store) == 3
+
+    store.put("page3", "<html></html>")
+    assert len(listings) == 2
+    assert len(store) == 3
+    assert len(real_listdir(tmp_path)) == 3
+    assert len(listings) == 2  # len() uses the running count
+
+def test_len_counts_existing_pages_once(tmp_path, monkeypatch):
+    PlotStore(directory=str(tmp_path)).put("abc", "<html></html>")
+    store = PlotStore(directory=str(tmp_path))
+    assert len(store) == 1
+
+    monkeypatch.setattr(plot_store.os, "listdir", lambda path: 1 / 0)
+    assert len(store) == 1
@@ -0,0 +1,85 @@
+# tests/test_response_cache.py
+#
+# Response cache: repeated requests are answered from the cache, a matching
+# If-None-Match gets 304 without a body, the disk backend prunes to its size
+# and a write that fails only skips caching.
+
+import os
+
+import pytest
+
+import response_cache
+from response_cache import DiskBackend, MemoryBackend
+
+ENTRY = ("etag", b'{"ok": true}', "application/json")
+
+def test_disk_backend_round_trip(tmp_path):
+    backend = DiskBackend(str(tmp_path))
+    backend.set("key", ENTRY)
+    assert backend.get("key") == ENTRY
+    assert backend.get("other") is None
+
+def test_disk_backend_prunes_oldest(tmp_path):
+    backend = DiskBackend(str(tmp_path), maxsize=2)
+    for i in range(3):
+        backend.set(f"key{i}", ENTRY)
+        os.utime(backend._path(f"key{i}"), (i, i))  # distinct ages
+    assert sorted(os.listdir(tmp_path)) == ["key1.json", "key2.json"]
+    assert backend._count == 2
+
+def test_disk_backend_skips_failed_writes(tmp_path):
+    backend = DiskBackend(str(tmp_path / "responses"))
+    os.rmdir(backend.directory)  # e.g. wiped underneath the worker
+
+    backend.set("key", ENTRY)
+    assert backend.get("key") is None
+    assert backend._count == 0
+
+def test_default_directory_is_next_to_the_module():
+    assert response_cache.DEFAULT_DIR == os.path.join(
+        os.path.dirname(os.path.abspath(response_cache.__file__)), "cache", "responses")
+
+WAVEFORMS = {"natal_chart": {"Sun": 10.0, "Moon": 200.0}, "start_date": "2024-01-01",
+             "end_date": "2024-01-31", "transiting_planets": ["Sun", "Mars"],
+             "aspects": ["Conjunction", "Square"]}
+
+@pytest.fixture
+def client(make_app, stub_client, monkeypatch):
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend())
+    monkeypatch.setattr(response_cache, "stats", dict.fromkeys(response_cache.stats, 0))
+    return make_app(stub_client).test_client()
+
+def test_if_none_match_returns_304(client):
+    first = client.post("/generate_waveforms_data", json=WAVEFORMS)
+    assert first.status_code == 200
+    assert first.headers["X-Cache"] == "MISS"
+    etag = first.headers["ETag"]
+
+    revalidated = client.post("/generate_waveforms_data", json=WAVEFORMS,
+                              headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b""
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.headers["X-Cache"] == "HIT"
+    assert response_cache.stats == {"hits": 1, "misses": 1, "not_modified": 1}
+
+def test_stale_etag_gets_the_body(client):
+    first = client.post("/generate_waveforms_data", json=WAVEFORMS)
+    second = client.post("/generate_waveforms_data", json=WAVEFORMS,
+                         headers={"If-None-Match": '"something-else"'})
+    assert second.status_code == 200
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.get_data() == first.get_data()
+
+def test_key_ignores_json_key_order(client):
+    client.post("/generate_waveforms_data", json=WAVEFORMS)
+    reordered = dict(reversed(list(WAVEFORMS.items())))
+    assert client.post("/generate_waveforms_data", json=reordered).headers["X-Cache"] == "HIT"
+
+def test_errors_are_not_cached(client):
+    bad = dict(WAVEFORMS, resolution="weekly")
+    for _ in range(2):
+        response = client.post("/generate_waveforms_data", json=bad)
+        assert response.status_code == 400
+        assert "X-Cache" not in response.headers
+    assert response_cache.stats["hits"] == 0
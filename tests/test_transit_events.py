@@ -0,0 +1,117 @@
+# tests/test_transit_events.py
+#
+# find_transit_events against the dense daily engine: the same transits are
+# in orb on every day, the reported times really are orb edges and
+# perfections, and finding them costs about one ephemeris pass.
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import swisseph as swe
+
+import ephemeris
+import natal_chart
+import transit_events
+import transit_waveforms
+from transit_waveforms import aspects, orb
+
+PLANETS = ["Jupiter", "Mars", "Mercury", "Moon", "Neptune",
+           "Pluto", "Saturn", "Sun", "Uranus", "Venus"]
+ASPECTS = ["Conjunction", "Opposition", "Trine", "Square", "Sextile"]
+START, END = datetime(2024, 1, 1), datetime(2024, 12, 31)
+
+@pytest.fixture
+def natal():
+    rng = random.Random(3)
+    return {planet: rng.uniform(0, 360) for planet in PLANETS}
+
+@pytest.fixture
+def calc_ut_calls(monkeypatch):
+    """
+    Counts swe.calc_ut calls, with no daily table and a cold ephemeris LRU
+    so both engines pay for every position.
+    """
+    calls = [0]
+    real = swe.calc_ut
+
+    def counting(*args):
+        calls[0] += 1
+        return real(*args)
+    monkeypatch.setattr(ephemeris.swe, "calc_ut", counting)
+    monkeypatch.setattr(ephemeris, "get_table", lambda: None)
+    ephemeris.cache.clear()
+    return calls
+
+def deviation(when, planet, target):
+    lon, speed = ephemeris.position(natal_chart.julian_day(when) + when.second / 86400,
+                                    natal_chart.PLANET_CODES[planet])
+    return transit_events._deviation(lon, target), abs(speed)
+
+def test_events_match_dense_engine(natal):
+    events = transit_events.find_transit_events(natal, START, END, PLANETS, ASPECTS)
+    dense = transit_waveforms.calculate_transit_waveforms_vectorized(
+        natal, START, END, PLANETS, ASPECTS
+    )
+    assert events
+
+    dense_days = {(t['transiting_planet'], t['natal_planet'], t['aspect'], t['date'])
+                  for t in dense}
+    event_days = set()
+    near_edge = set()
+    for e in events:
+        key = (e['transiting_planet'], e['natal_planet'], e['aspect'])
+        opened = e['entry'] or START
+        closed = e['exit'] or END + timedelta(days=1)
+        day = datetime(opened.year, opened.month, opened.day)
+        while day <= min(closed, END):
+            if opened <= day <= closed:
+                event_days.add(key + (day,))
+            day += timedelta(days=1)
+        for edge in (e['entry'], e['exit']):
+            # rounded to the second: a midnight that close could go either way
+            if edge is not None and abs((edge - edge.replace(hour=0, minute=0, second=0))
+                                        .total_seconds()) <= 2:
+                near_edge.add(key + (edge.replace(hour=0, minute=0, second=0),))
+
+    assert dense_days - near_edge == event_days - near_edge
+
+def test_event_times_are_exact(natal):
+    events = transit_events.find_transit_events(natal, START, END, PLANETS, ASPECTS)
+
+    for e in events:
+        target = natal[e['natal_planet']] + aspects[e['aspect']]
+        for when in e['exact']:
+            g, speed = deviation(when, e['transiting_planet'], target)
+            # times are rounded to the second
+            assert abs(g) <= speed / 86400 + 1e-6
+        for when in (e['entry'], e['exit']):
+            if when is not None:
+                g, speed = deviation(when, e['transiting_planet'], target)
+                assert abs(abs(g) - orb[e['aspect']]) <= speed / 86400 + 1e-6
+
+def test_events_cost_about_one_ephemeris_pass(natal, calc_ut_calls):
+    transit_waveforms.calculate_transit_waveforms_vectorized(natal, START, END, PLANETS, ASPECTS)
+    dense_calls = calc_ut_calls[0]
+    assert dense_calls == 366 * len(PLANETS)
+
+    calc_ut_calls[0] = 0
+    events = transit_events.find_transit_events(natal, START, END, PLANETS, ASPECTS)
+    crossings = sum(len(e['exact']) + (e['entry'] is not None) + (e['exit'] is not None)
+                    for e in events)
+    # one daily pass per body, plus one call per crossing to polish its time
+    assert calc_ut_calls[0] <= dense_calls + len(PLANETS) + crossings
+    assert calc_ut_calls[0] < 2 * dense_calls
+
+def test_window_open_at_both_ends():
+    # Pluto barely moves: conjunct its own position for the whole month
+    start, end = datetime(2024, 3, 1), datetime(2024, 3, 31)
+    lon, _ = ephemeris.position(natal_chart.julian_day(start), natal_chart.PLANET_CODES["Pluto"])
+    events = transit_events.find_transit_events({"Pluto": lon}, start, end,
+                                                ["Pluto"], ["Conjunction"])
+    assert len(events) == 1
+    assert events[0]['entry'] is None and events[0]['exit'] is None
+
+def test_unknown_planet():
+    with pytest.raises(ValueError, match="Unknown planet: Foo"):
+        transit_events.find_transit_events({"Sun": 0.0}, START, END, ["Foo"], ["Trine"])
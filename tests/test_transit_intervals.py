@@ -0,0 +1,62 @@
+# tests/test_transit_intervals.py
+#
+# Intervals round-trip with the dense daily engine: grouping its records
+# gives the interval engine's output, and expanding that gives the records
+# back, whatever the block size.
+
+import random
+from datetime import datetime
+
+import pytest
+
+import transit_waveforms
+from transit_intervals import calculate_transit_intervals, expand_intervals, \
+    intervals_from_transits
+
+PLANETS = ["Sun", "Moon", "Mercury", "Mars", "Saturn", "Pluto"]
+ASPECTS = ["Conjunction", "Opposition", "Trine", "Square", "Sextile"]
+START, END = datetime(2024, 1, 1), datetime(2024, 6, 30)
+
+@pytest.fixture
+def natal():
+    rng = random.Random(7)
+    return {planet: rng.uniform(0, 360) for planet in PLANETS}
+
+@pytest.fixture
+def dense(natal):
+    return transit_waveforms.calculate_transit_waveforms_vectorized(
+        natal, START, END, PLANETS, ASPECTS)
+
+def record_key(t):
+    return (t['date'], t['transiting_planet'], t['natal_planet'], t['aspect'])
+
+def interval_key(i):
+    return (i.start, i.transiting_planet, i.natal_planet, i.aspect)
+
+@pytest.mark.parametrize("block_cells", [None, 1000])
+def test_grouped_records_match_intervals(natal, dense, block_cells):
+    intervals = calculate_transit_intervals(natal, START, END, PLANETS, ASPECTS,
+                                            block_cells=block_cells)
+    grouped = intervals_from_transits(dense)
+    assert intervals
+
+    assert sorted(map(interval_key, grouped)) == sorted(map(interval_key, intervals))
+    by_key = {interval_key(i): i for i in grouped}
+    for interval in intervals:
+        assert interval.intensities.tolist() == \
+            pytest.approx(by_key[interval_key(interval)].intensities.tolist())
+
+def test_expanded_intervals_match_records(natal, dense):
+    intervals = calculate_transit_intervals(natal, START, END, PLANETS, ASPECTS)
+    expanded = expand_intervals(intervals)
+
+    dates = [t['date'] for t in expanded]
+    assert dates == sorted(dates)
+    assert sorted(map(record_key, expanded)) == sorted(map(record_key, dense))
+    intensity = {record_key(t): t['intensity'] for t in dense}
+    for t in expanded:
+        assert t['intensity'] == pytest.approx(intensity[record_key(t)])
+
+def test_round_trip(dense):
+    assert sorted(expand_intervals(intervals_from_transits(dense)), key=record_key) == \
+        sorted(dense, key=record_key)
@@ -0,0 +1,89 @@
+# tests/test_transit_waveforms.py
+#
+# The vectorized engine against the scalar reference loop
+# (calculate_transit_waveforms): same transits, same intensities. Adaptive
+# resolution only adds to the daily results.
+
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import transit_intervals
+import transit_waveforms
+from transit_waveforms import aspects, orb
+
+PLANETS = ["Sun", "Moon", "Mercury", "Venus", "Mars", "Jupiter", "Saturn", "Pluto"]
+ASPECTS = list(aspects)
+START, END = datetime(2024, 1, 1), datetime(2024, 4, 30)
+
+@pytest.fixture
+def natal():
+    rng = random.Random(11)
+    return {planet: rng.uniform(0, 360) for planet in PLANETS}
+
+def key(t):
+    return (t['date'], t['transiting_planet'], t['natal_planet'], t['aspect'])
+
+def test_vectorized_matches_scalar_loop(natal):
+    scalar = transit_waveforms.calculate_transit_waveforms(natal, START, END, PLANETS, ASPECTS)
+    vectorized = transit_waveforms.calculate_transit_waveforms_vectorized(
+        natal, START, END, PLANETS, ASPECTS)
+    assert scalar
+
+    assert [key(t) for t in vectorized] == [key(t) for t in scalar]
+    assert [t['intensity'] for t in vectorized] == \
+        pytest.approx([t['intensity'] for t in scalar], abs=1e-9)
+
+def test_score_transits_matches_scalar_arithmetic(natal):
+    rng = np.random.default_rng(5)
+    longitudes = rng.uniform(0, 360, size=(50, 3))
+    # exact aspects and orb edges, where the folding matters most
+    longitudes[0] = [list(natal.values())[0] + 180, list(natal.values())[1] - 8, 0.0]
+
+    angle_diff, in_orb, intensity = transit_waveforms.score_transits(longitudes, natal, ASPECTS)
+
+    for d, p in np.ndindex(longitudes.shape):
+        for n, natal_position in enumerate(natal.values()):
+            for a, aspect_name in enumerate(ASPECTS):
+                diff = abs((longitudes[d, p] - natal_position - aspects[aspect_name]) % 360)
+                if diff > 180:
+                    diff = 360 - diff
+                assert angle_diff[d, p, n, a] == pytest.approx(diff, abs=1e-9)
+                assert in_orb[d, p, n, a] == (diff <= orb[aspect_name])
+                assert intensity[d, p, n, a] == pytest.approx(1 - diff / orb[aspect_name])
+
+def test_empty_selections():
+    assert transit_waveforms.calculate_transit_waveforms_vectorized(
+        {"Sun": 0.0}, START, END, [], ASPECTS) == []
+    assert transit_waveforms.calculate_transit_waveforms_vectorized(
+        {"Sun": 0.0}, END, START, PLANETS, ASPECTS) == []
+
+@pytest.mark.parametrize("engine", ["records", "intervals"])
+def test_adaptive_is_a_superset_of_daily(natal, engine):
+    def run(resolution):
+        if engine == "intervals":
+            intervals = transit_intervals.calculate_transit_intervals(
+                natal, START, END, PLANETS, ASPECTS, resolution=resolution)
+            return transit_intervals.expand_intervals(intervals)
+        return transit_waveforms.calculate_transit_waveforms_vectorized(
+            natal, START, END, PLANETS, ASPECTS, resolution=resolution)
+
+    daily = {key(t): t['intensity'] for t in run("daily")}
+    adaptive = {key(t): t['intensity'] for t in run("adaptive")}
+
+    assert daily.keys() <= adaptive.keys()
+    for k, value in daily.items():
+        # the 00:00 sample is one of the day's samples
+        assert adaptive[k] >= value - 1e-12
+    # the Moon crosses orbs within a day, so hourly samples catch more
+    assert any(k[1] == "Moon" for k in adaptive.keys() - daily.keys())
+
+def test_adaptive_keeps_exact_positions_for_slow_bodies(natal):
+    slow = ["Jupiter", "Saturn", "Pluto"]
+    daily = transit_waveforms.calculate_transit_waveforms_vectorized(
+        natal, START, END, slow, ASPECTS)
+    adaptive = transit_waveforms.calculate_transit_waveforms_vectorized(
+        natal, START, END, slow, ASPECTS, resolution="adaptive")
+    assert adaptive == daily
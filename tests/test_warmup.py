@@ -0,0 +1,30 @@
+# tests/test_warmup.py
+#
+# The Gunicorn master's warmup must not import openai (and with it httpx):
+# with the gevent worker class those have to be imported after the workers
+# monkey-patch the standard library.
+
+import os
+import subprocess
+import sys
+
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_master_warmup_leaves_openai_to_the_workers():
+    script = "import sys, main; main.warmup(); print('openai' in sys.modules, 'httpx' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    assert output.split() == ["False", "False"]
+
+def test_worker_warmup_creates_the_client(monkeypatch):
+    created = []
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(main.openaiApi, "get_client", lambda: created.append(1))
+    main.warmup_worker()
+    assert created == [1]
+
+    monkeypatch.delenv("OPENAI_API_KEY")
+    main.warmup_worker()
+    assert created == [1]
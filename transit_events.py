@@ -0,0 +1,218 @@
+# transit_events.py
+#
+# Event-based transit search: instead of sampling once a day, find the exact
+# moments a transit enters orb, perfects and leaves orb.
+
+import numpy as np
+import natal_chart
+import ephemeris
+import ephemeris_table
+from transit_waveforms import aspects, orb
+
+# Upper bounds on |daily motion| in degrees/day. A body can't close a gap
+# faster than this, so sampling every min orb / max speed days can't step
+# over a whole orb.
+MAX_SPEED = {
+    "Moon": 15.5, "Mercury": 2.3, "Venus": 1.3, "Sun": 1.05, "Mars": 0.8,
+    "Jupiter": 0.26, "Saturn": 0.14, "Uranus": 0.07, "Neptune": 0.05, "Pluto": 0.05
+}
+
+# Sampling step around stations (1 hour) and root tolerance (~0.1 s)
+MIN_STEP = 1 / 24
+TOLERANCE = 1e-6
+
+def _deviation(lon, target):
+    # signed distance from exact, folded into [-180, 180)
+    return (lon - target + 180) % 360 - 180
+
+def _solve(f, a, b, fa, fb):
+    """
+    Safeguarded Newton on many brackets at once: f(t) -> (values,
+    derivatives) for an array of times, with a sign change in every
+    [a, b]. Steps that leave their bracket fall back to bisection.
+    """
+    a, b, fa = a.copy(), b.copy(), fa.copy()
+    t = a - fa * (b - a) / (fb - fa)
+    live = np.ones(len(t), dtype=bool)
+    for _ in range(60):
+        live &= b - a >= TOLERANCE
+        if not live.any():
+            break
+        value, slope = f(t)
+        left = (value < 0) == (fa < 0)
+        a = np.where(live & left, t, a)
+        fa = np.where(live & left, value, fa)
+        b = np.where(live & ~left, t, b)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = t - value / slope
+        step = np.where((slope != 0) & (a < step) & (step < b), step, (a + b) / 2)
+        settled = (value == 0) | (np.abs(step - t) < TOLERANCE)
+        t = np.where(live & (value != 0), step, t)
+        live &= ~settled
+    return t
+
+def _track_body(body, max_speed, min_orb, jd_start, jd_end):
+    """
+    One body's motion over the range, shared by all its targets.
+
+    The body is computed once per day; in between, its longitude comes from
+    cubic Hermite interpolation on longitude and speed. Returns
+    (track, times, longitudes): track(t) -> (longitude, speed) anywhere in
+    the range, and the track sampled finely enough that the body can't
+    cross a whole orb between two samples. Away from stations the deviation
+    from any target is then monotonic between samples, so every crossing
+    shows up as a sign change; days with a station are sampled every
+    MIN_STEP.
+    """
+    if jd_end <= jd_start:
+        lons, speeds = ephemeris.positions([jd_start], [body], cached=False)
+        return None, np.array([jd_start]), lons[:, 0]
+
+    days = int(np.ceil(jd_end - jd_start))
+    jds = np.append(jd_start + np.arange(days, dtype=np.float64), jd_end)
+    lons, speeds = ephemeris.positions(jds, [body], cached=False)
+    lons, speeds = lons[:, 0], speeds[:, 0]
+    widths = np.diff(jds)
+
+    per_day = max(int(np.ceil(max_speed / min_orb)), 1)
+    stations = (speeds[:-1] < 0) != (speeds[1:] < 0)
+    counts = np.where(stations, max(per_day, int(round(1 / MIN_STEP))), per_day)
+    step = np.repeat(np.arange(len(widths)), counts)
+    first = np.cumsum(counts) - counts
+    fraction = (np.arange(counts.sum()) - first[step]) / counts[step]
+    sampled, _ = ephemeris_table.hermite(lons[step], speeds[step] * widths[step],
+                                         lons[step + 1], speeds[step + 1] * widths[step],
+                                         fraction)
+    times = np.append(jds[step] + fraction * widths[step], jds[-1])
+    sampled = np.append(np.mod(sampled, 360), lons[-1])
+
+    def track(t):
+        i = np.clip(np.searchsorted(jds, t, side="right") - 1, 0, len(widths) - 1)
+        h = widths[i]
+        lon, speed = ephemeris_table.hermite(lons[i], speeds[i] * h, lons[i + 1],
+                                             speeds[i + 1] * h, (t - jds[i]) / h)
+        return np.mod(lon, 360), speed / h
+
+    return track, times, sampled
+
+def _crossing(position, targets, orbs, exact):
+    """
+    f(t) for _solve: the deviation from each target where `exact`, the
+    distance to the orb edge elsewhere.
+    """
+    def f(t):
+        lon, speed = position(t)
+        g = _deviation(lon, targets)
+        value = np.where(exact, g, np.abs(g) - orbs)
+        slope = np.where(exact | (g >= 0), speed, -speed)
+        return value, slope
+    return f
+
+def _scan_targets(body, track, times, lons, targets, orbs):
+    """
+    Windows of every target longitude of one body (see _track_body).
+
+    Returns one list per target of dicts with 'entry', 'exact' (list) and
+    'exit' julian days. Entry/exit are None when the window is already open
+    at the first sample or still open at the last.
+    """
+    def position(t):
+        lons, speeds = ephemeris.positions(t, [body], cached=False)
+        return lons[:, 0], speeds[:, 0]
+
+    # (samples x targets) signed deviations, checked for crossings all at once
+    g = _deviation(lons[:, None], targets[None, :])
+    outside = np.abs(g) - orbs[None, :]
+    inside = outside <= 0
+    entered = inside[:-1] != inside[1:]
+    # a sign change near zero is a perfection; one near +-180 is just the fold
+    perfected = (((g[:-1] < 0) != (g[1:] < 0))
+                 & (np.abs(g[:-1]) < 90) & (np.abs(g[1:]) < 90))
+
+    edge_i, edge_k = np.nonzero(entered)
+    exact_i, exact_k = np.nonzero(perfected)
+    i = np.concatenate([edge_i, exact_i])
+    k = np.concatenate([edge_k, exact_k])
+    exact = np.arange(len(i)) >= len(edge_i)
+
+    crossings = [[] for _ in range(len(targets))]
+    if len(i):
+        a, b = times[i], times[i + 1]
+        fa = np.where(exact, g[i, k], outside[i, k])
+        fb = np.where(exact, g[i + 1, k], outside[i + 1, k])
+        when = _solve(_crossing(track, targets[k], orbs[k], exact), a, b, fa, fb)
+        # one Newton step on the real ephemeris from the interpolated roots
+        value, slope = _crossing(position, targets[k], orbs[k], exact)(when)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            better = when - value / slope
+        when = np.where((slope != 0) & (a <= better) & (better <= b), better, when)
+
+        kinds = np.where(exact, "exact", np.where(inside[i, k], "exit", "entry"))
+        for target, t, kind in zip(k.tolist(), when.tolist(), kinds.tolist()):
+            crossings[target].append((t, kind))
+
+    results = []
+    for k in range(len(targets)):
+        windows = []
+        window = {"entry": None, "exact": [], "exit": None} if inside[0, k] else None
+        for when, kind in sorted(crossings[k]):
+            if kind == "entry":
+                window = {"entry": when, "exact": [], "exit": None}
+            elif kind == "exact" and window is not None:
+                window["exact"].append(when)
+            elif kind == "exit" and window is not None:
+                window["exit"] = when
+                windows.append(window)
+                window = None
+        if window is not None:
+            windows.append(window)
+        results.append(windows)
+    return results
+
+def find_transit_events(natal_positions, start_date, end_date,
+                        transiting_planets, selected_aspects):
+    """
+    Orb entry, exact perfection(s) and orb exit for every transit between
+    start_date and end_date, using the same deviation as
+    calculate_transit_waveforms.
+
+    1) Each transiting body is computed once per day for all its natal x
+       aspect targets and interpolated in between (_track_body)
+    2) Entry/exit and perfection brackets are sign changes of that one
+       longitude array against every target at once
+    3) Only those brackets are solved, with a root finder on the
+       interpolated deviation and its speed, then one Newton step on the
+       real ephemeris
+    """
+    jd_start = natal_chart.julian_day(start_date)
+    jd_end = natal_chart.julian_day(end_date)
+    to_datetime = natal_chart.datetime_from_julian_day
+
+    events = []
+    for planet in transiting_planets:
+        if planet not in natal_chart.PLANET_CODES:
+            raise ValueError("Unknown planet: " + planet)
+        body = natal_chart.PLANET_CODES[planet]
+        pairs = [(natal_planet, aspect_name)
+                 for natal_planet in natal_positions for aspect_name in selected_aspects]
+        if not pairs:
+            continue
+        targets = np.array([natal_positions[n] + aspects[a] for n, a in pairs])
+        orbs = np.array([orb[a] for _, a in pairs], dtype=np.float64)
+        track, times, lons = _track_body(body, MAX_SPEED[planet], orbs.min(),
+                                         jd_start, jd_end)
+        for (natal_planet, aspect_name), windows in zip(
+                pairs, _scan_targets(body, track, times, lons, targets, orbs)):
+            for w in windows:
+                opened = w["entry"] if w["entry"] is not None else jd_start
+                events.append((opened, {
+                    'transiting_planet': planet,
+                    'natal_planet': natal_planet,
+                    'aspect': aspect_name,
+                    'entry': to_datetime(w["entry"]) if w["entry"] is not None else None,
+                    'exact': [to_datetime(jd) for jd in w["exact"]],
+                    'exit': to_datetime(w["exit"]) if w["exit"] is not None else None,
+                }))
+
+    events.sort(key=lambda e: e[0])
+    return [event for _, event in events]
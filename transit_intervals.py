@@ -0,0 +1,316 @@
+# transit_intervals.py
+#
+# Sparse transit results: one TransitInterval per contiguous run of in-orb
+# days of a (transiting planet, natal planet, aspect) triple, instead of one
+# record per day. A slow Pluto square that spans 300 days is one object with
+# 300 samples rather than 300 dicts, and the figure, the JSON list and the
+# LLM text are all derived from the intervals.
+
+import base64
+from datetime import timedelta
+import numpy as np
+import metrics
+import transit_waveforms
+
+class TransitInterval:
+    """
+    One run of consecutive in-orb days. `intensities` holds one sample per
+    day from `start` to `end` inclusive. With adaptive resolution,
+    `minutes` holds the time of day (minutes after 00:00 UT) each of those
+    values was reached, transit_waveforms.NO_TIME for bodies sampled once a
+    day; otherwise it is None.
+    """
+
+    __slots__ = ("transiting_planet", "natal_planet", "aspect", "start", "intensities",
+                 "minutes")
+
+    def __init__(self, transiting_planet, natal_planet, aspect, start, intensities,
+                 minutes=None):
+        self.transiting_planet = transiting_planet
+        self.natal_planet = natal_planet
+        self.aspect = aspect
+        self.start = start
+        self.intensities = intensities
+        self.minutes = minutes
+
+    @property
+    def label(self):
+        return f"{self.transiting_planet} {self.aspect} {self.natal_planet}"
+
+    @property
+    def days(self):
+        return len(self.intensities)
+
+    @property
+    def end(self):
+        return self.start + timedelta(days=len(self.intensities) - 1)
+
+    @property
+    def peak(self):
+        return self.start + timedelta(days=int(np.argmax(self.intensities)))
+
+    @property
+    def peak_intensity(self):
+        return float(np.max(self.intensities))
+
+    @property
+    def peak_time(self):
+        """
+        "HH:MM" (UT) of the peak on its day, or None without sub-daily samples.
+        """
+        if self.minutes is None:
+            return None
+        minute = int(self.minutes[int(np.argmax(self.intensities))])
+        if minute == transit_waveforms.NO_TIME:
+            return None
+        return f"{minute // 60:02d}:{minute % 60:02d}"
+
+    def transits(self):
+        """
+        The daily records this interval stands for.
+        """
+        return [
+            {
+                'date': self.start + timedelta(days=i),
+                'transiting_planet': self.transiting_planet,
+                'natal_planet': self.natal_planet,
+                'aspect': self.aspect,
+                'intensity': value,
+            }
+            for i, value in enumerate(self.intensities.tolist())
+        ]
+
+    def __repr__(self):
+        return (f"TransitInterval({self.label!r}, {self.start:%Y-%m-%d}..{self.end:%Y-%m-%d}, "
+                f"peak {self.peak:%Y-%m-%d} {self.peak_intensity:.3f})")
+
+def _runs(in_orb):
+    """
+    (row, start, stop) of every run of True along the day axis of a
+    (days x ...) mask, rows being the flattened trailing axes. Sorted by
+    row, then start.
+    """
+    rows = in_orb.reshape(in_orb.shape[0], -1).T
+    padded = np.zeros((rows.shape[0], rows.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = rows
+    edges = np.diff(padded, axis=1)
+    # both come out sorted by row, then day, so starts and stops pair up
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_stops = np.nonzero(edges == -1)
+    return run_rows, run_starts, run_stops
+
+def calculate_transit_intervals(natal_positions, start_date, end_date,
+                                transiting_planets, selected_aspects,
+                                block_cells=None, resolution="daily"):
+    """
+    Interval version of calculate_transit_waveforms_vectorized (same
+    intensities, grouped into runs).
+
+    1) Days are scanned in blocks of about block_cells scored cells, so the
+       dense (days x planets x natal x aspects) arrays never cover the
+       whole range
+    2) Runs are found per block from the edges of the in-orb mask; a run
+       reaching the end of a block is continued by one starting the next
+    3) Intervals come out ordered by start date, then by planet, natal
+       planet and aspect in input order
+
+    resolution="adaptive" scores each day from per-planet sampling steps
+    (transit_waveforms.score_transits_adaptive).
+    """
+    dates = transit_waveforms.transit_dates(start_date, end_date)
+    if not dates or not transiting_planets or not natal_positions or not selected_aspects:
+        return []
+
+    natal_names = list(natal_positions.keys())
+    shape = (len(transiting_planets), len(natal_names), len(selected_aspects))
+    cells_per_day = (transit_waveforms.samples_per_day(transiting_planets, selected_aspects, resolution)
+                     * shape[1] * shape[2])
+    block = max(1, (block_cells or transit_waveforms.BULK_BLOCK_CELLS) // cells_per_day)
+
+    finished = []   # (start index, row, [sample arrays], [minute arrays])
+    open_runs = {}  # row -> run still in orb at the end of the last block
+    for offset in range(0, len(dates), block):
+        block_dates = dates[offset:offset + block]
+        in_orb, intensity, minutes = transit_waveforms.daily_scores(
+            block_dates, natal_positions, transiting_planets, selected_aspects, resolution,
+            with_times=True
+        )
+        with metrics.stage("aspect_scan"):
+            intensity_rows = intensity.reshape(len(block_dates), -1).T
+            minute_rows = None if minutes is None else minutes.reshape(len(block_dates), -1).T
+            still_open = {}
+            for row, run_start, run_stop in zip(*(a.tolist() for a in _runs(in_orb))):
+                samples = intensity_rows[row, run_start:run_stop].copy()
+                run = open_runs.pop(row, None) if run_start == 0 else None
+                if run is None:
+                    run = (offset + run_start, row, [], [])
+                run[2].append(samples)
+                if minute_rows is not None:
+                    run[3].append(minute_rows[row, run_start:run_stop].copy())
+                if run_stop == len(block_dates):
+                    still_open[row] = run
+                else:
+                    finished.append(run)
+            # runs that ended exactly at the block boundary
+            finished.extend(open_runs.values())
+            open_runs = still_open
+    finished.extend(open_runs.values())
+    finished.sort(key=lambda run: run[:2])
+
+    intervals = []
+    for run_start, row, parts, minute_parts in finished:
+        planet, natal, aspect = np.unravel_index(row, shape)
+        intervals.append(TransitInterval(
+            transiting_planets[planet], natal_names[natal], selected_aspects[aspect],
+            dates[run_start], np.concatenate(parts),
+            np.concatenate(minute_parts) if minute_parts else None
+        ))
+    return intervals
+
+def intervals_from_transits(transits):
+    """
+    Group daily transit records (any engine's output) into intervals.
+    """
+    runs = {}
+    intervals = []
+    for t in sorted(transits, key=lambda t: t['date']):
+        key = (t['transiting_planet'], t['natal_planet'], t['aspect'])
+        run = runs.get(key)
+        if run is not None and run[0] + timedelta(days=len(run[1])) == t['date']:
+            run[1].append(t['intensity'])
+            continue
+        run = runs[key] = (t['date'], [t['intensity']])
+        intervals.append((key, run))
+
+    return [
+        TransitInterval(key[0], key[1], key[2], start, np.array(values, dtype=np.float64))
+        for key, (start, values) in intervals
+    ]
+
+def expand_intervals(intervals):
+    """
+    Daily transit records for a list of intervals, sorted by date (within a
+    day, in interval order).
+    """
+    transits = []
+    for interval in intervals:
+        transits.extend(interval.transits())
+    transits.sort(key=lambda t: t['date'])
+    return transits
+
+def serialize_interval(interval):
+    """
+    JSON-ready interval: dates as text, samples rounded like serialize_transit.
+    Adaptive intervals also carry the peak's time of day and every sample's
+    minutes after 00:00 UT (None where there is no time of day).
+    """
+    serialized = {
+        "transiting_planet": interval.transiting_planet,
+        "natal_planet": interval.natal_planet,
+        "aspect": interval.aspect,
+        "start": interval.start.strftime("%Y-%m-%d"),
+        "end": interval.end.strftime("%Y-%m-%d"),
+        "peak": interval.peak.strftime("%Y-%m-%d"),
+        "peak_intensity": round(interval.peak_intensity, 3),
+        "intensities": [round(value, 3) for value in interval.intensities.tolist()],
+    }
+    if interval.minutes is not None:
+        serialized["peak_time"] = interval.peak_time
+        serialized["minutes"] = [None if m == transit_waveforms.NO_TIME else m
+                                 for m in interval.minutes.tolist()]
+    return serialized
+
+def build_interval_columns(intervals, start_date, end_date):
+    """
+    Compact form of a list of intervals, laid out like
+    transit_waveforms.build_waveform_columns:
+
+    - "dates": the shared daily axis as start + step + count
+    - "series": one entry per label
+    - "intervals": parallel arrays (series index, start day index, length,
+      peak day within the interval) plus every interval's samples
+      concatenated, rounded to 3 decimals and sent as base64 little-endian
+      float32 (the peak is taken before rounding)
+    - with adaptive resolution, "minute": the time of day of every sample
+      (minutes after 00:00 UT, -1 for none) as base64 little-endian int16
+
+    templates/index.html draws the figure and writes the analysis text
+    from this (see figureFromIntervalColumns / intervalsText).
+    """
+    day_count = max((end_date - start_date).days + 1, 0)
+
+    series = []
+    series_index = {}
+    labels = []
+    starts = []
+    lengths = []
+    peaks = []
+    for interval in intervals:
+        key = (interval.transiting_planet, interval.aspect, interval.natal_planet)
+        if key not in series_index:
+            series_index[key] = len(series)
+            series.append({
+                "label": interval.label,
+                "transiting_planet": interval.transiting_planet,
+                "aspect": interval.aspect,
+                "natal_planet": interval.natal_planet,
+            })
+        labels.append(series_index[key])
+        starts.append((interval.start - start_date).days)
+        lengths.append(interval.days)
+        peaks.append(int(np.argmax(interval.intensities)))
+
+    samples = (np.round(np.concatenate([i.intensities for i in intervals]), 3)
+               if intervals else np.empty(0))
+
+    columns = {
+        "dates": {
+            "start": start_date.strftime("%Y-%m-%d"),
+            "step_days": 1,
+            "count": day_count,
+        },
+        "series": series,
+        "intervals": {
+            "series": labels,
+            "start": starts,
+            "length": lengths,
+            "peak": peaks,
+            "intensity": base64.b64encode(samples.astype('<f4').tobytes()).decode("ascii"),
+            "encoding": "float32-base64",
+        },
+    }
+    if intervals and intervals[0].minutes is not None:
+        minutes = np.concatenate([i.minutes for i in intervals]).astype('<i2')
+        columns["intervals"]["minute"] = base64.b64encode(minutes.tobytes()).decode("ascii")
+        columns["intervals"]["minute_encoding"] = "int16-base64"
+    return columns
+
+def intervals_text(intervals, start_date=None, end_date=None):
+    """
+    Text for the LLM analysis: one line per interval, grouped under the day
+    it starts ("• Day: YYYY-MM-DD", which chunked_analysis splits on).
+    Intervals cut off by the requested range are marked as such.
+    """
+    lines = ["The following transit periods are provided in the format: "
+             "· TransitingPlanet-Aspect-NatalPlanet from start to end, peak date (peak intensity); "
+             "where intensity is a decimal between 0.000 and 1", ""]
+    current_day = None
+    for interval in intervals:
+        if interval.start != current_day:
+            if current_day is not None:
+                lines.append("")
+            current_day = interval.start
+            lines.append(f"• Day: {interval.start:%Y-%m-%d}")
+        notes = []
+        if start_date is not None and interval.start <= start_date:
+            notes.append("already in orb before the range")
+        if end_date is not None and interval.end >= end_date:
+            notes.append("still in orb after the range")
+        suffix = f" [{'; '.join(notes)}]" if notes else ""
+        peak = f"{interval.peak:%Y-%m-%d}"
+        if interval.peak_time is not None:
+            peak += f" {interval.peak_time} UT"
+        lines.append(f"· {interval.transiting_planet}-{interval.aspect}-{interval.natal_planet} "
+                     f"from {interval.start:%Y-%m-%d} to {interval.end:%Y-%m-%d}, "
+                     f"peak {peak} ({interval.peak_intensity:.3f}){suffix}")
+    return "\n".join(lines) + "\n"
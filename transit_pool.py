@@ -0,0 +1,90 @@
+# transit_pool.py
+#
+# Process-pool backend for long transit ranges. Short jobs stay in-process;
+# long ones are split into date chunks and merged back in order.
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import ephemeris
+import transit_waveforms
+
+# TRANSIT_POOL_SIZE=1 disables the pool entirely
+POOL_SIZE = int(os.getenv("TRANSIT_POOL_SIZE", str(os.cpu_count() or 1)))
+# Never hand a worker less than this many days; below 2x this, run locally
+MIN_CHUNK_DAYS = int(os.getenv("TRANSIT_POOL_MIN_CHUNK_DAYS", "730"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _init_worker():
+    # open the memory-mapped table and load the ephemeris files once per worker
+    ephemeris.get_table()
+    ephemeris.calc_ut(2451545.0, 0)
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=POOL_SIZE,
+                                            initializer=_init_worker)
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def split_date_range(start_date, end_date, chunks, min_chunk_days=MIN_CHUNK_DAYS):
+    """
+    Split [start_date, end_date] into at most `chunks` contiguous,
+    non-overlapping day ranges of at least min_chunk_days each.
+    """
+    day_count = (end_date - start_date).days + 1
+    if day_count <= 0:
+        return []
+    chunks = max(1, min(chunks, day_count // max(min_chunk_days, 1)))
+    size, extra = divmod(day_count, chunks)
+
+    ranges = []
+    chunk_start = start_date
+    for i in range(chunks):
+        days = size + (1 if i < extra else 0)
+        chunk_end = chunk_start + timedelta(days=days - 1)
+        ranges.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+    return ranges
+
+def _run_chunk(args):
+    return transit_waveforms.calculate_transit_waveforms_vectorized(*args)
+
+def calculate_transit_waveforms_parallel(natal_positions, start_date, end_date,
+                                         transiting_planets, selected_aspects,
+                                         pool_size=None, min_chunk_days=None,
+                                         resolution="daily"):
+    """
+    Same result as calculate_transit_waveforms_vectorized, with long ranges
+    spread over the process pool. Chunks are merged in date order.
+    """
+    pool_size = pool_size or POOL_SIZE
+    min_chunk_days = min_chunk_days or MIN_CHUNK_DAYS
+    ranges = split_date_range(start_date, end_date, pool_size * 2, min_chunk_days)
+
+    if pool_size <= 1 or len(ranges) <= 1:
+        return transit_waveforms.calculate_transit_waveforms_vectorized(
+            natal_positions, start_date, end_date,
+            transiting_planets, selected_aspects, resolution
+        )
+
+    jobs = [(natal_positions, chunk_start, chunk_end, transiting_planets, selected_aspects,
+             resolution)
+            for chunk_start, chunk_end in ranges]
+    transits = []
+    # map() yields in submission order, i.e. date order
+    for chunk in get_pool().map(_run_chunk, jobs):
+        transits.extend(chunk)
+    return transits
@@ -1,8 +1,13 @@
 # transit_waveforms.py
 
 import os
-import plotly.graph_objects as go
+import base64
+from itertools import groupby
+import numpy as np
 from datetime import timedelta
+import ephemeris
+import ephemeris_table
+import metrics
 import natal_chart
 
 planets = ["Jupiter", "Mars", "Mercury", "Moon", "Neptune", "Pluto",
@@ -50,42 +55,414 @@ def calculate_transit_waveforms(natal_positions, start_date, end_date,
 
     return transits
 
-def build_waveform_figure_dict(transits, start_date, end_date, template="plotly_dark"):
+def transit_dates(start_date, end_date):
     """
-    Build a Plotly figure dictionary (data + layout)
-    that the frontend can consume to do Plotly.newPlot(...).
+    Every sampled day from start_date to end_date (inclusive), one day apart.
     """
-    # Create a day list
+    if end_date < start_date:
+        return []
     day_count = (end_date - start_date).days + 1
-    dates = [start_date + timedelta(days=i) for i in range(day_count)]
+    return [start_date + timedelta(days=i) for i in range(day_count)]
 
-    # Map "label" -> intensities
-    intensity_map = {}
-    for t in transits:
-        label = f"{t['transiting_planet']} {t['aspect']} {t['natal_planet']}"
-        if label not in intensity_map:
-            intensity_map[label] = [0]*day_count
-        idx = (t['date'] - start_date).days
-        intensity_map[label][idx] = t['intensity']
-
-    fig = go.Figure()
-    for label, intensities in intensity_map.items():
-        fig.add_trace(go.Scatter(
-            x=[d.strftime("%Y-%m-%d") for d in dates],
-            y=intensities,
-            mode='lines',
-            name=label
+def transit_longitudes(dates, transiting_planets):
+    """
+    Ecliptic longitudes of every transiting planet on every date,
+    as a (days x planets) float64 array.
+    """
+    codes = _planet_codes(transiting_planets)
+    jds = [natal_chart.julian_day(date) for date in dates]
+    return ephemeris.longitudes(jds, codes)
+
+def _planet_codes(transiting_planets):
+    codes = []
+    for planet in transiting_planets:
+        if planet not in natal_chart.PLANET_CODES:
+            raise ValueError("Unknown planet: " + planet)
+        codes.append(natal_chart.PLANET_CODES[planet])
+    return codes
+
+def score_transits(longitudes, natal_positions, selected_aspects):
+    """
+    Score a (days x planets) longitude array against every natal position
+    and aspect at once.
+
+    Returns (angle_diff, in_orb, intensity), each shaped
+    (days x planets x natal planets x aspects).
+    """
+    natal = np.array(list(natal_positions.values()), dtype=np.float64)
+    exact = np.array([aspects[a] for a in selected_aspects], dtype=np.float64)
+    orbs = np.array([orb[a] for a in selected_aspects], dtype=np.float64)
+
+    with metrics.stage("aspect_scan"):
+        # Same arithmetic as the scalar loop: fold (T - N - A) mod 360 into [0, 180]
+        angle_diff = np.abs(np.mod(
+            longitudes[:, :, None, None] - natal[None, None, :, None] - exact,
+            360
         ))
+        angle_diff = np.where(angle_diff > 180, 360 - angle_diff, angle_diff)
+
+        in_orb = angle_diff <= orbs
+        intensity = 1 - angle_diff / orbs
+    return angle_diff, in_orb, intensity
+
+# -----------------------------------------------------------
+#   Adaptive resolution
+# -----------------------------------------------------------
+# "daily" samples every body once a day (at 00:00 UT). "adaptive" samples
+# fast bodies more often (hourly for the Moon) and reduces their samples to
+# the same daily axis, keeping the day's best intensity. Bodies too slow to
+# need more than one sample a day keep the exact 00:00 position, so by
+# default adaptive results only add to the daily ones.
+#
+# TRANSIT_MAX_STEP_DAYS > 1 lets the slowest bodies be sampled every few
+# days instead, with the days between Hermite-interpolated from the
+# ephemeris speeds. That saves ephemeris calls but is approximate: with 7
+# days, positions are off by up to about 0.003 degrees and intensities by
+# up to about 5e-4 either way, so a day at the very edge of an orb can
+# drop out (or come in).
+RESOLUTIONS = ("daily", "adaptive")
+
+# fastest geocentric motion of each body, degrees/day
+MAX_DAILY_MOTION = {
+    "Moon": 15.4, "Mercury": 2.2, "Venus": 1.27, "Sun": 1.02, "Mars": 0.8,
+    "Jupiter": 0.25, "Saturn": 0.13, "Uranus": 0.07, "Neptune": 0.04, "Pluto": 0.04
+}
+# samples a body gets while it moves across the narrowest selected orb
+SAMPLES_PER_ORB = int(os.getenv("TRANSIT_SAMPLES_PER_ORB", "8"))
+MAX_STEP_DAYS = int(os.getenv("TRANSIT_MAX_STEP_DAYS", "1"))
+SUB_DAILY_HOURS = (1, 2, 3, 4, 6, 8, 12)
+# time of day of a value that wasn't picked from sub-daily samples
+NO_TIME = -1
+
+def sample_step_hours(planet, selected_aspects, samples_per_orb=None, max_step_days=None):
+    """
+    Longest step (hours) that still moves `planet` less than 1/samples_per_orb
+    of the narrowest orb in `selected_aspects`. Steps under a day divide it
+    evenly; longer steps are whole days, at most max_step_days.
+    """
+    samples_per_orb = samples_per_orb or SAMPLES_PER_ORB
+    max_step_days = max_step_days or MAX_STEP_DAYS
+    narrowest = min((orb[a] for a in selected_aspects), default=min(orb.values()))
+    if planet not in MAX_DAILY_MOTION:
+        raise ValueError("Unknown planet: " + planet)
+    hours = 24 * narrowest / samples_per_orb / MAX_DAILY_MOTION[planet]
+    if hours < 24:
+        return max([h for h in SUB_DAILY_HOURS if h <= hours], default=1)
+    return 24 * max(1, min(max_step_days, int(hours // 24)))
+
+def samples_per_day(transiting_planets, selected_aspects, resolution="daily"):
+    """
+    Ephemeris samples per day summed over the planets (for sizing blocks).
+    """
+    if resolution != "adaptive":
+        return len(transiting_planets)
+    steps = [sample_step_hours(p, selected_aspects) for p in transiting_planets]
+    return sum(24 // step if step < 24 else 1 for step in steps)
+
+def score_transits_adaptive(dates, natal_positions, transiting_planets, selected_aspects,
+                            with_times=False):
+    """
+    Daily (in_orb, intensity), shaped like score_transits' output, from
+    per-planet sampling steps (see sample_step_hours).
+
+    A day is in orb if any of its samples is, with the best intensity among
+    them; the 00:00 sample is always one of them, so adaptive results only
+    add to the daily ones (unless MAX_STEP_DAYS > 1, see above).
+
+    with_times=True adds a third array: minutes after 00:00 UT of the
+    sample that gave each day's intensity, or NO_TIME for bodies sampled
+    once a day or less (their value holds for the day as a whole).
+    """
+    day_count = len(dates)
+    shape = (day_count, len(transiting_planets), len(natal_positions), len(selected_aspects))
+    in_orb = np.empty(shape, dtype=bool)
+    intensity = np.empty(shape, dtype=np.float64)
+    minutes = np.full(shape, NO_TIME, dtype=np.int16) if with_times else None
+
+    groups = {}
+    for i, planet in enumerate(transiting_planets):
+        groups.setdefault(sample_step_hours(planet, selected_aspects), []).append(i)
+
+    for step, idx in groups.items():
+        names = [transiting_planets[i] for i in idx]
+        if step < 24:
+            per_day = 24 // step
+            longitudes = np.empty((day_count, per_day, len(idx)), dtype=np.float64)
+            longitudes[:, 0] = transit_longitudes(dates, names)
+            # the in-between instants stay out of the ephemeris LRU
+            jds = [natal_chart.julian_day(date + timedelta(hours=step * j))
+                   for date in dates for j in range(1, per_day)]
+            longitudes[:, 1:] = ephemeris.longitudes(
+                jds, _planet_codes(names), cached=False
+            ).reshape(day_count, per_day - 1, len(idx))
+            _, hit, value = score_transits(longitudes.reshape(-1, len(idx)),
+                                           natal_positions, selected_aspects)
+            with metrics.stage("aspect_scan"):
+                hit = hit.reshape(day_count, per_day, *hit.shape[1:]).any(axis=1)
+                value = value.reshape(day_count, per_day, *value.shape[1:])
+                if with_times:
+                    minutes[:, idx] = value.argmax(axis=1) * (step * 60)
+                value = value.max(axis=1)
+        elif step == 24:
+            longitudes = transit_longitudes(dates, names)
+            _, hit, value = score_transits(longitudes, natal_positions, selected_aspects)
+        else:
+            step_days = step // 24
+            # samples sit on fixed calendar days, so a range gives the same
+            # values however it is split into blocks or pool chunks
+            lead = dates[0].toordinal() % step_days
+            sample_count = (day_count - 1 + lead + step_days - 1) // step_days + 1
+            jds = [natal_chart.julian_day(dates[0] + timedelta(days=step_days * k - lead))
+                   for k in range(sample_count)]
+            lons, speeds = ephemeris.positions(jds, _planet_codes(names))
+            k, offset = np.divmod(np.arange(day_count) + lead, step_days)
+            k1 = np.minimum(k + 1, sample_count - 1)
+            longitudes, _ = ephemeris_table.hermite(
+                lons[k], speeds[k] * step_days, lons[k1], speeds[k1] * step_days,
+                (offset / step_days)[:, None]
+            )
+            # sampled days keep their exact positions
+            longitudes = np.where((offset == 0)[:, None], lons[k], np.mod(longitudes, 360))
+            _, hit, value = score_transits(longitudes, natal_positions, selected_aspects)
+
+        in_orb[:, idx] = hit
+        intensity[:, idx] = value
+    if with_times:
+        return in_orb, intensity, minutes
+    return in_orb, intensity
+
+def daily_scores(dates, natal_positions, transiting_planets, selected_aspects,
+                 resolution="daily", with_times=False):
+    """
+    (in_orb, intensity) per day, (days x planets x natal planets x aspects),
+    at the given resolution ("daily" or "adaptive").
+
+    with_times=True adds the minutes array of score_transits_adaptive, or
+    None for "daily" (every value is at 00:00).
+    """
+    if resolution == "adaptive":
+        return score_transits_adaptive(dates, natal_positions,
+                                       transiting_planets, selected_aspects, with_times)
+    if resolution != "daily":
+        raise ValueError(f"Unknown resolution: '{resolution}'")
+    longitudes = transit_longitudes(dates, transiting_planets)
+    _, in_orb, intensity = score_transits(longitudes, natal_positions, selected_aspects)
+    if with_times:
+        return in_orb, intensity, None
+    return in_orb, intensity
+
+def calculate_transit_waveforms_vectorized(natal_positions, start_date, end_date,
+                                           transiting_planets, selected_aspects,
+                                           resolution="daily"):
+    """
+    NumPy-backed equivalent of calculate_transit_waveforms.
+
+    1) One ephemeris pass fills a (days x planets) longitude array
+    2) All natal pairs and aspects are scored with array operations
+    3) Hits are emitted in the same (date, planet, natal, aspect) order
+       with the same intensities as the day-by-day loop
+
+    resolution="adaptive" samples fast bodies more often (see
+    score_transits_adaptive); the output is still one record per day.
+    """
+    dates = transit_dates(start_date, end_date)
+    if not dates or not transiting_planets or not natal_positions or not selected_aspects:
+        return []
+
+    in_orb, intensity = daily_scores(dates, natal_positions, transiting_planets,
+                                     selected_aspects, resolution)
+
+    natal_names = list(natal_positions.keys())
+    day_idx, planet_idx, natal_idx, aspect_idx = np.nonzero(in_orb)
+    hit_intensities = intensity[day_idx, planet_idx, natal_idx, aspect_idx]
+
+    return [
+        {
+            'date': dates[d],
+            'transiting_planet': transiting_planets[p],
+            'natal_planet': natal_names[n],
+            'aspect': selected_aspects[a],
+            'intensity': float(value),
+        }
+        for d, p, n, a, value in zip(day_idx.tolist(), planet_idx.tolist(),
+                                     natal_idx.tolist(), aspect_idx.tolist(),
+                                     hit_intensities.tolist())
+    ]
+
+def _month_ranges(start_date, end_date):
+    # consecutive [first, last] ranges split at calendar month boundaries
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        if chunk_start.month == 12:
+            next_month = chunk_start.replace(year=chunk_start.year + 1, month=1, day=1)
+        else:
+            next_month = chunk_start.replace(month=chunk_start.month + 1, day=1)
+        chunk_end = min(next_month - timedelta(days=1), end_date)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end + timedelta(days=1)
+
+def iter_transit_waveforms(natal_positions, start_date, end_date,
+                           transiting_planets, selected_aspects, period="month",
+                           resolution="daily"):
+    """
+    Generator version of calculate_transit_waveforms_vectorized.
+
+    Works one calendar month at a time and yields (period_start, transits)
+    per month, or per day with period="day" (days without transits are
+    skipped). Memory stays flat however long the range is.
+    """
+    if period not in ("day", "month"):
+        raise ValueError(f"Unknown period: '{period}'")
+
+    for chunk_start, chunk_end in _month_ranges(start_date, end_date):
+        transits = calculate_transit_waveforms_vectorized(
+            natal_positions, chunk_start, chunk_end,
+            transiting_planets, selected_aspects, resolution
+        )
+        if period == "month":
+            yield chunk_start, transits
+        else:
+            for day, day_transits in groupby(transits, key=lambda t: t['date']):
+                yield day, list(day_transits)
+
+# Upper bound on (charts x days x planets x natal x aspects) cells scored at
+# once by the bulk scan; each cell costs a few float64 temporaries
+BULK_BLOCK_CELLS = int(os.getenv("TRANSIT_BULK_BLOCK_CELLS", "1000000"))
+
+def score_transits_bulk(longitudes, natal_matrix, selected_aspects, natal_mask=None):
+    """
+    score_transits for many charts at once: a (days x planets) longitude
+    array against a (charts x natal planets) matrix. Cells where natal_mask
+    is False (padding for charts with fewer planets) never match.
+
+    Returns (angle_diff, in_orb), each shaped
+    (charts x days x planets x natal planets x aspects); intensities are
+    left to the caller so they're only computed for hits.
+    """
+    exact = np.array([aspects[a] for a in selected_aspects], dtype=np.float64)
+    orbs = np.array([orb[a] for a in selected_aspects], dtype=np.float64)
+
+    with metrics.stage("aspect_scan"):
+        # Same values as score_transits, computed in place: np.mod by a
+        # positive number is already >= 0, and min(d, 360 - d) is the fold
+        angle_diff = longitudes[None, :, :, None, None] - natal_matrix[:, None, None, :, None] - exact
+        np.mod(angle_diff, 360, out=angle_diff)
+        np.minimum(angle_diff, 360 - angle_diff, out=angle_diff)
+        in_orb = angle_diff <= orbs
+        if natal_mask is not None:
+            in_orb &= natal_mask[:, None, None, :, None]
+    return angle_diff, in_orb
+
+def iter_transit_waveforms_bulk(natal_charts, start_date, end_date,
+                                transiting_planets, selected_aspects,
+                                block_cells=None):
+    """
+    Run one date window against many natal charts ({planet: degrees} dicts).
+
+    1) One ephemeris pass for the window, shared by every chart
+    2) Charts are scored in blocks sized to about block_cells cells
+    3) Yields (chart index, transits) in input order; each list is exactly
+       what calculate_transit_waveforms_vectorized returns for that chart
+    """
+    dates = transit_dates(start_date, end_date)
+    if not natal_charts:
+        return
+    if not dates or not transiting_planets or not selected_aspects:
+        for index in range(len(natal_charts)):
+            yield index, []
+        return
+
+    longitudes = transit_longitudes(dates, transiting_planets)
+
+    # column j of row c is chart c's j-th natal planet; shorter charts are
+    # padded with masked-out zeros (NaN padding would slow every operation)
+    natal_names = [list(chart.keys()) for chart in natal_charts]
+    width = max(len(names) for names in natal_names) or 1
+    natal_matrix = np.zeros((len(natal_charts), width))
+    natal_mask = np.zeros((len(natal_charts), width), dtype=bool)
+    for c, chart in enumerate(natal_charts):
+        natal_matrix[c, :len(chart)] = list(chart.values())
+        natal_mask[c, :len(chart)] = True
+    if natal_mask.all():
+        natal_mask = None
+
+    orbs = np.array([orb[a] for a in selected_aspects], dtype=np.float64)
+    cells_per_chart = len(dates) * len(transiting_planets) * width * len(selected_aspects)
+    block = max(1, (block_cells or BULK_BLOCK_CELLS) // cells_per_chart)
+
+    for block_start in range(0, len(natal_charts), block):
+        block_end = min(block_start + block, len(natal_charts))
+        angle_diff, in_orb = score_transits_bulk(
+            longitudes, natal_matrix[block_start:block_end], selected_aspects,
+            None if natal_mask is None else natal_mask[block_start:block_end]
+        )
+        chart_idx, day_idx, planet_idx, natal_idx, aspect_idx = np.nonzero(in_orb)
+        hit_intensities = 1 - angle_diff[chart_idx, day_idx, planet_idx, natal_idx, aspect_idx] / orbs[aspect_idx]
+
+        # hits come out sorted by chart; split them at chart boundaries
+        bounds = np.searchsorted(chart_idx, np.arange(block_end - block_start + 1))
+        for c in range(block_end - block_start):
+            lo, hi = bounds[c], bounds[c + 1]
+            names = natal_names[block_start + c]
+            yield block_start + c, [
+                {
+                    'date': dates[d],
+                    'transiting_planet': transiting_planets[p],
+                    'natal_planet': names[n],
+                    'aspect': selected_aspects[a],
+                    'intensity': float(value),
+                }
+                for d, p, n, a, value in zip(day_idx[lo:hi].tolist(), planet_idx[lo:hi].tolist(),
+                                             natal_idx[lo:hi].tolist(), aspect_idx[lo:hi].tolist(),
+                                             hit_intensities[lo:hi].tolist())
+            ]
+
+def build_waveform_columns(transits, start_date, end_date):
+    """
+    Compact, columnar alternative to figures.waveform_figure plus the
+    per-transit list:
+
+    - "dates": one shared axis as start + step + count
+    - "series": one entry per label (no per-day values)
+    - "transits": parallel arrays (day index, series index, intensity as
+      base64 little-endian float32), which double as the sparse data of
+      every series: days not listed are 0
+
+    templates/index.html rebuilds the Plotly traces and transit records
+    from this (see figureFromColumns / transitsFromColumns).
+    """
+    day_count = max((end_date - start_date).days + 1, 0)
+
+    series = []
+    series_index = {}
+    days = []
+    labels = []
+    for t in transits:
+        key = (t['transiting_planet'], t['aspect'], t['natal_planet'])
+        if key not in series_index:
+            series_index[key] = len(series)
+            series.append({
+                "label": f"{t['transiting_planet']} {t['aspect']} {t['natal_planet']}",
+                "transiting_planet": t['transiting_planet'],
+                "aspect": t['aspect'],
+                "natal_planet": t['natal_planet'],
+            })
+        days.append((t['date'] - start_date).days)
+        labels.append(series_index[key])
 
-    fig.update_layout(
-        title='Interactive Transit Waveforms',
-        xaxis_title='Date',
-        yaxis_title='Intensity',
-        hovermode='x',
-        template=template
-    )
+    intensities = np.array([t['intensity'] for t in transits], dtype='<f4')
 
     return {
-        "data": [trace.to_plotly_json() for trace in fig.data],
-        "layout": fig.layout.to_plotly_json()
+        "dates": {
+            "start": start_date.strftime("%Y-%m-%d"),
+            "step_days": 1,
+            "count": day_count,
+        },
+        "series": series,
+        "transits": {
+            "day": days,
+            "series": labels,
+            "intensity": base64.b64encode(intensities.tobytes()).decode("ascii"),
+            "encoding": "float32-base64",
+        },
     }